@@ -0,0 +1,113 @@
+"""Audit log replay for TaskFlow Manager.
+
+Rebuilds task state as of any moment from the append-only audit log, using
+the same storage backend as the app (TASKFLOW_STORAGE_BACKEND /
+TASKFLOW_SQLITE_PATH or secrets). Only the day segments in range are read.
+Tasks that existed before the log was kept come from a JSONL task export
+(--baseline) taken at --since; the log is replayed on top of it. Tasks the
+log only has changes for, not their creation, are left out of the output.
+
+    python audit_replay.py --until 2026-03-01T00:00:00Z --out tasks-march.jsonl
+    python audit_replay.py --baseline export.jsonl --since 2026-01-01T00:00:00Z --until 2026-02-01T00:00:00Z
+    python audit_replay.py --task 3f2a... --since 2026-01-01
+    python audit_replay.py --follow
+    python audit_replay.py --follow --baseline export.jsonl --since 2026-01-01T00:00:00Z
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timezone
+
+from streamlit_task_manager import (AUDIT_TIMESTAMP_FORMAT, Task, audit_feed_changes, audit_record, audit_state_tasks,
+                                    create_storage_backend, json_default, new_audit_state, replay_audit_records)
+
+FOLLOW_INTERVAL_SECONDS = 2
+
+def audit_bound(value):
+    """Accepts a date or an ISO timestamp (naive means UTC) and returns it in the log's timestamp format."""
+    if value is None:
+        return None
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).strftime(AUDIT_TIMESTAMP_FORMAT)
+
+def load_baseline(path):
+    """Replay state holding the tasks of a JSONL task export."""
+    state = new_audit_state()
+    with open(path, encoding='utf-8') as fp:
+        for line in fp:
+            if line.strip():
+                task = Task.from_dict(json.loads(line))
+                state['tasks'][task.id] = audit_record('put', task.id, None, after=task)['changes']
+    return state
+
+def write_lines(records, out):
+    for record in records:
+        out.write(json.dumps(record, default=json_default) + "\n")
+    out.flush()
+
+def audit_record_key(record):
+    return record['ts'], record['task_id'], record['op']
+
+def follow(storage, state, since, out):
+    """Tails the log in append order: prints each new record, then the task it leaves behind (or a removal).
+
+    Only tasks whose full state is known are printed: those in `state` (a
+    baseline) and those created while following. With `since`, the log from
+    then on is replayed into `state` first.
+    """
+    after_seq = storage.last_audit_sequence()
+    caught_up = set()
+    if since:
+        # Records appended meanwhile come through the feed as well; they're only applied once
+        records = list(storage.read_audit_records(since))
+        replay_audit_records(records, state)
+        caught_up = {audit_record_key(r) for r in records}
+    while True:
+        page = storage.read_audit_feed(after_seq)
+        if page:
+            records = [record for _, record in page if audit_record_key(record) not in caught_up]
+            upserts, removed_ids = audit_feed_changes(records, state)
+            write_lines(records, out)
+            write_lines([{'task': t.to_dict()} for t in upserts] + [{'removed': i} for i in removed_ids], out)
+            after_seq = page[-1][0]
+        else:
+            time.sleep(FOLLOW_INTERVAL_SECONDS)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--since', help="replay records after this date/timestamp (the --baseline's export time)")
+    parser.add_argument('--until', help="replay records up to and including this date/timestamp (default: now)")
+    parser.add_argument('--baseline', help="JSONL task export to start from")
+    parser.add_argument('--task', help="print this task's records instead of the rebuilt state")
+    parser.add_argument('--archived', action='store_true', help="output archived tasks instead of active ones")
+    parser.add_argument('--follow', action='store_true', help="tail the log from now (or --since) as a change feed")
+    parser.add_argument('--out', default='-', help="JSON lines output ('-' for stdout)")
+    args = parser.parse_args()
+
+    storage = create_storage_backend()
+    since, until = audit_bound(args.since), audit_bound(args.until)
+    out = sys.stdout if args.out == '-' else open(args.out, 'w', encoding='utf-8')
+    try:
+        state = load_baseline(args.baseline) if args.baseline else new_audit_state()
+        if args.follow:
+            follow(storage, state, since, out)
+        elif args.task:
+            write_lines((r for r in storage.read_audit_records(since, until) if r['task_id'] == args.task), out)
+        else:
+            state = replay_audit_records(storage.read_audit_records(since, until), state)
+            tasks = audit_state_tasks(state['archived' if args.archived else 'tasks'], state['partial'])
+            write_lines((t.to_dict() for t in sorted(tasks, key=lambda t: t.id)), out)
+            if state['partial']:
+                print(f"Left out {len(state['partial'])} task(s) created before the replayed range; pass a --baseline export.",
+                      file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
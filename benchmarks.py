@@ -0,0 +1,1115 @@
+"""Benchmark and load-test suite for TaskFlow Manager hot paths.
+
+Run with `python benchmarks.py`. Correctness checks run first: each fast path
+is compared against the reference implementation it replaced. Then every hot
+path is timed over synthetic task sets of increasing size. Pass `--json FILE`
+to append one JSON line per run, so results can be tracked across commits.
+
+    python benchmarks.py --sizes 100,1000,10000 --json bench_results.jsonl
+"""
+import argparse
+import calendar
+import contextlib
+import importlib.util
+import io
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone
+
+from reminder_worker import SEND_MAX_ATTEMPTS, OccurrenceHeap, ReminderSink, ReminderWorker
+from streamlit_task_manager import (
+    ARCHIVED_DISPLAY_LIMIT, MOCK_ACCOUNTS, MOCK_CAMPAIGNS, PRIORITY_LEVELS, SIMPLIFIED_USER_CREDENTIALS, TASK_TYPES,
+    WRITE_BEHIND_SHUTDOWN_TIMEOUT_SECONDS, WRITE_BEHIND_WINDOW_SECONDS,
+    AuditLog, FirestoreBackend, SharedDataCache, SQLiteBackend, Task, TaskQuery, TaskStore, WriteBehindQueue,
+    BOOTSTRAP_WORKERS, IMPORT_CHUNK_SIZE, LOGIN_REFRESH_INTERVAL_SECONDS, audit_feed_changes, import_tasks, json_default, audit_records_for_writes, new_audit_state, audit_state_tasks, audit_timestamp, replay_audit_records, restore_tasks, apply_task_query, archive_rule, archive_tasks, build_dashboard_sections, find_archive_candidates, is_archivable, build_occurrence_index, build_task_frame, build_workload_report,
+    expand_occurrences, get_next_occurrence, render_calendar_html, is_occurrence_completed, is_task_due, search_terms, with_occurrence_completed,
+)
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+APPTEST_SIZES = [100, 1000, 10000]
+TODAY = date(2025, 6, 15)
+HAS_PANDAS = importlib.util.find_spec('numpy') is not None and importlib.util.find_spec('pandas') is not None
+
+# --- REFERENCE IMPLEMENTATIONS ---
+
+def legacy_get_next_occurrence(task, reference_date, days_limit=365):
+    """The original day-by-day scan, kept as the oracle for the closed-form engine."""
+    next_date = reference_date
+    end_date = reference_date + timedelta(days=days_limit)
+    while next_date < end_date:
+        if is_task_due(task, next_date):
+            return next_date
+        next_date += timedelta(days=1)
+    return None
+
+# --- SYNTHETIC DATA ---
+
+def random_date(rng, around=date(2025, 1, 1), spread_days=3 * 365):
+    return around + timedelta(days=rng.randint(-spread_days, spread_days))
+
+def random_task(rng, i):
+    """A task with every field drawn from the app's own option lists."""
+    return Task(
+        f'task_{i}', f'Task {i} {rng.choice(["report", "review", "launch", "sync", "audit"])}',
+        description=f'Synthetic task {i}', due_date=random_date(rng), type=rng.choice(TASK_TYPES),
+        owner_id=rng.choice(list(SIMPLIFIED_USER_CREDENTIALS)), is_completed=rng.random() < 0.2,
+        account=rng.choice(MOCK_ACCOUNTS), campaign=rng.choice(MOCK_CAMPAIGNS), priority=rng.choice(PRIORITY_LEVELS),
+    )
+
+def make_tasks(count, seed=0):
+    rng = random.Random(seed)
+    return [random_task(rng, i) for i in range(count)]
+
+def month_grid(year, month):
+    return [d for week in calendar.Calendar(firstweekday=calendar.MONDAY).monthdatescalendar(year, month) for d in week]
+
+# --- IN-MEMORY FIRESTORE FAKE ---
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db, self.path, self.id = db, path, path.rsplit('/', 1)[-1]
+
+    def get(self):
+        return FakeSnapshot(self.id, self.db.docs.get(self.path))
+
+    def collection(self, name):
+        return FakeCollection(self.db, f"{self.path}/{name}")
+
+    def set(self, data, merge=False):
+        self.db.docs[self.path] = {**self.db.docs.get(self.path, {}), **data} if merge else data
+        self.db.writes += 1
+
+    def delete(self):
+        self.db.docs.pop(self.path, None)
+        self.db.writes += 1
+
+    def on_snapshot(self, callback):
+        return None
+
+FAKE_FILTER_OPS = {'>': lambda a, b: a > b, '>=': lambda a, b: a >= b, '<': lambda a, b: a < b,
+                   '<=': lambda a, b: a <= b, '==': lambda a, b: a == b, 'in': lambda a, b: a in b}
+
+class FakeQuery:
+    """where(filter=FieldFilter) / order_by / start_after / limit over the documents a collection (or collection group) holds.
+    Ties in the order fall back to the document id, in the same direction, as in Firestore."""
+
+    def __init__(self, db, matches, filters=(), order=None, count=None, descending=False, after=None):
+        self.db, self.matches, self.filters, self.order, self.count = db, matches, filters, order, count
+        self.descending, self.after = descending, after
+
+    def refine(self, **changes):
+        query = FakeQuery(self.db, self.matches, self.filters, self.order, self.count, self.descending, self.after)
+        query.__dict__.update(changes)
+        return query
+
+    def where(self, filter):
+        return self.refine(filters=self.filters + ((filter.field_path, filter.op_string, filter.value),))
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self.refine(order=field, descending=direction == 'DESCENDING')
+
+    def start_after(self, snapshot):
+        return self.refine(after=snapshot)
+
+    def limit(self, count):
+        return self.refine(count=count)
+
+    def sort_key(self, snap):
+        value = snap.to_dict()[self.order]
+        return (value is not None, value, snap.id)
+
+    def stream(self):
+        snapshots = [FakeSnapshot(path.rsplit('/', 1)[-1], data) for path, data in self.db.docs.items() if self.matches(path)
+                     and all(field in data and FAKE_FILTER_OPS[op](data[field], value) for field, op, value in self.filters)]
+        if self.order:
+            snapshots.sort(key=self.sort_key, reverse=self.descending)
+            if self.after is not None:
+                cursor = self.sort_key(self.after)
+                snapshots = [snap for snap in snapshots if (self.sort_key(snap) < cursor if self.descending else self.sort_key(snap) > cursor)]
+        return snapshots[:self.count] if self.count is not None else snapshots
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, name):
+        self.name = name
+        prefix = name + '/'
+        super().__init__(db, lambda path: path.startswith(prefix) and '/' not in path[len(prefix):])
+
+    def document(self, doc_id):
+        return FakeDocument(self.db, f"{self.name}/{doc_id}")
+
+    def on_snapshot(self, callback):
+        return None
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db, self.operations = db, []
+
+    def set(self, doc_ref, data, merge=False):
+        self.operations.append((doc_ref.set, (data, merge)))
+
+    def delete(self, doc_ref):
+        self.operations.append((doc_ref.delete, ()))
+
+    def commit(self):
+        for operation, args in self.operations:
+            operation(*args)
+        self.db.commits += 1
+
+class InMemoryFirestore:
+    """Just enough of the google-cloud-firestore client surface for FirestoreBackend."""
+
+    def __init__(self):
+        self.docs = {}
+        self.writes = 0
+        self.commits = 0
+
+    def document(self, path):
+        return FakeDocument(self, path)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def collection_group(self, name):
+        return FakeQuery(self, lambda path: path.rsplit('/', 2)[-2] == name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, doc_refs):
+        return [doc_ref.get() for doc_ref in doc_refs]
+
+class FakeTransaction:
+    """Reads and writes straight through; the fake has a single client, so nothing ever contends."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def get_all(self, doc_refs):
+        return self.db.get_all(doc_refs)
+
+    def set(self, doc_ref, data, merge=False):
+        doc_ref.set(data, merge)
+
+    def delete(self, doc_ref):
+        doc_ref.delete()
+
+FakeFieldFilter = namedtuple('FakeFieldFilter', ['field_path', 'op_string', 'value'])
+
+class InMemoryFirestoreBackend(FirestoreBackend):
+    """FirestoreBackend over InMemoryFirestore. Filters and transactions are built without the client library,
+    so the checks run without firebase-admin installed."""
+
+    def __init__(self):
+        super().__init__(InMemoryFirestore())
+
+    @staticmethod
+    def field_filter(field, op, value):
+        return FakeFieldFilter(field, op, value)
+
+    def run_transaction(self, func):
+        return func(FakeTransaction(self.db))
+
+class LatencyStorage:
+    """Wraps a backend so every call waits `latency` seconds first, like a Firestore round trip."""
+
+    def __init__(self, backend, latency):
+        self.backend, self.latency = backend, latency
+        self.name = backend.name
+
+    def __getattr__(self, attr):
+        method = getattr(self.backend, attr)
+        if not callable(method):
+            return method
+        def delayed(*args, **kwargs):
+            time.sleep(self.latency)
+            return method(*args, **kwargs)
+        return delayed
+
+# --- CORRECTNESS CHECKS ---
+
+def check_recurrence_equivalence(samples=20000, seed=1):
+    """Randomised property check: closed-form and scanning engines agree everywhere."""
+    rng = random.Random(seed)
+    for i in range(samples):
+        task = random_task(rng, i)
+        reference = random_date(rng)
+        days_limit = rng.choice([1, 7, 14, 31, 60, 365])
+        expected = legacy_get_next_occurrence(task, reference, days_limit)
+        actual = get_next_occurrence(task, reference, days_limit)
+        if actual != expected:
+            raise AssertionError(f"next occurrence of {task!r} from {reference} within {days_limit} days: "
+                                 f"expected {expected}, got {actual}")
+    print(f"recurrence equivalence: {samples} random cases OK")
+
+def check_occurrence_index_equivalence(task_count=2000, seed=3):
+    tasks = make_tasks(task_count, seed)
+    for year, month in [(2024, 2), (2025, 1), (2025, 4), (2026, 12)]:
+        grid = month_grid(year, month)
+        index = build_occurrence_index(tasks, grid[0], grid[-1] + timedelta(days=1))
+        for day in grid:
+            assert index.get(day, []) == [t for t in tasks if is_task_due(t, day)], day
+    print(f"occurrence index equivalence: {task_count} tasks x 4 months OK")
+
+def check_calendar_html(task_count=2000, seed=13):
+    """The calendar grid has one cell per day and never lets a task title inject markup."""
+    tasks = make_tasks(task_count, seed)
+    tasks[0] = tasks[0].replace(title='<script>alert("x")</script> & \'quotes\'', due_date=TODAY, type='daily', is_completed=False)
+    days = month_grid(TODAY.year, TODAY.month)
+    grid = [days[i:i + 7] for i in range(0, len(days), 7)]
+    index = build_occurrence_index(tasks, grid[0][0], grid[-1][-1] + timedelta(days=1))
+    rendered = render_calendar_html(grid, TODAY.month, TODAY, index, {'bob': 'B'})
+    assert rendered.count('class="tf-day') == sum(len(week) for week in grid)
+    assert '<script>' not in rendered and '&lt;script&gt;' in rendered
+    print(f"calendar html: {len(grid)} weeks rendered and escaped OK")
+
+def check_workload_equivalence(task_count=2000, seed=7):
+    """The vectorized occurrence expansion matches build_occurrence_index, minus finished series and done occurrences."""
+    if not HAS_PANDAS:
+        print("workload equivalence: skipped, numpy/pandas not installed")
+        return
+    rng = random.Random(seed)
+    tasks = make_tasks(task_count, seed)
+    # Mark a sample of recurring occurrences done so the completion bitmaps are exercised
+    for i, task in enumerate(tasks):
+        if task.type != 'one-time' and not task.is_completed and rng.random() < 0.3:
+            for day in build_occurrence_index([task], TODAY - timedelta(days=40), TODAY + timedelta(days=40)):
+                if rng.random() < 0.5:
+                    task = with_occurrence_completed(task, day, True)
+            tasks[i] = task
+    frame, with_completions = build_task_frame(tasks)
+    for window_start, days in [(TODAY, 14), (TODAY - timedelta(days=30), 90), (date(2024, 1, 29), 35)]:
+        window_end = window_start + timedelta(days=days)
+        index = build_occurrence_index([t for t in tasks if not t.is_completed], window_start, window_end)
+        expected = sorted((day, t.owner_id, t.account, t.campaign, t.priority)
+                          for day, due in index.items() for t in due if not is_occurrence_completed(t, day))
+        occurrences = expand_occurrences(frame, with_completions, window_start, window_end)
+        actual = sorted(zip(occurrences['day'].dt.date, *(occurrences[c].astype(object) for c in ['owner_id', 'account', 'campaign', 'priority'])))
+        assert actual == expected, (window_start, days, len(actual), len(expected))
+    print(f"workload equivalence: {task_count} tasks x 3 windows OK")
+
+def scan_search(tasks, text):
+    """The reference search: every task whose title or description has, for each query word, a word starting with it."""
+    words = search_terms(text)
+    return [t for t in tasks if all(any(term.startswith(w) for term in search_terms(t.title) | search_terms(t.description)) for w in words)]
+
+def check_search_equivalence(task_count=2000, searches=200, seed=9):
+    """The incrementally maintained text index and its facet counts match a full scan, across edits and deletes."""
+    rng = random.Random(seed)
+    tasks = make_tasks(task_count, seed)
+    store = TaskStore(tasks)
+    vocabulary = ['task', 'rep', 'review', 'la', 'sync', 'audit', 'synthetic', '1', '12', 'q3', 'xyz']
+    for i in range(searches):
+        # Edit, add and delete between searches so the index is exercised incrementally
+        victim = rng.choice(tasks)
+        edited = victim.replace(title=f'{rng.choice(["Q3", "Launch", "Audit"])} {victim.title}')
+        store.upsert(edited)
+        tasks[tasks.index(victim)] = edited
+        if i % 3 == 0:
+            removed = tasks.pop(rng.randrange(len(tasks)))
+            store.remove(removed.id)
+        text = " ".join(rng.sample(vocabulary, rng.randint(1, 2)))
+        expected = scan_search(tasks, text)
+        assert [t.id for t in store.select(text)] == [t.id for t in expected], text
+        counts = store.facet_counts(text)
+        for field in TaskStore.FACET_FIELDS:
+            for value, n in counts[field].items():
+                assert n == sum(1 for t in expected if getattr(t, field) == value), (text, field, value)
+    print(f"search equivalence: {searches} searches over {task_count} edited tasks OK")
+
+def archive_queries():
+    """The archive views' queries: an owner's tasks by due date, and the newest first under filters storage
+    can only partly apply, which Firestore reads a page at a time."""
+    return [
+        TaskQuery(owner_id='bob', order_by='due_date'),
+        TaskQuery(owner_id='bob', accounts=MOCK_ACCOUNTS, campaigns=MOCK_CAMPAIGNS, order_by='due_date', descending=True, limit=20),
+        TaskQuery(accounts=MOCK_ACCOUNTS, campaigns=MOCK_CAMPAIGNS[:1], order_by='due_date', descending=True, limit=50),
+    ]
+
+def check_archive_roundtrip(task_count=2000, seed=11):
+    """Archiving moves exactly the policy's tasks out of the active set, and restoring brings them back unchanged.
+    A candidate edited after it was found, or with a write still queued, stays active."""
+    tasks = make_tasks(task_count, seed)
+    expected = sorted(t.id for t in tasks if is_archivable(t, TODAY, 30, 365))
+    archivable = archive_rule(TODAY, 30, 365)
+    edited = next(t for t in tasks if t.id in expected).replace(due_date=TODAY)
+    stored = {t.id: t for t in tasks} | {edited.id: edited}
+    queue = WriteBehindQueue(FlakyStorage(), window_seconds=0.01)  # Holds its write until the end of the check
+    queued = next(t for t in tasks if t.id in expected and t.id != edited.id)
+    queue.enqueue_save(queued.replace(title='Still syncing'))
+    archived = sorted(set(expected) - {edited.id, queued.id})
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteBackend(os.path.join(tmp, 'archive.db'))
+        backend.save_tasks(tasks)
+        candidates = find_archive_candidates(backend, TODAY, 30, 365)
+        assert sorted(t.id for t in candidates) == expected
+        cache = SharedDataCache(backend)
+        cache.ensure_tasks_loaded(None)
+        backend.save_task(edited)
+        assert archive_tasks(backend, cache, expected, archivable=archivable, write_queue=queue) == len(archived)
+        assert len(backend.load_tasks()) == len(cache.tasks) == task_count - len(archived)
+        assert sorted(t.id for t in backend.query_archived_tasks(TaskQuery())) == archived
+        archived_tasks = [t for t in candidates if t.id in archived]
+        for query in archive_queries():
+            assert backend.query_archived_tasks(query) == apply_task_query(archived_tasks, query), query
+        assert sorted(backend.restore_tasks(expected)) == archived
+        assert sorted(backend.load_tasks(), key=lambda t: t.id) == sorted(stored.values(), key=lambda t: t.id)
+        backend.conn.close()
+    firestore = InMemoryFirestoreBackend()
+    firestore.save_tasks(tasks)
+    firestore.save_task(edited)
+    assert sorted(firestore.archive_tasks(expected, archivable)) == sorted(set(expected) - {edited.id})
+    assert len(firestore.load_tasks()) == task_count - len(expected) + 1
+    archived_tasks = [stored[task_id] for task_id in expected if task_id != edited.id]
+    for query in archive_queries():
+        # The fake stores due dates as datetimes, so compare ids
+        assert [t.id for t in firestore.query_archived_tasks(query)] == [t.id for t in apply_task_query(archived_tasks, query)], query
+    assert sorted(firestore.restore_tasks(expected)) == sorted(set(expected) - {edited.id})
+    assert sorted(firestore.load_tasks(), key=lambda t: t.id) == sorted(stored.values(), key=lambda t: t.id)
+    queue.storage.healthy.set()
+    queue.flush()
+    print(f"archive roundtrip: {len(archived)} of {task_count} tasks archived and restored, edited and queued ones kept OK")
+
+def random_edit(rng, task):
+    """A user-style edit: retitle, tick, reschedule, or add/remove an extra field."""
+    kind = rng.randrange(4)
+    if kind == 0:
+        return task.replace(title=f'{task.title} v{rng.randint(0, 99)}')
+    if kind == 1:
+        return task.replace(is_completed=not task.is_completed)
+    if kind == 2:
+        return task.replace(due_date=random_date(rng))
+    extra = dict(task.extra or {})
+    if 'label' in extra:
+        del extra['label']
+    else:
+        extra['label'] = rng.choice(['red', 'green', 'blue'])
+    return task.replace(extra=extra)
+
+def follow_audit_feed(storage, after_seq, state, page_size=97):
+    """Follows the feed from `after_seq` to its end; returns ({task_id: Task} it emitted and still holds, state)."""
+    emitted = {}
+    while True:
+        page = storage.read_audit_feed(after_seq, page_size)
+        if not page:
+            return emitted, state
+        upserts, removed_ids = audit_feed_changes([record for _, record in page], state)
+        emitted.update((t.id, t) for t in upserts)
+        for task_id in removed_ids:
+            emitted.pop(task_id, None)
+        after_seq = page[-1][0]
+
+def check_audit_replay(task_count=2000, edits=3000, seed=17):
+    """Replaying the audit log rebuilds storage exactly: at the end, at a moment in between, and fed incrementally."""
+    rng = random.Random(seed)
+    tasks = make_tasks(task_count, seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteBackend(os.path.join(tmp, 'audit.db'))
+        applied = []
+        backend.apply_task_writes([('set', t.id, t, None) for t in tasks], applied)
+        # The initial load is spread over three earlier days, so replay crosses day segments
+        start = datetime.now(timezone.utc) - timedelta(days=3)
+        for day, chunk in enumerate([applied[i::3] for i in range(3)]):
+            backend.append_audit_records(audit_records_for_writes(chunk, 'importer', start + timedelta(days=day)))
+        audit_log = AuditLog(backend, flush_records=100, interval=0.01)
+        cache = SharedDataCache(backend)
+        cache.ensure_tasks_loaded(None)
+        midpoint = None
+        for i in range(edits):
+            if i == edits // 2:
+                audit_log.flush()
+                midpoint = (audit_timestamp(), sorted(backend.load_tasks(), key=lambda t: t.id))
+                time.sleep(0.001)
+            task_id = rng.choice(tasks).id
+            base = backend.load_tasks_by_ids([task_id]).get(task_id)
+            if base is None:
+                continue
+            roll = rng.random()
+            if roll < 0.03:
+                archive_tasks(backend, cache, [base.id], actor='admin', audit_log=audit_log)
+                if rng.random() < 0.5:
+                    restore_tasks(backend, cache, [base], actor='admin', audit_log=audit_log)
+                continue
+            applied = []
+            operation = ('delete', base.id, None, None) if roll < 0.05 else ('set', base.id, random_edit(rng, base), base)
+            backend.apply_task_writes([operation], applied)
+            audit_log.record(audit_records_for_writes(applied, 'alice'))
+        assert audit_log.flush()
+
+        records = list(backend.read_audit_records())
+        assert [r['ts'] for r in records] == sorted(r['ts'] for r in records)
+        state = replay_audit_records(records)
+        by_id = lambda t: t.id
+        assert sorted(audit_state_tasks(state['tasks']), key=by_id) == sorted(backend.load_tasks(), key=by_id)
+        assert sorted(audit_state_tasks(state['archived']), key=by_id) == sorted(backend.query_archived_tasks(TaskQuery()), key=by_id)
+        as_of, snapshot = midpoint
+        assert sorted(audit_state_tasks(replay_audit_records(backend.read_audit_records(None, as_of))['tasks']), key=by_id) == snapshot
+        # Range reads split anywhere add up to the whole log
+        split = records[len(records) // 3]['ts']
+        assert list(backend.read_audit_records(None, split)) + list(backend.read_audit_records(split)) == records
+
+        # The change feed pages by append order, and from an empty state emits only tasks it fully knows
+        final = {t.id: t for t in backend.load_tasks()}
+        feed, _ = follow_audit_feed(backend, 0, new_audit_state())
+        assert feed == final
+        mid_seq = backend.read_audit_feed(0, len(records) // 2)[-1][0]
+        feed, feed_state = follow_audit_feed(backend, mid_seq, new_audit_state())
+        created = {r['task_id'] for _, r in backend.read_audit_feed(mid_seq, len(records)) if r.get('full')}
+        assert set(feed) <= created and all(feed[i] == final[i] for i in feed if i in final), sorted(set(feed) - created)
+        assert not feed_state['partial'] & set(feed)
+        # A record stamped before ones already read (another process flushing late) still reaches the feed
+        cursor = backend.last_audit_sequence()
+        applied = []
+        backend.apply_task_writes([('set', 'late_task', Task('late_task', 'Late'), None)], applied)
+        backend.append_audit_records(audit_records_for_writes(applied, 'bob', start))
+        assert [r['task_id'] for _, r in backend.read_audit_feed(cursor)] == ['late_task']
+        backend.conn.close()
+
+    firestore = InMemoryFirestoreBackend()
+    for start_index in range(0, len(records), 1200):  # Several appends, each split into batch documents
+        firestore.append_audit_records(records[start_index:start_index + 1200])
+    assert list(firestore.read_audit_records()) == records
+    assert list(firestore.read_audit_records(None, split)) == [r for r in records if r['ts'] <= split]
+    assert list(firestore.read_audit_records(split)) == [r for r in records if r['ts'] > split]
+    assert sorted(follow_audit_feed(firestore, 0, new_audit_state())[0].values(), key=by_id) == sorted(final.values(), key=by_id)
+    assert firestore.read_audit_feed(firestore.last_audit_sequence()) == []
+    print(f"audit replay: {len(records)} records over {len({r['ts'][:10] for r in records})} days replay to storage OK")
+
+def check_reminder_heap_equivalence(task_count=2000, days=60, seed=15):
+    """Popping a digest heap day by day, with edits and deletes in between, yields exactly the open occurrences is_task_due finds."""
+    rng = random.Random(seed)
+    tasks = {t.id: t for t in make_tasks(task_count, seed)}
+    heap = OccurrenceHeap(lead_days=0, hour=8)
+    start = datetime.combine(TODAY, datetime.min.time())
+    heap.load(tasks.values(), start)
+    for offset in range(days):
+        day = TODAY + timedelta(days=offset)
+        for task in rng.sample(list(tasks.values()), 20):
+            edited = task.replace(due_date=random_date(rng, around=day, spread_days=30), type=rng.choice(TASK_TYPES))
+            tasks[edited.id] = edited
+            heap.upsert(edited, start + timedelta(days=offset))
+        removed = rng.choice(list(tasks))
+        del tasks[removed]
+        heap.remove(removed)
+        due = heap.pop_due(start + timedelta(days=offset, hours=8))
+        expected = sorted(t.id for t in tasks.values() if not t.is_completed and is_task_due(t, day))
+        assert sorted(t.id for t, occurrence in due) == expected and all(o == day for _, o in due), day
+    print(f"reminder heap equivalence: {task_count} tasks x {days} days with edits OK")
+
+class FlakySink(ReminderSink):
+    """Fails the first `failures` sends, like an SMTP server that is down for a while."""
+
+    def __init__(self, failures):
+        self.failures, self.sent = failures, []
+
+    def send(self, username, user, subject, body):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("connection refused")
+        self.sent.append((username, subject))
+
+class CountingFirestoreBackend(InMemoryFirestoreBackend):
+    def __init__(self):
+        super().__init__()
+        self.transactions = 0
+
+    def run_transaction(self, func):
+        self.transactions += 1
+        return super().run_transaction(func)
+
+def check_import_writes(task_count=1200, seed=21):
+    """Imported rows without an id are written in plain batches; only rows naming an existing id need a transaction."""
+    tasks = make_tasks(task_count, seed)
+    existing = tasks[:task_count // 10]
+    storage = CountingFirestoreBackend()
+    storage.save_tasks(existing)
+    lines = [json.dumps({**t.to_dict(), 'title': f'{t.title} (imported)'}, default=json_default) for t in existing]
+    lines += [json.dumps({k: v for k, v in t.to_dict().items() if k != 'id'}, default=json_default) for t in tasks[len(existing):]]
+    categories = {'accounts': MOCK_ACCOUNTS, 'campaigns': MOCK_CAMPAIGNS}
+    result = import_tasks(io.BytesIO("\n".join(lines).encode('utf-8')), 'jsonl', storage, categories, SIMPLIFIED_USER_CREDENTIALS)
+    assert result.imported == task_count and not result.error_count, result
+    stored = storage.load_tasks()
+    assert len(stored) == task_count and all(t.revision >= 1 for t in stored)
+    assert sum(t.title.endswith('(imported)') for t in stored) == len(existing)
+    assert storage.transactions == -(-len(existing) // IMPORT_CHUNK_SIZE), storage.transactions  # Only for chunks naming ids
+    print(f"import writes: {task_count} tasks imported, {storage.transactions} transaction(s) for the {len(existing)} existing ids OK")
+
+class CountingSQLiteBackend(SQLiteBackend):
+    def __init__(self, path):
+        super().__init__(path)
+        self.polls = 0
+
+    def changes_since(self, version):
+        self.polls += 1
+        return super().changes_since(version)
+
+def check_login_refresh(attempts=50):
+    """A run of logins with unknown emails polls storage once per interval, and a user another process adds
+    is found once the interval has passed."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'login.db')
+        storage = CountingSQLiteBackend(path)
+        cache = SharedDataCache(storage)
+        cache.load_users()
+        for _ in range(attempts):
+            cache.refresh_for_login()
+        assert storage.polls == 1, storage.polls
+        other = SQLiteBackend(path)
+        other.save_users({**cache.users, 'dana': {'name': 'Dana', 'email': 'dana@team.com', 'role': 'member', 'pin': '1234'}})
+        other.conn.close()
+        cache.last_login_refresh -= LOGIN_REFRESH_INTERVAL_SECONDS
+        cache.refresh_for_login()
+        assert storage.polls == 2 and cache.find_username('dana@team.com') == 'dana'
+        storage.conn.close()
+    print(f"login refresh: {attempts} unknown-email logins polled storage once OK")
+
+def check_reminder_send_retry(task_count=200, seed=19):
+    """Messages the sink fails to send are retried with backoff until they go out, without run_pending raising."""
+    tasks = [t.replace(due_date=TODAY + timedelta(days=1), type='one-time', is_completed=False) for t in make_tasks(task_count, seed)]
+    owners = {t.owner_id for t in tasks}
+    clock = [datetime.combine(TODAY, datetime.min.time())]
+    sink = FlakySink(failures=len(owners) + 2)
+    worker = ReminderWorker(None, sink, lead_days=1, reminder_hour=9, digest_hour=8, clock=lambda: clock[0])
+    worker.reminders.load(tasks, clock[0])
+    clock[0] += timedelta(hours=9)
+    with contextlib.redirect_stderr(io.StringIO()):  # The worker logs each failure
+        assert worker.run_pending() == 0 and len(worker.retries) == len(owners)
+        for _ in range(SEND_MAX_ATTEMPTS):
+            clock[0] += timedelta(seconds=worker.seconds_until_next())
+            worker.run_pending()
+    assert sorted(username for username, _ in sink.sent) == sorted(owners) and not worker.retries, sink.sent
+    print(f"reminder send retry: {len(owners)} reminders delivered after {len(owners) + 2} sink failures OK")
+
+class FlakyStorage:
+    """Fails every task write until `healthy` is set, like a backend that is unreachable for a while."""
+
+    def __init__(self):
+        self.healthy, self.written = threading.Event(), {}
+
+    def apply_task_writes(self, operations, applied=None):
+        if not self.healthy.is_set():
+            raise OSError("deadline exceeded")
+        for _, task_id, task, _ in operations:
+            self.written[task_id] = task
+        return []
+
+def check_write_behind_retry(task_count=3):
+    """While a failed batch waits to be retried, each task in it counts once as pending, edits made meanwhile
+    included; once storage recovers every write lands."""
+    storage = FlakyStorage()
+    queue = WriteBehindQueue(storage, window_seconds=0.01)
+    tasks = make_tasks(task_count)
+    for task in tasks:
+        queue.enqueue_save(task)
+    deadline = time.perf_counter() + WRITE_BEHIND_SHUTDOWN_TIMEOUT_SECONDS
+    while not queue.last_error:
+        assert time.perf_counter() < deadline, "write never attempted"
+        time.sleep(0.01)
+    queue.enqueue_save(tasks[0].replace(title='Edited while retrying'))
+    for _ in range(20):
+        assert queue.pending_count() == task_count, queue.pending_count()
+        time.sleep(0.005)
+    storage.healthy.set()
+    assert queue.flush() and queue.pending_count() == 0
+    assert storage.written[tasks[0].id].title == 'Edited while retrying' and len(storage.written) == task_count
+    print(f"write-behind retry: {task_count} tasks counted once while retrying, then written OK")
+
+def random_query(rng):
+    order_by = rng.choice([None, 'due_date', 'title'])
+    due_from = random_date(rng) if rng.random() < 0.3 else None
+    return TaskQuery(
+        owner_id=rng.choice([None, 'mustafa', 'bob', 'charlie']),
+        accounts=rng.sample(MOCK_ACCOUNTS, rng.randint(0, len(MOCK_ACCOUNTS))) if rng.random() < 0.5 else None,
+        campaigns=rng.sample(MOCK_CAMPAIGNS, rng.randint(1, len(MOCK_CAMPAIGNS))) if rng.random() < 0.5 else None,
+        completed=rng.choice([None, [False], [True], [False, True]]),
+        due_from=due_from,
+        due_until=due_from + timedelta(days=rng.randint(0, 90)) if due_from and rng.random() < 0.5 else None,
+        order_by=order_by,
+        limit=rng.choice([None, 1, 10, 50]),
+        descending=rng.random() < 0.3,
+    )
+
+def check_query_pushdown_equivalence(task_count=2000, queries=300, seed=5):
+    """SQL pushdown, TaskStore.query and the reference apply_task_query return the same pages."""
+    rng = random.Random(seed)
+    tasks = make_tasks(task_count, seed)
+    store = TaskStore(tasks)
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteBackend(os.path.join(tmp, 'query.db'))
+        backend.save_tasks(tasks)
+        for _ in range(queries):
+            query = random_query(rng)
+            expected = apply_task_query(tasks, query)
+            assert [t.id for t in store.query(query)] == [t.id for t in expected], query
+            actual = backend.query_tasks(query)
+            if not query.order_by and not query.limit:
+                actual, expected = sorted(actual, key=lambda t: t.id), sorted(expected, key=lambda t: t.id)
+            assert actual == expected, query
+            if expected and query.limit:
+                # the next page starts right after the cursor of the last row
+                cursor = (getattr(expected[-1], query.order_by) if query.order_by else None, expected[-1].id)
+                next_page = query._replace(start_after=cursor)
+                assert backend.query_tasks(next_page) == apply_task_query(tasks, next_page), next_page
+        backend.conn.close()
+    print(f"query pushdown equivalence: {queries} random queries over {task_count} tasks OK")
+
+# --- BENCHMARKS ---
+
+class Results:
+    def __init__(self):
+        self.rows = []
+
+    def record(self, name, size, seconds, **extra):
+        self.rows.append({'name': name, 'size': size, 'ms': round(seconds * 1000, 3), **extra})
+        details = "".join(f", {k}={v}" for k, v in extra.items())
+        print(f"  {name:<32} n={size:<7} {seconds * 1000:10.3f} ms{details}")
+
+def best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def bench_recurrence(results, tasks):
+    results.record('get_next_occurrence', len(tasks), best_of(lambda: [get_next_occurrence(t, TODAY) for t in tasks]))
+    results.record('is_task_due', len(tasks), best_of(lambda: [is_task_due(t, TODAY) for t in tasks]))
+    if len(tasks) <= 1000:
+        results.record('legacy_get_next_occurrence', len(tasks), best_of(lambda: [legacy_get_next_occurrence(t, TODAY) for t in tasks], repeat=1))
+
+def bench_dashboard_pipeline(results, tasks):
+    cache = SharedDataCache(storage=None)
+    cache.all_tasks_loaded = True
+    cache.apply_task_changes(tasks)
+    accounts, campaigns = MOCK_ACCOUNTS[:3], MOCK_CAMPAIGNS
+    for sort_by in ['Due Date', 'Priority']:
+        def pipeline():
+            selected = cache.select_tasks(owner_id=['bob'], account=accounts, campaign=campaigns, is_completed=[False, True])
+            return build_dashboard_sections(selected, TODAY, sort_by)
+        results.record(f'dashboard pipeline ({sort_by})', len(tasks), best_of(pipeline))
+    # What query_dashboard does on a rerun whose inputs did not change
+    memoized = lambda: cache.get_derived(('dashboard', 'bob', 'Due Date', TODAY), pipeline)
+    memoized()
+    results.record('dashboard cached rerun', len(tasks), timeit.timeit(memoized, number=1000) / 1000)
+
+def bench_calendar_grid(results, tasks):
+    grid = month_grid(TODAY.year, TODAY.month)
+    window_end = grid[-1] + timedelta(days=1)
+    results.record('calendar occurrence index', len(tasks), best_of(lambda: build_occurrence_index(tasks, grid[0], window_end)))
+    index = build_occurrence_index(tasks, grid[0], window_end)
+    weeks = [grid[i:i + 7] for i in range(0, len(grid), 7)]
+    results.record('calendar html render', len(tasks), best_of(lambda: render_calendar_html(weeks, TODAY.month, TODAY, index, {})))
+    if len(tasks) <= 10000:
+        results.record('calendar per-cell scan', len(tasks), best_of(lambda: {d: [t for t in tasks if is_task_due(t, d)] for d in grid}, repeat=1))
+    cache = SharedDataCache(storage=None)
+    cache.all_tasks_loaded = True
+    cache.apply_task_changes(tasks)
+    memoized = lambda: cache.get_derived(('calendar', grid[0], None), lambda: build_occurrence_index(cache.all_tasks(), grid[0], window_end))
+    memoized()
+    results.record('calendar cached rerun', len(tasks), timeit.timeit(memoized, number=1000) / 1000)
+
+def bench_serialization(results, tasks):
+    db = InMemoryFirestore()
+    backend = FirestoreBackend(db)
+    results.record('save_tasks (Firestore fake)', len(tasks), best_of(lambda: backend.save_tasks(tasks), repeat=1), commits=db.commits)
+    results.record('save_task x1 (Firestore fake)', len(tasks), best_of(lambda: backend.save_task(tasks[0])))
+    results.record('load_tasks (Firestore fake)', len(tasks), best_of(backend.load_tasks, repeat=1))
+
+def bench_query_pushdown(results, tasks):
+    """One owner's filtered dashboard read: filtering in SQL versus loading every row and filtering in Python."""
+    query = TaskQuery(owner_id='bob', accounts=MOCK_ACCOUNTS[:3], completed=[False])
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteBackend(os.path.join(tmp, 'query.db'))
+        backend.save_tasks(tasks)
+        rows = len(backend.query_tasks(query))
+        results.record('query load all + filter (SQLite)', len(tasks), best_of(lambda: apply_task_query(backend.load_tasks(), query)), rows=rows)
+        results.record('query pushdown (SQLite)', len(tasks), best_of(lambda: backend.query_tasks(query)), rows=rows)
+        page = query._replace(order_by='due_date', limit=20)
+        results.record('query page of 20 (SQLite)', len(tasks), best_of(lambda: backend.query_tasks(page)))
+        backend.conn.close()
+
+def bench_analytics(results, tasks):
+    """Workload report over 14 and 90 day horizons, against expanding the same window with the calendar index."""
+    if not HAS_PANDAS:
+        return
+    for days in [14, 90]:
+        upcoming, overdue = build_workload_report(tasks, TODAY, days)
+        results.record(f'workload report ({days}d)', len(tasks), best_of(lambda: build_workload_report(tasks, TODAY, days)),
+                       occurrences=len(upcoming), overdue=len(overdue))
+    if len(tasks) <= 10000:
+        results.record('occurrence index (90d)', len(tasks), best_of(lambda: build_occurrence_index(tasks, TODAY, TODAY + timedelta(days=90)), repeat=1))
+
+def bench_search(results, tasks):
+    """Dashboard search through the text index versus scanning every title and description."""
+    store = TaskStore(tasks)
+    for text in ['rep', 'task 12', 'synthetic audit']:
+        store.select(text)
+        results.record(f'search "{text}"', len(tasks), best_of(lambda: store.select(text)), rows=len(store.select(text)))
+    results.record('facet counts "rep"', len(tasks), best_of(lambda: store.facet_counts('rep')))
+    if len(tasks) <= 10000:
+        results.record('search scan "rep"', len(tasks), best_of(lambda: scan_search(tasks, 'rep'), repeat=1))
+    # Alternate between two titles so every upsert really re-indexes the text
+    edits = itertools.cycle([tasks[0].replace(title='Renamed quarterly report'), tasks[0]])
+    results.record('index update x1', len(tasks), best_of(lambda: store.upsert(next(edits))))
+
+def bench_reminder_heap(results, tasks):
+    """Reminder worker heap: initial build, one incremental task change, and a day's worth of due entries."""
+    start = datetime.combine(TODAY, datetime.min.time())
+    heap = OccurrenceHeap(lead_days=1, hour=9)
+    results.record('reminder heap build', len(tasks), best_of(lambda: heap.load(tasks, start), repeat=1), live=len(heap))
+    edits = itertools.cycle([tasks[0].replace(due_date=TODAY + timedelta(days=3), type='weekly', is_completed=False), tasks[0]])
+    results.record('reminder heap update x1', len(tasks), best_of(lambda: heap.upsert(next(edits), start)))
+    heap.load(tasks, start)
+    results.record('reminder heap pop one day', len(tasks), best_of(lambda: heap.pop_due(start + timedelta(days=1, hours=9)), repeat=1))
+
+def bench_audit_log(results, tasks):
+    """Audit log: batched append, a one-day range read out of three, and replay of the whole log."""
+    start = datetime.now(timezone.utc) - timedelta(days=2)
+    writes = [(t.id, None, t) for t in tasks]
+    records = [r for day in range(3) for r in audit_records_for_writes(writes[day::3], 'bench', start + timedelta(days=day))]
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteBackend(os.path.join(tmp, 'audit.db'))
+        results.record('audit append', len(records), best_of(lambda: backend.append_audit_records(records), repeat=1))
+        day_start, day_end = records[len(records) // 3]['ts'], records[2 * len(records) // 3 - 1]['ts']
+        results.record('audit read one day', len(tasks), best_of(lambda: list(backend.read_audit_records(day_start, day_end)), repeat=1))
+        results.record('audit replay', len(records), best_of(lambda: replay_audit_records(backend.read_audit_records()), repeat=1))
+        backend.conn.close()
+
+def bench_task_memory(results, tasks):
+    """Heap cost of holding tasks as plain dicts versus slotted Task objects."""
+    fields = [t.to_dict() for t in tasks]
+    for label, build in [('dict', lambda: [dict(f) for f in fields]), ('Task', lambda: [Task.from_dict(f) for f in fields])]:
+        tracemalloc.start()
+        held = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.record(f'heap as {label}', len(held), 0, kib=size // 1024, bytes_per_task=size // len(held))
+
+def bench_bootstrap(results, latency=0.05, task_count=1000):
+    """First paint after login: categories, the empty-store probe and one owner's tasks, one after another versus concurrently."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bootstrap.db')
+        seed_sqlite(path, make_tasks(task_count))
+        backend = SQLiteBackend(path)
+        storage = LatencyStorage(backend, latency)
+        for label, workers in [('sequential', 1), ('concurrent', BOOTSTRAP_WORKERS)]:
+            def bootstrap():
+                cache = SharedDataCache(storage)
+                cache.load(owners=('bob',), workers=workers)
+                return cache
+            results.record(f'bootstrap {label} ({latency * 1000:.0f} ms RTT)', task_count, best_of(bootstrap), tasks=len(bootstrap().tasks))
+        backend.conn.close()
+
+# --- STARTUP ---
+
+def profile_imports(module):
+    """Imports `module` in a fresh interpreter under `-X importtime`.
+
+    Returns (total microseconds, [(cumulative microseconds, name)] for its
+    direct imports), or None if the import failed.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        return None
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    # Children are printed before their parent, two spaces deeper
+    end = next(i for i, (_, name) in enumerate(rows) if name.strip() == module)
+    depth = len(rows[end][1]) - len(rows[end][1].lstrip())
+    direct = []
+    for us, name in reversed(rows[:end]):
+        name_depth = len(name) - len(name.lstrip())
+        if name_depth <= depth:
+            break
+        if name_depth == depth + 2:
+            direct.append((us, name.strip()))
+    return rows[end][0], sorted(direct, reverse=True)
+
+def bench_startup(results, top=5):
+    """Cold import cost of the app module, and of the Firebase stack it now defers until first use."""
+    for module, label in [('streamlit_task_manager', 'import app module'), ('firebase_admin.firestore', 'import firebase (deferred)')]:
+        profile = profile_imports(module)
+        if profile is None:
+            print(f"  {label:<32} skipped: {module} not importable")
+            continue
+        total, heaviest = profile
+        results.record(label, 1, total / 1e6)
+        if module == 'streamlit_task_manager':
+            for us, name in heaviest[:top]:
+                print(f"    {name:<30} {us / 1000:10.3f} ms")
+
+# --- END-TO-END ---
+
+def seed_sqlite(path, tasks):
+    backend = SQLiteBackend(path)
+    backend.save_users(SIMPLIFIED_USER_CREDENTIALS)
+    backend.save_categories({'accounts': MOCK_ACCOUNTS, 'campaigns': MOCK_CAMPAIGNS})
+    backend.save_tasks(tasks)
+    backend.conn.close()
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'streamlit_task_manager.py')
+
+def app_exceptions(app):
+    return [str(e.value).splitlines()[0] for e in app.exception]
+
+@contextlib.contextmanager
+def sqlite_app(db_path, **settings):
+    """An AppTest of the app against the SQLite store at `db_path`, with the process-wide caches cleared.
+    `settings` are storage settings (see get_storage_setting), passed through the environment."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    environment = {f'TASKFLOW_{name.upper()}': str(value) for name, value in {'storage_backend': 'sqlite', 'sqlite_path': db_path, **settings}.items()}
+    os.environ.update(environment)
+    st.cache_resource.clear()  # Storage and the shared cache are per process; start from this store
+    try:
+        yield AppTest.from_file(APP_PATH, default_timeout=600)
+    finally:
+        for name in environment:
+            os.environ.pop(name, None)
+
+def sign_in(app, email, pin='1234'):
+    app.run()
+    app.sidebar.text_input[0].input(email)
+    app.sidebar.text_input[1].input(pin)
+    app.sidebar.button[0].click().run()
+    assert not app.exception, app_exceptions(app)
+    assert app.session_state.login_status
+
+def check_apptest_login(db_path=None, email='bob@team.com'):
+    """Signs in through the login form and reruns, against an empty SQLite store unless `db_path` is given.
+    The shared cache is a cached resource, so anything it does to the UI breaks every rerun after the first."""
+    with tempfile.TemporaryDirectory() as tmp, sqlite_app(db_path or os.path.join(tmp, 'empty.db')) as app:
+        sign_in(app, email)
+        app.run()
+        assert not app.exception, app_exceptions(app)
+    print(f"apptest login: {email} signed in and reran on {'a seeded' if db_path else 'an empty'} store OK")
+
+def check_apptest_pin_upgrade():
+    """A store from before PIN hashing (plaintext `pin`s) is upgraded on first login, and the session survives it."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'plaintext.db')
+        seed_sqlite(db_path, make_tasks(100))
+        check_apptest_login(db_path)
+        backend = SQLiteBackend(db_path)
+        users = backend.load_users()
+        backend.conn.close()
+    assert all('pin_hash' in u and 'pin' not in u for u in users.values()), users
+    print(f"apptest PIN upgrade: {len(users)} plaintext PINs hashed on first login OK")
+
+def check_apptest_export(task_count=100):
+    """An admin clicks Download for tasks in both formats and gets every row.
+    AppTest doesn't serve downloads, so the deferred callables are captured as the page registers them."""
+    from streamlit.runtime.media_file_manager import MediaFileManager
+
+    deferred, add_deferred = {}, MediaFileManager.add_deferred
+    def recording_add_deferred(self, data_callable, *args, **kwargs):
+        file_id = add_deferred(self, data_callable, *args, **kwargs)
+        deferred[file_id] = data_callable
+        return file_id
+
+    MediaFileManager.add_deferred = recording_add_deferred
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'export.db')
+            seed_sqlite(db_path, make_tasks(task_count))
+            # Keeps the archive scheduler from moving synthetic tasks out of the export meanwhile
+            with sqlite_app(db_path, archive_after_days=0, archive_stale_days=0) as app:
+                sign_in(app, SIMPLIFIED_USER_CREDENTIALS['mustafa']['email'])
+                app.sidebar.radio(key='view_selection').set_value('Import / Export').run()
+                for fmt, header_lines in [('jsonl', 0), ('csv', 1)]:
+                    app.radio(key='export_format').set_value(fmt).run()
+                    button = app.get('download_button')[0]
+                    button.click().run()
+                    assert not app.exception, app_exceptions(app)
+                    data = deferred[button.proto.deferred_file_id]()
+                    assert data.decode('utf-8').count('\n') == task_count + header_lines, fmt
+    finally:
+        MediaFileManager.add_deferred = add_deferred
+    print(f"apptest export: {task_count} tasks downloaded as JSONL and CSV OK")
+
+def check_apptest_filter_selection(task_count=100):
+    """An account filter the admin narrowed survives typing a search, which changes every facet count."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'filters.db')
+        seed_sqlite(db_path, make_tasks(task_count))
+        with sqlite_app(db_path, archive_after_days=0, archive_stale_days=0) as app:
+            sign_in(app, SIMPLIFIED_USER_CREDENTIALS['mustafa']['email'])
+            app.multiselect(key='filter_accounts').unselect(MOCK_ACCOUNTS[0]).run()
+            app.text_input(key='task_search').input('report').run()
+            assert not app.exception, app_exceptions(app)
+            assert app.multiselect(key='filter_accounts').value == MOCK_ACCOUNTS[1:], app.multiselect(key='filter_accounts').value
+    print("apptest filter selection: narrowed account filter kept across a search OK")
+
+def check_apptest_archived(task_count=500):
+    """The admin's "Show archived tasks" lists the newest ARCHIVED_DISPLAY_LIMIT archived tasks, newest first."""
+    tasks = make_tasks(task_count)
+    newest = sorted(tasks, key=lambda t: (t.due_date, t.id), reverse=True)[:ARCHIVED_DISPLAY_LIMIT]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'archived.db')
+        seed_sqlite(db_path, tasks)
+        storage = SQLiteBackend(db_path)
+        storage.archive_tasks([t.id for t in tasks])
+        storage.conn.close()
+        with sqlite_app(db_path, archive_after_days=0, archive_stale_days=0) as app:
+            sign_in(app, SIMPLIFIED_USER_CREDENTIALS['mustafa']['email'])
+            app.toggle(key='show_archived').set_value(True).run()
+            assert not app.exception, app_exceptions(app)
+            shown = app.dataframe[-1].value
+            assert list(shown['Title']) == [t.title for t in newest], list(shown['Title'])[:5]
+    print(f"apptest archived: newest {ARCHIVED_DISPLAY_LIMIT} of {task_count} archived tasks listed OK")
+
+def page_label(app, page):
+    """All My Tasks' pager caption if it shows `page`; that section comes after Today and Upcoming."""
+    label = [c.value for c in app.caption if c.value.startswith("Page ")][-1]
+    return label if label.startswith(f"Page {page} of ") else None
+
+def check_apptest_paging(task_count=200):
+    """Prev and Next of All My Tasks are enabled exactly when there is a page to turn to, right after each click."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'paging.db')
+        seed_sqlite(db_path, make_tasks(task_count))
+        with sqlite_app(db_path, archive_after_days=0, archive_stale_days=0) as app:
+            sign_in(app, SIMPLIFIED_USER_CREDENTIALS['mustafa']['email'])
+            page_count = int(page_label(app, 1).split(' of ')[1].split()[0])  # All My Tasks leaves out tasks with no next due date
+            assert page_count > 2, page_count
+            for page in range(1, page_count + 1):
+                if page > 1:
+                    app.button(key='next_all').click().run()
+                    assert not app.exception, app_exceptions(app)
+                assert app.button(key='prev_all').disabled == (page == 1), page
+                assert app.button(key='next_all').disabled == (page == page_count), page
+                assert page_label(app, page), page
+    print(f"apptest paging: {page_count} pages turned OK")
+
+def check_apptest_finish_series():
+    """The owner finishes a weekly series from its card, and the stored task ends up completed once the
+    write-behind queue flushes; the card then offers to reopen it."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'finish.db')
+        seed_sqlite(db_path, [Task('series', 'Weekly sync', due_date=date.today(), type='weekly', owner_id='bob',
+                                   account=MOCK_ACCOUNTS[0], campaign=MOCK_CAMPAIGNS[0])])
+        with sqlite_app(db_path, archive_after_days=0, archive_stale_days=0) as app:
+            sign_in(app, SIMPLIFIED_USER_CREDENTIALS['bob']['email'])
+            next(b for b in app.button if b.label == 'Finish series').click().run()
+            assert not app.exception, app_exceptions(app)
+            assert 'Finish series' not in [b.label for b in app.button]
+            storage = SQLiteBackend(db_path)
+            deadline = time.perf_counter() + WRITE_BEHIND_SHUTDOWN_TIMEOUT_SECONDS
+            while not storage.load_tasks()[0].is_completed:
+                assert time.perf_counter() < deadline, "finished series never reached storage"
+                time.sleep(WRITE_BEHIND_WINDOW_SECONDS)
+            storage.conn.close()
+    print("apptest finish series: weekly series completed and stored OK")
+
+def bench_apptest(results, size, reruns=5):
+    """Signs in as the admin through the login form and times the first dashboard run and reruns, against a
+    SQLite store seeded with `size` tasks (0: an empty store the app bootstraps itself). A run that raised fails
+    the suite rather than being timed."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        if size:
+            seed_sqlite(db_path, make_tasks(size))
+        with sqlite_app(db_path) as app:
+            app.run()
+            app.sidebar.text_input[0].input(SIMPLIFIED_USER_CREDENTIALS['mustafa']['email'])
+            app.sidebar.text_input[1].input('1234')
+            started = time.perf_counter()
+            app.sidebar.button[0].click().run()
+            elapsed = time.perf_counter() - started
+            assert not app.exception, app_exceptions(app)
+            assert app.session_state.login_status
+            results.record('AppTest sign-in (dashboard)', size, elapsed)
+            timings = []
+            for _ in range(reruns):
+                started = time.perf_counter()
+                app.run()
+                timings.append(time.perf_counter() - started)
+                assert not app.exception, app_exceptions(app)
+            results.record('AppTest rerun (dashboard)', size, min(timings))
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=",".join(map(str, DEFAULT_SIZES)), help="comma-separated task counts")
+    parser.add_argument('--apptest-sizes', default=",".join(map(str, APPTEST_SIZES)), help="task counts for the end-to-end run ('' to skip)")
+    parser.add_argument('--json', help="append results as one JSON line to this file")
+    args = parser.parse_args()
+    if not __debug__:
+        parser.error("the correctness checks rely on assert, which -O strips; run without -O")
+
+    check_recurrence_equivalence()
+    check_occurrence_index_equivalence()
+    check_calendar_html()
+    check_query_pushdown_equivalence()
+    check_workload_equivalence()
+    check_search_equivalence()
+    check_archive_roundtrip()
+    check_reminder_heap_equivalence()
+    check_import_writes()
+    check_login_refresh()
+    check_reminder_send_retry()
+    check_write_behind_retry()
+    check_audit_replay()
+
+    results = Results()
+    print("\nstartup")
+    bench_startup(results)
+    bench_bootstrap(results)
+    for size in [int(s) for s in args.sizes.split(',') if s]:
+        print(f"\n{size} tasks")
+        tasks = make_tasks(size)
+        bench_recurrence(results, tasks)
+        bench_dashboard_pipeline(results, tasks)
+        bench_calendar_grid(results, tasks)
+        bench_serialization(results, tasks)
+        bench_query_pushdown(results, tasks)
+        bench_analytics(results, tasks)
+        bench_search(results, tasks)
+        bench_reminder_heap(results, tasks)
+        bench_audit_log(results, tasks)
+        bench_task_memory(results, tasks)
+
+    apptest_sizes = [int(s) for s in args.apptest_sizes.split(',') if s]
+    if apptest_sizes:
+        print("\nend-to-end")
+        check_apptest_login()
+        check_apptest_pin_upgrade()
+        check_apptest_export()
+        check_apptest_filter_selection()
+        check_apptest_archived()
+        check_apptest_paging()
+        check_apptest_finish_series()
+        for size in [0] + apptest_sizes:
+            bench_apptest(results, size)
+
+    if args.json:
+        with open(args.json, 'a') as f:
+            f.write(json.dumps({'timestamp': datetime.now().isoformat(timespec='seconds'), 'revision': git_revision(), 'results': results.rows}) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""Reminder and digest worker for TaskFlow Manager.
+
+Runs on its own, next to the Streamlit app, against the same storage backend
+(picked with TASKFLOW_STORAGE_BACKEND / TASKFLOW_SQLITE_PATH or secrets, as
+in the app). Every active task's next open occurrence sits in a min-heap
+ordered by when it is to be announced. The worker sleeps until the earliest
+one, sends what is due, and pushes that task's following occurrence. Task
+changes arrive as deltas (Firestore listeners, or the SQLite change log) and
+replace only the affected tasks' entries, so nothing is rescanned per tick.
+
+    TASKFLOW_STORAGE_BACKEND=sqlite python reminder_worker.py --sink file --path reminders.jsonl
+    python reminder_worker.py --sink smtp --smtp-host localhost --smtp-port 1025
+    python reminder_worker.py --sink webhook --url http://localhost:8080/hooks/taskflow
+"""
+import argparse
+import heapq
+import itertools
+import json
+import smtplib
+import sys
+import threading
+import urllib.request
+from datetime import datetime, time, timedelta
+from email.message import EmailMessage
+
+from streamlit_task_manager import create_storage_backend, first_occurrence_on_or_after, is_occurrence_completed
+
+DEFAULT_LEAD_DAYS = 1
+DEFAULT_REMINDER_HOUR = 9
+DEFAULT_DIGEST_HOUR = 8
+# Backends that can't push changes (SQLite) are polled this often while the worker sleeps
+POLL_INTERVAL_SECONDS = 30
+# Superseded heap entries are skipped when popped; rebuild once they outnumber the live ones this much
+HEAP_COMPACTION_RATIO = 2
+# A message the sink fails to send is retried after 1, 2, 4... minutes (at most an hour apart), then dropped
+SEND_RETRY_SECONDS = 60
+SEND_MAX_BACKOFF_SECONDS = 60 * 60
+SEND_MAX_ATTEMPTS = 10
+
+# --- SINKS ---
+
+class ReminderSink:
+    """Where notifications go: one call per recipient with a subject and a plain-text body."""
+    def send(self, username, user, subject, body): raise NotImplementedError
+    def close(self): pass
+
+class FileSink(ReminderSink):
+    """Appends one JSON line per message to a file ('-' for stdout)."""
+
+    def __init__(self, path='-'):
+        self.file = sys.stdout if path == '-' else open(path, 'a', encoding='utf-8')
+
+    def send(self, username, user, subject, body):
+        record = {'timestamp': datetime.now().isoformat(timespec='seconds'), 'to': username,
+                  'email': user.get('email'), 'subject': subject, 'body': body}
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+class SMTPSink(ReminderSink):
+    """Sends an email per message through an SMTP server, e.g. a local debugging server."""
+
+    def __init__(self, host='localhost', port=1025, sender='taskflow@localhost'):
+        self.host, self.port, self.sender = host, port, sender
+
+    def send(self, username, user, subject, body):
+        message = EmailMessage()
+        message['From'], message['To'], message['Subject'] = self.sender, user.get('email') or username, subject
+        message.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            smtp.send_message(message)
+
+class WebhookSink(ReminderSink):
+    """POSTs each message as JSON to a URL."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def send(self, username, user, subject, body):
+        payload = json.dumps({'to': username, 'email': user.get('email'), 'subject': subject, 'text': body}).encode()
+        request = urllib.request.Request(self.url, data=payload, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=10):
+            pass
+
+# --- SCHEDULE ---
+
+def next_open_occurrence_from(task, from_date):
+    """First occurrence on or after `from_date` that isn't marked done, however far ahead; None when there is none."""
+    if task.is_completed:
+        return None
+    occurrence = first_occurrence_on_or_after(task, from_date)
+    while occurrence is not None and is_occurrence_completed(task, occurrence):
+        occurrence = first_occurrence_on_or_after(task, occurrence + timedelta(days=1))
+    return occurrence
+
+class OccurrenceHeap:
+    """Min-heap of (announce at, seq, task_id, occurrence) holding the next open occurrence of every active task.
+
+    An occurrence is announced `lead_days` before it, at `hour` o'clock. A
+    changed task gets a fresh entry and its old one is left behind as stale
+    (recognised by its seq) instead of being searched for, so an update costs
+    O(log n).
+    """
+
+    def __init__(self, lead_days, hour):
+        self.lead_days, self.hour = lead_days, hour
+        self.heap = []
+        self.tasks = {}
+        self.live = {}  # task_id -> its current heap entry
+        self.seq = itertools.count()
+
+    def __len__(self):
+        return len(self.live)
+
+    def announce_at(self, occurrence):
+        return datetime.combine(occurrence - timedelta(days=self.lead_days), time(self.hour))
+
+    def first_unannounced_day(self, now):
+        """The earliest occurrence date whose announcement is still ahead of `now`; earlier ones were missed, not owed."""
+        day = now.date() + timedelta(days=self.lead_days)
+        return day if self.announce_at(day) >= now else day + timedelta(days=1)
+
+    def entry(self, task, from_date):
+        occurrence = next_open_occurrence_from(task, from_date)
+        if occurrence is None:
+            return None
+        return (self.announce_at(occurrence), next(self.seq), task.id, occurrence)
+
+    def load(self, tasks, now):
+        """Builds the heap in one heapify rather than n pushes."""
+        from_date = self.first_unannounced_day(now)
+        self.tasks = {task.id: task for task in tasks}
+        self.live = {}
+        for task in self.tasks.values():
+            entry = self.entry(task, from_date)
+            if entry is not None:
+                self.live[task.id] = entry
+        self.heap = list(self.live.values())
+        heapq.heapify(self.heap)
+
+    def upsert(self, task, now):
+        self.tasks[task.id] = task
+        self.live.pop(task.id, None)
+        entry = self.entry(task, self.first_unannounced_day(now))
+        if entry is not None:
+            self.live[task.id] = entry
+            heapq.heappush(self.heap, entry)
+        self.compact_if_stale()
+
+    def remove(self, task_id):
+        self.tasks.pop(task_id, None)
+        self.live.pop(task_id, None)
+        self.compact_if_stale()
+
+    def compact_if_stale(self):
+        if len(self.heap) > HEAP_COMPACTION_RATIO * len(self.live) + 1000:
+            self.heap = list(self.live.values())
+            heapq.heapify(self.heap)
+
+    def next_at(self):
+        """When the earliest live entry is due, or None if there is nothing scheduled."""
+        while self.heap and self.live.get(self.heap[0][2]) is not self.heap[0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now):
+        """[(task, occurrence)] announced at or before `now`, each task advanced to its following occurrence."""
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            _, _, task_id, occurrence = entry
+            if self.live.get(task_id) is not entry:
+                continue
+            task = self.tasks[task_id]
+            due.append((task, occurrence))
+            following = self.entry(task, occurrence + timedelta(days=1))
+            if following is None:
+                del self.live[task_id]
+            else:
+                self.live[task_id] = following
+                heapq.heappush(self.heap, following)
+        return due
+
+# --- WORKER ---
+
+def format_occurrences(items):
+    lines = []
+    for task, occurrence in sorted(items, key=lambda item: (item[1], item[0].title or '')):
+        context = " / ".join(filter(None, [task.account, task.campaign]))
+        lines.append(f"- {occurrence:%a %d %b}: {task.title} [{task.priority}]" + (f" ({context})" if context else ""))
+    return "\n".join(lines)
+
+class ReminderWorker:
+    """Keeps a due-soon heap and a daily-digest heap in step with storage and sends what falls due.
+
+    Exposes the same apply_task_changes/replace_users hooks as the app's
+    SharedDataCache, so Firestore listeners can push deltas straight in.
+    """
+
+    def __init__(self, storage, sink, lead_days=DEFAULT_LEAD_DAYS, reminder_hour=DEFAULT_REMINDER_HOUR,
+                 digest_hour=DEFAULT_DIGEST_HOUR, clock=datetime.now):
+        self.storage, self.sink, self.clock = storage, sink, clock
+        self.reminders = OccurrenceHeap(lead_days, reminder_hour)
+        self.digests = OccurrenceHeap(0, digest_hour)
+        self.users = {}
+        self.retries = []  # min-heap of (retry at, seq, attempt, username, subject, body)
+        self.retry_seq = itertools.count()
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+        self.backend_version = None
+        self.is_push_synced = False
+
+    def load(self):
+        self.backend_version = self.storage.change_version()
+        self.users = self.storage.load_users() or {}
+        tasks = list(self.storage.iter_tasks())
+        now = self.clock()
+        with self.lock:
+            self.reminders.load(tasks, now)
+            self.digests.load(tasks, now)
+        self.is_push_synced = self.storage.subscribe(self)
+        if self.is_push_synced:
+            self.storage.watch_tasks(self, None)
+
+    def apply_task_changes(self, upserts, removed_ids=(), removed_from_owner=None):
+        now = self.clock()
+        with self.lock:
+            for task in upserts:
+                self.reminders.upsert(task, now)
+                self.digests.upsert(task, now)
+            for task_id in removed_ids:
+                self.reminders.remove(task_id)
+                self.digests.remove(task_id)
+        self.changed.set()
+
+    def replace_users(self, users):
+        self.users = users
+
+    def replace_categories(self, categories):
+        pass
+
+    def poll(self):
+        """Pulls deltas from backends that are polled rather than pushed; a full reload if too far behind."""
+        if self.is_push_synced or self.backend_version is None:
+            return
+        changes = self.storage.changes_since(self.backend_version)
+        if changes is None:
+            self.load()
+            return
+        latest_version, task_ids, document_names = changes
+        if latest_version == self.backend_version:
+            return
+        changed_tasks = self.storage.load_tasks_by_ids(task_ids)
+        self.apply_task_changes(changed_tasks.values(), [i for i in task_ids if i not in changed_tasks])
+        if 'users' in document_names:
+            self.users = self.storage.load_users() or self.users
+        self.backend_version = latest_version
+
+    def send(self, username, subject, body, attempt=1):
+        """Sends one message. A sink error doesn't propagate: the message is queued for a retry with
+        exponential backoff, and dropped (and logged) after SEND_MAX_ATTEMPTS. Returns whether it went out."""
+        try:
+            self.sink.send(username, self.users.get(username, {}), subject, body)
+            return True
+        except Exception as e:
+            if attempt >= SEND_MAX_ATTEMPTS:
+                print(f"Giving up on '{subject}' for {username} after {attempt} attempts: {e}", file=sys.stderr)
+                return False
+            delay = min(SEND_RETRY_SECONDS * 2 ** (attempt - 1), SEND_MAX_BACKOFF_SECONDS)
+            print(f"Sending '{subject}' to {username} failed, retrying in {delay}s: {e}", file=sys.stderr)
+            with self.lock:
+                heapq.heappush(self.retries, (self.clock() + timedelta(seconds=delay), next(self.retry_seq), attempt + 1, username, subject, body))
+            return False
+
+    def run_pending(self):
+        """Sends everything due by now, one message per user and kind, plus retries that are due; returns how many were sent."""
+        now = self.clock()
+        with self.lock:
+            retries = []
+            while self.retries and self.retries[0][0] <= now:
+                retries.append(heapq.heappop(self.retries))
+            batches = [('reminder', self.reminders.pop_due(now)), ('digest', self.digests.pop_due(now))]
+        sent = sum(self.send(username, subject, body, attempt) for _, _, attempt, username, subject, body in retries)
+        for kind, due in batches:
+            by_owner = {}
+            for task, occurrence in due:
+                by_owner.setdefault(task.owner_id, []).append((task, occurrence))
+            for username, items in by_owner.items():
+                user = self.users.get(username, {})
+                if kind == 'digest':
+                    subject = f"Today's tasks ({len(items)})"
+                else:
+                    subject = f"Due soon: {len(items)} task{'s' if len(items) != 1 else ''}"
+                sent += self.send(username, subject, f"Hi {user.get('name', username)},\n\n{format_occurrences(items)}\n")
+        return sent
+
+    def seconds_until_next(self):
+        with self.lock:
+            next_times = [t for t in (self.reminders.next_at(), self.digests.next_at()) if t is not None]
+            if self.retries:
+                next_times.append(self.retries[0][0])
+        wait = (min(next_times) - self.clock()).total_seconds() if next_times else None
+        if not self.is_push_synced:
+            wait = POLL_INTERVAL_SECONDS if wait is None else min(wait, POLL_INTERVAL_SECONDS)
+        return None if wait is None else max(0.0, wait)
+
+    def run(self, stop=None):
+        stop = stop or threading.Event()
+        self.load()
+        while not stop.is_set():
+            self.poll()
+            self.run_pending()
+            self.changed.clear()
+            # A pushed change may move the earliest entry, so it wakes the wait early
+            self.changed.wait(self.seconds_until_next())
+
+def create_sink(args):
+    if args.sink == 'smtp':
+        return SMTPSink(args.smtp_host, args.smtp_port, args.sender)
+    if args.sink == 'webhook':
+        if not args.url:
+            raise SystemExit("--url is required for the webhook sink")
+        return WebhookSink(args.url)
+    return FileSink(args.path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sink', choices=['file', 'smtp', 'webhook'], default='file')
+    parser.add_argument('--path', default='-', help="file sink: JSON lines output ('-' for stdout)")
+    parser.add_argument('--smtp-host', default='localhost')
+    parser.add_argument('--smtp-port', type=int, default=1025)
+    parser.add_argument('--sender', default='taskflow@localhost')
+    parser.add_argument('--url', help="webhook sink: URL to POST to")
+    parser.add_argument('--lead-days', type=int, default=DEFAULT_LEAD_DAYS, help="days before an occurrence to remind")
+    parser.add_argument('--reminder-hour', type=int, default=DEFAULT_REMINDER_HOUR)
+    parser.add_argument('--digest-hour', type=int, default=DEFAULT_DIGEST_HOUR)
+    args = parser.parse_args()
+
+    sink = create_sink(args)
+    worker = ReminderWorker(create_storage_backend(), sink, args.lead_days, args.reminder_hour, args.digest_hour)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+
+if __name__ == "__main__":
+    main()
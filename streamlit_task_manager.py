@@ -1,11 +1,24 @@
 import streamlit as st
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, date, timezone
 import calendar
-import firebase_admin
-from firebase_admin import credentials, firestore
+import csv
+import io
 import json
-import tempfile
 import os
+import hashlib
+import hmac
+import sqlite3
+import tempfile
+import threading
+import time
+import atexit
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import functools
+import html
+import re
+import uuid
+from bisect import bisect_left, insort
 
 # --- CONFIGURATION & CREDENTIALS ---
 
@@ -38,6 +51,354 @@ INITIAL_MOCK_TASKS = [
     { 'id': 'task_3', 'title': 'Clean Database', 'description': 'Routine maintenance.', 'due_date': datetime.now().date().replace(day=5), 'type': 'monthly', 'owner_id': 'charlie', 'is_completed': False, 'account': 'General', 'campaign': 'Brand Awareness', 'priority': 'Low' }
 ]
 
+# --- INSTRUMENTATION ---
+
+RECENT_RERUNS_KEPT = 50
+
+class Metrics:
+    """Process-wide timings and counters, plus a per-rerun breakdown.
+
+    `span(name)` times a block into the process totals and, when it runs on a
+    script thread inside `rerun()`, into that rerun's record as well. Counters
+    work the same way, so background writes (the write-behind thread) count
+    toward the process but not toward whichever rerun happens to be running.
+    """
+
+    def __init__(self, recent=RECENT_RERUNS_KEPT):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.timings = {}  # name -> [count, total seconds, max seconds]
+        self.counters = {}
+        self.recent_reruns = deque(maxlen=recent)
+        self.local = threading.local()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                self.timings[name] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+        current = getattr(self.local, 'rerun', None)
+        if current is not None:
+            current['spans'][name] = current['spans'].get(name, 0.0) + seconds
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        current = getattr(self.local, 'rerun', None)
+        if current is not None:
+            current['counters'][name] = current['counters'].get(name, 0) + amount
+
+    def record_io(self, kind, docs, payload_bytes=0):
+        """Counts storage traffic; `kind` is 'read' or 'write'."""
+        self.increment(f'db_{kind}_calls')
+        self.increment(f'db_{kind}_docs', docs)
+        self.increment(f'db_{kind}_bytes', payload_bytes)
+
+    def span(self, name):
+        return MetricsSpan(self, name)
+
+    def rerun(self, user=None):
+        return MetricsRerun(self, user)
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.timings.clear()
+            self.counters.clear()
+            self.recent_reruns.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'timings': {name: list(t) for name, t in self.timings.items()},
+                'counters': dict(self.counters),
+                'recent_reruns': list(self.recent_reruns),
+            }
+
+    def to_prometheus(self):
+        """Prometheus text exposition of the process totals."""
+        data = self.snapshot()
+        lines = [
+            '# HELP taskflow_span_seconds Time spent in instrumented code paths.',
+            '# TYPE taskflow_span_seconds summary',
+        ]
+        for name, (count, total, _) in sorted(data['timings'].items()):
+            lines.append(f'taskflow_span_seconds_count{{span="{name}"}} {count}')
+            lines.append(f'taskflow_span_seconds_sum{{span="{name}"}} {total:.6f}')
+        lines += ['# HELP taskflow_span_max_seconds Slowest single run of each span.', '# TYPE taskflow_span_max_seconds gauge']
+        for name, (_, _, longest) in sorted(data['timings'].items()):
+            lines.append(f'taskflow_span_max_seconds{{span="{name}"}} {longest:.6f}')
+        for name, value in sorted(data['counters'].items()):
+            lines += [f'# TYPE taskflow_{name}_total counter', f'taskflow_{name}_total {value}']
+        return "\n".join(lines) + "\n"
+
+class MetricsSpan:
+    def __init__(self, metrics, name):
+        self.metrics, self.name = metrics, name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+
+class MetricsRerun:
+    """Collects one script run's spans and counters; see Metrics.rerun()."""
+
+    def __init__(self, metrics, user):
+        self.metrics, self.user = metrics, user
+
+    def __enter__(self):
+        self.record = {'timestamp': datetime.now().isoformat(timespec='seconds'), 'user': self.user, 'spans': {}, 'counters': {}}
+        self.metrics.local.rerun = self.record
+        self.started = time.perf_counter()
+        return self.record
+
+    def __exit__(self, *exc_info):
+        # st.rerun()/st.stop() end a run by raising, so this always runs
+        self.metrics.local.rerun = None
+        duration = time.perf_counter() - self.started
+        self.metrics.observe('rerun', duration)
+        self.record['duration_ms'] = round(duration * 1000, 3)
+        self.record['spans'] = {name: round(seconds * 1000, 3) for name, seconds in self.record['spans'].items()}
+        with self.metrics.lock:
+            self.metrics.recent_reruns.append(self.record)
+        log_path = get_storage_setting('metrics_log', '')
+        if log_path:
+            try:
+                with open(log_path, 'a') as f:
+                    f.write(json.dumps(self.record) + "\n")
+            except OSError:
+                pass  # A bad log path must not break the page
+
+@st.cache_resource
+def get_metrics():
+    """The process-wide Metrics instance, shared by every session and background thread."""
+    return Metrics()
+
+def timed(name):
+    """Decorator: records each call of the function as span `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_metrics().span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+PAYLOAD_SIZE_SAMPLE = 32
+
+def payload_size(value):
+    """Rough serialized size in bytes of a task, dict or list of them, for the I/O counters.
+
+    Long lists are estimated from an evenly spaced sample so that counting a
+    10k-task read costs far less than the read itself.
+    """
+    if isinstance(value, Task):
+        return sum(len(str(getattr(value, field))) for field in Task.__slots__)
+    if isinstance(value, dict):
+        return sum(len(str(k)) + payload_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        if len(value) <= PAYLOAD_SIZE_SAMPLE:
+            return sum(payload_size(v) for v in value)
+        step = len(value) / PAYLOAD_SIZE_SAMPLE
+        sample = [value[int(i * step)] for i in range(PAYLOAD_SIZE_SAMPLE)]
+        return sum(payload_size(v) for v in sample) * len(value) // PAYLOAD_SIZE_SAMPLE
+    return len(str(value))
+
+# --- TASK MODEL ---
+
+class Task:
+    """A single task. `__slots__` keeps thousands of tasks per process compact.
+
+    Tasks held by the shared cache are never mutated in place: use `replace()`
+    to derive the updated copy. Fields this version of the app doesn't know
+    about are kept in `extra` so they survive a round trip through storage.
+    `revision` and `updated_at` are stamped by the storage layer on every
+    conditional write (see resolve_task_write).
+    """
+    __slots__ = ('id', 'title', 'description', 'due_date', 'type', 'owner_id', 'is_completed', 'account', 'campaign', 'priority',
+                 'revision', 'updated_at', 'extra')
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, id, title='', description='', due_date=None, type='one-time', owner_id=None,
+                 is_completed=False, account=None, campaign=None, priority='Medium', revision=0, updated_at=None, extra=None):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.due_date = due_date
+        self.type = type
+        self.owner_id = owner_id
+        self.is_completed = is_completed
+        self.account = account
+        self.campaign = campaign
+        self.priority = priority
+        self.revision = revision
+        self.updated_at = updated_at
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds a task from a plain dict; Firestore timestamps are narrowed back to dates."""
+        data = dict(data)
+        fields = {field: data.pop(field) for field in cls.FIELDS if field in data}
+        if isinstance(fields.get('due_date'), datetime):
+            fields['due_date'] = fields['due_date'].date()
+        return cls(**fields, extra=data or None)
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    from_firestore = from_dict
+
+    def to_firestore(self):
+        """Firestore stores datetimes, not dates."""
+        data = self.to_dict()
+        data['due_date'] = datetime.combine(self.due_date, datetime.min.time()) if isinstance(self.due_date, date) else None
+        return data
+
+    def replace(self, **changes):
+        """Copy with `changes` applied. Unknown keys land in `extra`; `extra=` replaces it wholesale."""
+        if 'extra' in changes:
+            data = {field: getattr(self, field) for field in self.FIELDS}
+            data.update(changes.pop('extra') or {})
+        else:
+            data = self.to_dict()
+        data.update(changes)
+        return Task.from_dict(data)
+
+    def __eq__(self, other):
+        return isinstance(other, Task) and self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Task({self.id!r}, {self.title!r}, type={self.type!r}, due_date={self.due_date!r})"
+
+# --- CONCURRENT EDITS ---
+
+# Fields a user edits; revision/updated_at are bookkeeping and never conflict.
+# Keys inside `extra` merge individually, as 'extra.<key>'.
+MERGEABLE_FIELDS = tuple(f for f in Task.FIELDS if f not in ('id', 'revision', 'updated_at'))
+MISSING = object()
+# Fields whose concurrent edits combine instead of conflicting: field -> merge(base, mine, theirs)
+FIELD_MERGERS = {}
+
+# A write that could not be applied as made. `saved` is what storage now holds
+# (None if the task was deleted), `fields` the ones where another edit won.
+TaskConflict = namedtuple('TaskConflict', ['task_id', 'fields', 'mine', 'saved'])
+
+def task_changes(base, task):
+    """{field: new value} for every mergeable field that differs between two versions of a task."""
+    changes = {f: getattr(task, f) for f in MERGEABLE_FIELDS if getattr(task, f) != getattr(base, f)}
+    base_extra, extra = base.extra or {}, task.extra or {}
+    for key in base_extra.keys() | extra.keys():
+        if base_extra.get(key, MISSING) != extra.get(key, MISSING):
+            changes[f'extra.{key}'] = extra.get(key, MISSING)
+    return changes
+
+def field_value(task, field):
+    if field.startswith('extra.'):
+        return (task.extra or {}).get(field[len('extra.'):], MISSING)
+    return getattr(task, field)
+
+def with_task_changes(task, changes):
+    fields = {f: v for f, v in changes.items() if not f.startswith('extra.')}
+    extra = dict(task.extra or {})
+    for field, value in changes.items():
+        if field.startswith('extra.'):
+            key = field[len('extra.'):]
+            if value is MISSING:
+                extra.pop(key, None)
+            else:
+                extra[key] = value
+    return task.replace(**fields, extra=extra)
+
+def resolve_task_write(mine, base, current, now=None):
+    """Decides what a conditional write of `mine` (edited from `base`) stores, given what storage holds now.
+
+    Returns (task to write or None, TaskConflict or None). If nobody else wrote
+    since `base`, `mine` is written as is. Otherwise the edits are merged field
+    by field: fields only one side changed keep that change, and fields both
+    sides changed to different values keep the stored value and are reported.
+    """
+    now = now or datetime.now(timezone.utc)
+    if current is None:
+        if base is None:
+            return mine.replace(revision=1, updated_at=now), None
+        return None, TaskConflict(mine.id, ('deleted',), mine, None)
+    if base is None or current.revision == base.revision:
+        return mine.replace(revision=current.revision + 1, updated_at=now), None
+
+    my_changes = task_changes(base, mine)
+    their_changes = task_changes(base, current)
+    for field, merge in FIELD_MERGERS.items():
+        if field in my_changes and field in their_changes:
+            my_changes[field] = merge(field_value(base, field), my_changes[field], their_changes[field])
+            their_changes[field] = my_changes[field]
+    conflicting = tuple(f for f, v in my_changes.items() if f in their_changes and their_changes[f] != v)
+    merged = with_task_changes(current, {f: v for f, v in my_changes.items() if f not in conflicting})
+    if task_changes(current, merged):
+        merged = merged.replace(revision=current.revision + 1, updated_at=now)
+    else:
+        merged = None  # Nothing of ours left to write
+    conflict = TaskConflict(mine.id, conflicting, mine, merged or current) if conflicting else None
+    return merged, conflict
+
+# --- TASK QUERIES ---
+
+# A read request the data layer can push down to storage. accounts / campaigns / completed are
+# collections of allowed values; due_from / due_until bound the stored start date (inclusive);
+# order_by is 'due_date', 'title' or None; start_after is the cursor returned by task_cursor()
+# for the last task of the previous page. None everywhere means "no constraint".
+TaskQuery = namedtuple(
+    'TaskQuery',
+    ['owner_id', 'accounts', 'campaigns', 'completed', 'due_from', 'due_until', 'order_by', 'limit', 'start_after', 'descending'],
+    defaults=(None,) * 10,
+)
+TASK_QUERY_ORDER_FIELDS = ('due_date', 'title')
+
+def task_cursor(task, order_by):
+    """Opaque page cursor for `task`: its sort value and id."""
+    return (getattr(task, order_by) if order_by else None, task.id)
+
+def task_sort_key(order_by):
+    # None sorts first, as it does in SQLite and Firestore
+    if not order_by:
+        return lambda t: t.id
+    return lambda t: (getattr(t, order_by) is not None, getattr(t, order_by), t.id)
+
+def apply_task_query(tasks, query):
+    """Reference semantics of TaskQuery over in-memory tasks. Backends use it to finish whatever
+    part of a query they could not push down; it is idempotent on already-filtered rows."""
+    def matches(t):
+        return ((query.owner_id is None or t.owner_id == query.owner_id)
+                and (query.accounts is None or t.account in query.accounts)
+                and (query.campaigns is None or t.campaign in query.campaigns)
+                and (query.completed is None or t.is_completed in query.completed)
+                and (query.due_from is None or (t.due_date is not None and t.due_date >= query.due_from))
+                and (query.due_until is None or (t.due_date is not None and t.due_date <= query.due_until)))
+
+    result = [t for t in tasks if matches(t)]
+    if query.order_by or query.start_after or query.limit:
+        sort_key = task_sort_key(query.order_by)
+        result.sort(key=sort_key, reverse=bool(query.descending))
+        if query.start_after:
+            cursor_value, cursor_id = query.start_after
+            cursor_key = (cursor_value is not None, cursor_value, cursor_id) if query.order_by else cursor_id
+            result = [t for t in result if (sort_key(t) < cursor_key if query.descending else sort_key(t) > cursor_key)]
+    if query.limit:
+        result = result[:query.limit]
+    return result
+
 # --- HELPER FUNCTIONS ---
 
 def get_user_name(username):
@@ -47,17 +408,122 @@ def get_user_name(username):
 
 # --- AUTHENTICATION FUNCTIONS ---
 
+# PINs are stored as 'pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>' under 'pin_hash'.
+# Users still carrying a plaintext 'pin' are rehashed the next time the user store is loaded.
+PIN_HASH_ALGORITHM = 'pbkdf2_sha256'
+PIN_HASH_ITERATIONS = 200_000
+
+# Failed logins per email: a bucket of LOGIN_BURST attempts, refilled at one per LOGIN_REFILL_SECONDS.
+LOGIN_BURST = 5
+LOGIN_REFILL_SECONDS = 30
+LOGIN_LIMITER_MAX_KEYS = 10000
+# How often a login with an unknown email may poll storage for users added by other processes
+LOGIN_REFRESH_INTERVAL_SECONDS = 5
+# Unknown emails still pay for a PIN hash, so response time doesn't tell which emails are registered
+UNKNOWN_USER_PIN_SALT = bytes(16)
+
+def hash_pin(pin, salt=None, iterations=PIN_HASH_ITERATIONS):
+    salt = salt or os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', pin.encode(), salt, iterations)
+    return f"{PIN_HASH_ALGORITHM}${iterations}${salt.hex()}${digest.hex()}"
+
+def verify_pin(user_data, pin):
+    """Checks a PIN against the user's salted hash (or legacy plaintext PIN) in constant time."""
+    stored = user_data.get('pin_hash')
+    if stored is None:
+        return 'pin' in user_data and hmac.compare_digest(str(user_data['pin']).encode(), pin.encode())
+    try:
+        algorithm, iterations, salt, expected = stored.split('$')
+    except ValueError:
+        return False
+    if algorithm != PIN_HASH_ALGORITHM:
+        return False
+    digest = hashlib.pbkdf2_hmac('sha256', pin.encode(), bytes.fromhex(salt), int(iterations))
+    return hmac.compare_digest(digest.hex(), expected)
+
+def hash_user_pins(users):
+    """Returns (users, changed) with every plaintext 'pin' replaced by a 'pin_hash'."""
+    if not any('pin' in user_data for user_data in users.values()):
+        return users, False
+    hashed = {}
+    for username, user_data in users.items():
+        user_data = dict(user_data)
+        pin = user_data.pop('pin', None)
+        if pin is not None and 'pin_hash' not in user_data:
+            user_data['pin_hash'] = hash_pin(str(pin))
+        hashed[username] = user_data
+    return hashed, True
+
+class LoginRateLimiter:
+    """Token bucket per key (the lowercased email): each failed login spends a token.
+
+    While a bucket is empty the attempt is refused before the PIN is hashed,
+    so brute force costs neither CPU nor storage reads.
+    """
+
+    def __init__(self, burst=LOGIN_BURST, refill_seconds=LOGIN_REFILL_SECONDS):
+        self.burst = burst
+        self.refill_seconds = refill_seconds
+        self.buckets = {}  # key -> (tokens, last refill time)
+        self.lock = threading.Lock()
+
+    def tokens(self, key, now):
+        tokens, updated = self.buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) / self.refill_seconds)
+
+    def retry_after(self, key):
+        """Seconds until `key` may try again; 0 if it may try now."""
+        now = time.monotonic()
+        with self.lock:
+            tokens = self.tokens(key, now)
+        return 0 if tokens >= 1 else (1 - tokens) * self.refill_seconds
+
+    def record_failure(self, key):
+        now = time.monotonic()
+        with self.lock:
+            self.buckets[key] = (max(0.0, self.tokens(key, now) - 1), now)
+            if len(self.buckets) > LOGIN_LIMITER_MAX_KEYS:
+                # Buckets that have refilled carry no state worth keeping
+                self.buckets = {k: v for k, v in self.buckets.items() if self.tokens(k, now) < self.burst}
+
+    def record_success(self, key):
+        with self.lock:
+            self.buckets.pop(key, None)
+
+@st.cache_resource
+def get_login_limiter():
+    return LoginRateLimiter()
+
 def authenticate_user(email, pin):
-    """Authenticates user based on email and PIN."""
-    for username, user_data in st.session_state.users.items():
-        if user_data['email'].lower() == email.lower() and user_data['pin'] == pin:
-            st.session_state.login_status = True
-            st.session_state.username = username
-            st.session_state.name = user_data['name']
-            st.rerun()
-            return True
-    st.sidebar.error("Invalid email or PIN.")
-    return False
+    """Authenticates user based on email and PIN, via the shared cache's email index."""
+    key = email.strip().lower()
+    limiter = get_login_limiter()
+    retry_after = limiter.retry_after(key)
+    if retry_after:
+        st.sidebar.error(f"Too many failed attempts. Try again in {int(retry_after) + 1} seconds.")
+        return False
+
+    cache = get_shared_cache()
+    username = cache.find_username(key)
+    if username is None:
+        # Maybe a user added by another process that this one hasn't polled yet
+        cache.refresh_for_login()
+        username = cache.find_username(key)
+    user_data = cache.users.get(username)
+    if user_data is None:
+        hash_pin(pin, UNKNOWN_USER_PIN_SALT)
+    if user_data is None or not verify_pin(user_data, pin):
+        limiter.record_failure(key)
+        st.sidebar.error("Invalid email or PIN.")
+        return False
+
+    limiter.record_success(key)
+    st.session_state.users = cache.users
+    st.session_state.login_status = True
+    st.session_state.username = username
+    st.session_state.name = user_data['name']
+    st.rerun()
+    return True
 
 def logout():
     """Clears session state and logs the user out."""
@@ -68,157 +534,1727 @@ def logout():
 
 # --- FIREBASE INITIALIZATION ---
 
-def initialize_firebase():
-    """Initializes the Firebase Admin SDK if not already done."""
-    if not firebase_admin._apps:
-        temp_file_name = None
-        try:
-            cred_dict = st.secrets["firebase_key"]
-            service_account_info = dict(cred_dict)
-            with tempfile.NamedTemporaryFile(mode="w", delete=False) as temp_file:
-                json.dump(service_account_info, temp_file)
-                temp_file_name = temp_file.name
-            cred = credentials.Certificate(temp_file_name)
-            firebase_admin.initialize_app(cred)
-            st.session_state.db = firestore.client()
-            if temp_file_name and os.path.exists(temp_file_name):
-                os.remove(temp_file_name)
-        except Exception as e:
-            if temp_file_name and os.path.exists(temp_file_name):
-                os.remove(temp_file_name)
-            st.error(f"🛑 Error initializing Firebase: {e}")
-            st.stop()
-    if 'db' not in st.session_state:
-        st.session_state.db = firestore.client()
-
-# --- DATA STORAGE (PERSISTENT - FIRESTORE) ---
+# firebase_admin pulls in the whole google-cloud/grpc stack, so it is imported only when the
+# Firestore backend is actually built, never at module import or for SQLite runs.
 
-TASK_DOC_REF = 'team_tasks/all_tasks'
+@st.cache_resource
+def get_firestore_client():
+    """Initializes the Firebase Admin SDK once per process, straight from st.secrets, and returns the client."""
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    try:
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(dict(st.secrets["firebase_key"]))
+            firebase_admin.initialize_app(cred)
+        return firestore.client()
+    except Exception as e:
+        st.error(f"🛑 Error initializing Firebase: {e}")
+        st.stop()
+
+# --- STORAGE BACKENDS ---
+
+TASK_COLLECTION = 'tasks'
+# Completed and long-past tasks move here so everyday reads only see active ones
+ARCHIVE_COLLECTION = 'archived_tasks'
+# One document per day (audit_log/{day}); the records themselves in batch documents under it
+AUDIT_COLLECTION = 'audit_log'
+AUDIT_BATCH_COLLECTION = 'batches'
+AUDIT_RECORDS_PER_DOCUMENT = 500
+# Batch documents are numbered in append order from this counter; the change feed pages by that number
+AUDIT_SEQUENCE_DOC_REF = 'metadata/audit_sequence'
+AUDIT_FEED_PAGE_SIZE = 1000
+LEGACY_TASK_DOC_REF = 'team_tasks/all_tasks'
 USER_DOC_REF = 'user_data/all_users'
 CATEGORY_DOC_REF = 'metadata/categories'
+FIRESTORE_BATCH_LIMIT = 500
+FIRESTORE_IN_LIMIT = 30
+FIRESTORE_QUERY_PAGE_SIZE = 200
+# Query.ASCENDING / Query.DESCENDING, which order_by also accepts as plain strings
+FIRESTORE_ASCENDING, FIRESTORE_DESCENDING = 'ASCENDING', 'DESCENDING'
+
+# Backend selection: TASKFLOW_STORAGE_BACKEND env var, else `storage_backend` in st.secrets.
+DEFAULT_STORAGE_BACKEND = 'firestore'
+DEFAULT_SQLITE_PATH = 'taskflow.db'
+
+def get_storage_setting(name, default):
+    """Reads a storage setting from the environment first, then from st.secrets."""
+    env_value = os.environ.get(f"TASKFLOW_{name.upper()}")
+    if env_value:
+        return env_value
+    try:
+        return st.secrets.get(name, default)
+    except Exception:  # No secrets.toml at all (e.g. local SQLite runs)
+        return default
+
+class StorageBackend:
+    """Persistence interface shared by the Firestore and SQLite engines.
+
+    Tasks are exchanged as `Task` objects; users and categories as the same
+    dicts the UI keeps in session state. The load
+    methods return None when nothing has been stored yet.
+    """
+    name = 'base'
+
+    def load_tasks(self): raise NotImplementedError
+
+    def query_tasks(self, query):
+        """Tasks matching a TaskQuery. Engines override this to filter, sort and limit server-side."""
+        return apply_task_query(self.load_tasks() or [], query)
+
+    def iter_tasks(self):
+        """Every stored task, streamed where the engine allows rather than read into one list."""
+        return iter(self.load_tasks() or [])
+
+    def save_tasks(self, tasks): raise NotImplementedError
+    def save_task(self, task): raise NotImplementedError
+    def delete_task(self, task_id): raise NotImplementedError
+    def load_users(self): raise NotImplementedError
+    def save_users(self, users_dict): raise NotImplementedError
+    def load_categories(self): raise NotImplementedError
+    def save_categories(self, categories_dict): raise NotImplementedError
+
+    def archive_tasks(self, task_ids, archivable=None):
+        """Moves tasks from the active set into the archive tier; returns the ids moved.
+
+        `archivable` (Task -> bool) is checked against each task as read inside
+        the move, so a task edited since it was picked stays active.
+        """
+        raise NotImplementedError
+
+    def restore_tasks(self, task_ids):
+        """Moves archived tasks back into the active set; returns the ids moved."""
+        raise NotImplementedError
+
+    def query_archived_tasks(self, query):
+        """Archived tasks matching a TaskQuery. Only read on demand, never by the everyday views."""
+        raise NotImplementedError
+
+    def apply_task_writes(self, operations, applied=None):
+        """Applies ('set', task_id, task, base) / ('delete', task_id, None, None) operations and returns TaskConflicts.
+
+        `base` is the version the edit started from (None for a new task).
+        Engines override this to check revisions and merge atomically; this
+        fallback writes blindly. If `applied` is a list, (task_id, stored
+        before, written) is appended for every write that happened, with
+        None for a task that didn't exist or was deleted.
+        """
+        for op, task_id, task, _base in operations:
+            if op == 'delete':
+                self.delete_task(task_id)
+            else:
+                self.save_task(task)
+            if applied is not None:
+                applied.append((task_id, None, None if op == 'delete' else task))
+        return []
+
+    def append_audit_records(self, records):
+        """Appends audit records (see audit_record) to the day segments their timestamps fall in."""
+        raise NotImplementedError
+
+    def read_audit_records(self, after=None, until=None):
+        """Audit records with `after` < ts <= `until` (ISO timestamps, None: unbounded), oldest first."""
+        raise NotImplementedError
+
+    def read_audit_feed(self, after=0, limit=AUDIT_FEED_PAGE_SIZE):
+        """[(seq, record)] appended after sequence number `after`, in append order; the last seq is the next cursor.
+
+        Records are stamped when written but appended later, and by several
+        processes, so a timestamp cursor can skip one. Sequence numbers are
+        assigned in the transaction that makes the records visible.
+        """
+        raise NotImplementedError
+
+    def last_audit_sequence(self):
+        """The sequence number of the latest append (0 before the first): where a feed that starts now begins."""
+        raise NotImplementedError
+
+    def subscribe(self, cache):
+        """Pushes later user/category changes into the shared cache; returns False if the backend can only be polled."""
+        return False
+
+    def watch_tasks(self, cache, owner_id=None):
+        """Pushes later changes to one owner's tasks (None: all tasks) into the shared cache."""
+
+    def change_version(self):
+        """Monotonic counter of writes for backends that are polled; None if unsupported."""
+        return None
+
+    def changes_since(self, version):
+        """Returns (latest_version, changed_task_ids, changed_document_names), or None if too far behind."""
+        return None
+
+class FirestoreBackend(StorageBackend):
+    """One document per task in the `tasks` collection; users and categories as single documents."""
+    name = 'firestore'
+
+    def __init__(self, db):
+        self.db = db
+
+    def commit_in_batches(self, operations):
+        """Applies (op, doc_ref, data) tuples using Firestore batches of at most 500 writes."""
+        batch, pending = self.db.batch(), 0
+        for op, doc_ref, data in operations:
+            if op == 'delete':
+                batch.delete(doc_ref)
+            else:
+                batch.set(doc_ref, data)
+            pending += 1
+            if pending == FIRESTORE_BATCH_LIMIT:
+                batch.commit()
+                batch, pending = self.db.batch(), 0
+        if pending:
+            batch.commit()
+
+    def migrate_legacy_tasks(self):
+        """One-time move of the monolithic team_tasks/all_tasks document into per-task documents."""
+        legacy_ref = self.db.document(LEGACY_TASK_DOC_REF)
+        doc = legacy_ref.get()
+        if not doc.exists:
+            return []
+        legacy_tasks = (doc.to_dict() or {}).get('tasks', [])
+        tasks_ref = self.db.collection(TASK_COLLECTION)
+        self.commit_in_batches(('set', tasks_ref.document(t['id']), t) for t in legacy_tasks if t.get('id'))
+        legacy_ref.delete()
+        st.toast(f"Migrated {len(legacy_tasks)} tasks to per-task storage.")
+        return legacy_tasks
+
+    def load_tasks(self):
+        tasks = [doc.to_dict() for doc in self.db.collection(TASK_COLLECTION).stream()]
+        if not tasks:
+            tasks = self.migrate_legacy_tasks()
+        return [Task.from_firestore(t) for t in tasks] or None
+
+    def query_tasks(self, query, collection=TASK_COLLECTION):
+        """Translates a TaskQuery into where/order_by/limit; anything Firestore can't express is finished in Python.
+
+        Firestore allows one 'in' clause (at most 30 values) per query and needs
+        the first order_by on the field a range filter uses; see
+        firestore.indexes.json for the composite indexes these queries need.
+        """
+        ref = self.db.collection(collection)
+        fully_pushed = True
+        if query.owner_id is not None:
+            ref = ref.where(filter=self.field_filter('owner_id', '==', query.owner_id))
+        if query.completed is not None:
+            completed_values = list(dict.fromkeys(query.completed))
+            if not completed_values:
+                return []
+            if len(completed_values) == 1:
+                ref = ref.where(filter=self.field_filter('is_completed', '==', completed_values[0]))
+        has_in_clause = False
+        for field, values in (('account', query.accounts), ('campaign', query.campaigns)):
+            if values is None:
+                continue
+            values = list(dict.fromkeys(values))
+            if not values:
+                return []
+            if not has_in_clause and len(values) <= FIRESTORE_IN_LIMIT:
+                ref = ref.where(filter=self.field_filter(field, 'in', values))
+                has_in_clause = True
+            else:
+                fully_pushed = False
+        has_range = query.due_from is not None or query.due_until is not None
+        if query.due_from is not None:
+            ref = ref.where(filter=self.field_filter('due_date', '>=', datetime.combine(query.due_from, datetime.min.time())))
+        if query.due_until is not None:
+            ref = ref.where(filter=self.field_filter('due_date', '<=', datetime.combine(query.due_until, datetime.min.time())))
+        if query.order_by and not (has_range and query.order_by != 'due_date'):
+            ref = ref.order_by(query.order_by, direction=FIRESTORE_DESCENDING if query.descending else FIRESTORE_ASCENDING)
+            if fully_pushed and query.start_after:
+                ref = ref.start_after(self.db.collection(collection).document(query.start_after[1]).get())
+            if fully_pushed and query.limit:
+                ref = ref.limit(query.limit)
+            elif query.limit and not query.start_after:
+                return self.query_in_pages(ref, query)
+        elif query.order_by or query.start_after:
+            fully_pushed = False
+        if fully_pushed and query.limit and not query.order_by and not query.start_after:
+            ref = ref.limit(query.limit)
+        return apply_task_query([Task.from_firestore(doc.to_dict()) for doc in ref.stream()], query)
+
+    def query_in_pages(self, ref, query):
+        """Reads an ordered query a page at a time, finishing the filters Firestore couldn't apply in Python,
+        until `query.limit` tasks match; a first page of the newest archived tasks doesn't read the whole archive."""
+        filters = query._replace(order_by=None, limit=None, descending=None)
+        page_size = max(query.limit, FIRESTORE_QUERY_PAGE_SIZE)
+        result, last = [], None
+        while len(result) < query.limit:
+            snapshots = list((ref.start_after(last) if last is not None else ref).limit(page_size).stream())
+            result += apply_task_query([Task.from_firestore(doc.to_dict()) for doc in snapshots], filters)
+            if len(snapshots) < page_size:
+                break
+            last = snapshots[-1]
+        return result[:query.limit]
+
+    def iter_tasks(self):
+        for doc in self.db.collection(TASK_COLLECTION).stream():
+            yield Task.from_firestore(doc.to_dict())
+
+    def save_tasks(self, tasks):
+        tasks_ref = self.db.collection(TASK_COLLECTION)
+        self.commit_in_batches(('set', tasks_ref.document(t.id), t.to_firestore()) for t in tasks)
+
+    def save_task(self, task):
+        self.db.collection(TASK_COLLECTION).document(task.id).set(task.to_firestore())
+
+    def delete_task(self, task_id):
+        self.db.collection(TASK_COLLECTION).document(task_id).delete()
+
+    def move_tasks(self, task_ids, source, target, keep=None):
+        """Copies each task `keep` accepts to `target` and deletes it from `source`, in a transaction that read it,
+        so a task is never lost or doubled and one written meanwhile is checked again; returns the ids moved."""
+        source_ref, target_ref = self.db.collection(source), self.db.collection(target)
+        task_ids = list(task_ids)
+        moved = []
+        # A move is two writes, so half a transaction's worth of tasks per commit
+        for start in range(0, len(task_ids), FIRESTORE_BATCH_LIMIT // 2):
+            chunk = task_ids[start:start + FIRESTORE_BATCH_LIMIT // 2]
+
+            def move_chunk(transaction):
+                chunk_moved = []
+                for snap in transaction.get_all([source_ref.document(task_id) for task_id in chunk]):
+                    if snap.exists and (keep is None or keep(Task.from_firestore(snap.to_dict()))):
+                        transaction.set(target_ref.document(snap.id), snap.to_dict())
+                        transaction.delete(source_ref.document(snap.id))
+                        chunk_moved.append(snap.id)
+                return chunk_moved
+
+            moved += self.run_transaction(move_chunk)
+        return moved
+
+    def archive_tasks(self, task_ids, archivable=None):
+        return self.move_tasks(task_ids, TASK_COLLECTION, ARCHIVE_COLLECTION, archivable)
+
+    def restore_tasks(self, task_ids):
+        return self.move_tasks(task_ids, ARCHIVE_COLLECTION, TASK_COLLECTION)
+
+    def query_archived_tasks(self, query):
+        return self.query_tasks(query, ARCHIVE_COLLECTION)
+
+    def apply_task_writes(self, operations, applied=None):
+        """Each chunk of up to 500 writes runs in one transaction: read the stored versions, resolve, write.
+        Firestore retries the transaction if any of those documents changes before it commits."""
+        tasks_ref = self.db.collection(TASK_COLLECTION)
+        conflicts = []
+        for start in range(0, len(operations), FIRESTORE_BATCH_LIMIT):
+            chunk = operations[start:start + FIRESTORE_BATCH_LIMIT]
+
+            def write_chunk(transaction):
+                refs = [tasks_ref.document(task_id) for op, task_id, _, _ in chunk if op != 'delete']
+                snapshots = transaction.get_all(refs) if refs else []
+                stored = {snap.id: Task.from_firestore(snap.to_dict()) for snap in snapshots if snap.exists}
+                chunk_conflicts, chunk_applied = [], []
+                for op, task_id, task, base in chunk:
+                    if op == 'delete':
+                        transaction.delete(tasks_ref.document(task_id))
+                        chunk_applied.append((task_id, None, None))
+                        continue
+                    resolved, conflict = resolve_task_write(task, base, stored.get(task_id))
+                    if resolved is not None:
+                        transaction.set(tasks_ref.document(task_id), resolved.to_firestore())
+                        chunk_applied.append((task_id, stored.get(task_id), resolved))
+                    if conflict:
+                        chunk_conflicts.append(conflict)
+                return chunk_conflicts, chunk_applied
+
+            # Built per attempt, so a retried transaction doesn't report its writes twice
+            chunk_conflicts, chunk_applied = self.run_transaction(write_chunk)
+            conflicts += chunk_conflicts
+            if applied is not None:
+                applied += chunk_applied
+        return conflicts
+
+    @staticmethod
+    def field_filter(field, op, value):
+        from firebase_admin import firestore
+        return firestore.FieldFilter(field, op, value)
+
+    def run_transaction(self, func):
+        """Calls func(transaction) in a transaction, which Firestore retries if a document it read changes before commit."""
+        from firebase_admin import firestore
+        return firestore.transactional(func)(self.db.transaction())
+
+    def append_audit_records(self, records):
+        """Groups records by day into batch documents of up to AUDIT_RECORDS_PER_DOCUMENT, so a flush costs a
+        few document writes rather than one per record. Each batch is numbered from the sequence counter in
+        the same transaction that writes it, so batches become visible in sequence order."""
+        days = {}
+        for record in records:
+            days.setdefault(record['ts'][:10], []).append(record)
+        batches = [(day, day_records[start:start + AUDIT_RECORDS_PER_DOCUMENT])
+                   for day, day_records in days.items() for start in range(0, len(day_records), AUDIT_RECORDS_PER_DOCUMENT)]
+        sequence_ref = self.db.document(AUDIT_SEQUENCE_DOC_REF)
+        # Two writes per batch (segment and batch document) plus the counter must fit one transaction
+        group_size = (FIRESTORE_BATCH_LIMIT - 1) // 2
+        for start in range(0, len(batches), group_size):
+            group = batches[start:start + group_size]
+
+            def append_group(transaction):
+                snapshot = next(iter(transaction.get_all([sequence_ref])))
+                last_seq = snapshot.to_dict().get('last', 0) if snapshot.exists else 0
+                for seq, (day, chunk) in enumerate(group, start=last_seq + 1):
+                    segment_ref = self.db.collection(AUDIT_COLLECTION).document(day)
+                    timestamps = [r['ts'] for r in chunk]
+                    transaction.set(segment_ref, {'day': day}, merge=True)
+                    transaction.set(segment_ref.collection(AUDIT_BATCH_COLLECTION).document(f"{seq:012d}"),
+                                    {'seq': seq, 'first_ts': min(timestamps), 'last_ts': max(timestamps), 'records': chunk})
+                transaction.set(sequence_ref, {'last': last_seq + len(group)})
+
+            self.run_transaction(append_group)
+
+    def read_audit_records(self, after=None, until=None):
+        """Reads only the day segments overlapping the range, and within them only batches that can hold matching records."""
+        days = sorted(doc.id for doc in self.db.collection(AUDIT_COLLECTION).stream())
+        for day in days:
+            if (after and day < after[:10]) or (until and day > until[:10]):
+                continue
+            batches = self.db.collection(AUDIT_COLLECTION).document(day).collection(AUDIT_BATCH_COLLECTION)
+            if after:
+                batches = batches.where(filter=self.field_filter('last_ts', '>', after))
+            batch_docs = sorted((doc.to_dict() for doc in batches.stream()), key=lambda b: b['seq'])
+            records = [r for b in batch_docs for r in b['records'] if (not after or r['ts'] > after) and (not until or r['ts'] <= until)]
+            yield from sorted(records, key=lambda r: r['ts'])
+
+    def read_audit_feed(self, after=0, limit=AUDIT_FEED_PAGE_SIZE):
+        """`limit` counts batch documents here; a batch is read whole, so its seq is a safe cursor."""
+        query = self.db.collection_group(AUDIT_BATCH_COLLECTION).where(filter=self.field_filter('seq', '>', after)).order_by('seq').limit(limit)
+        return [(batch['seq'], record) for batch in (doc.to_dict() for doc in query.stream()) for record in batch['records']]
+
+    def last_audit_sequence(self):
+        snapshot = self.db.document(AUDIT_SEQUENCE_DOC_REF).get()
+        return snapshot.to_dict().get('last', 0) if snapshot.exists else 0
+
+    def load_users(self):
+        doc = self.db.document(USER_DOC_REF).get()
+        data = doc.to_dict() if doc.exists else None
+        return data.get('users') if data else None
+
+    def save_users(self, users_dict):
+        self.db.document(USER_DOC_REF).set({'users': users_dict})
+
+    def load_categories(self):
+        doc = self.db.document(CATEGORY_DOC_REF).get()
+        return (doc.to_dict() or None) if doc.exists else None
+
+    def save_categories(self, categories_dict):
+        self.db.document(CATEGORY_DOC_REF).set(categories_dict)
+
+    def subscribe(self, cache):
+        def on_users_snapshot(docs, _changes, _read_time):
+            data = docs[0].to_dict() if docs and docs[0].exists else None
+            if data and data.get('users'):
+                cache.replace_users(data['users'])
+
+        def on_categories_snapshot(docs, _changes, _read_time):
+            data = docs[0].to_dict() if docs and docs[0].exists else None
+            if data:
+                cache.replace_categories(data)
+
+        self.watches = [
+            self.db.document(USER_DOC_REF).on_snapshot(on_users_snapshot),
+            self.db.document(CATEGORY_DOC_REF).on_snapshot(on_categories_snapshot),
+        ]
+        self.task_watches = {}
+        return True
 
-def load_tasks_from_db():
-    initialize_firebase()
-    db = st.session_state.db
+    def watch_tasks(self, cache, owner_id=None):
+        query = self.db.collection(TASK_COLLECTION)
+        if owner_id is not None:
+            query = query.where(filter=self.field_filter('owner_id', '==', owner_id))
+
+        def on_tasks_snapshot(_docs, changes, _read_time):
+            get_metrics().record_io('read', len(changes))
+            upserts = [Task.from_firestore(c.document.to_dict()) for c in changes if c.type.name != 'REMOVED']
+            removed_ids = [c.document.id for c in changes if c.type.name == 'REMOVED']
+            # In an owner-scoped watch REMOVED may only mean "reassigned", so let the cache check the owner
+            cache.apply_task_changes(upserts, removed_ids, removed_from_owner=owner_id)
+
+        if owner_id is None:
+            # One collection-wide listener supersedes all the per-owner ones
+            for watch in self.task_watches.values():
+                watch.unsubscribe()
+            self.task_watches.clear()
+        self.task_watches[owner_id] = query.on_snapshot(on_tasks_snapshot)
+
+# Columns the dashboard filters on are real, indexed columns; anything else rides along in `extra`.
+SQLITE_TASK_COLUMNS = list(Task.FIELDS)
+SQLITE_INDEXED_COLUMNS = ['owner_id', 'account', 'campaign', 'is_completed', 'due_date']
+# Serves the per-owner dashboard and calendar queries, ordered or bounded by due date, from one index
+SQLITE_COMPOSITE_INDEXES = {'owner_due_date': ('owner_id', 'due_date', 'id')}
+SQLITE_CHANGE_LOG_RETENTION = 10000
+SQLITE_SCAN_PAGE_SIZE = 1000
+# Columns added after the first release; older databases get them on open
+SQLITE_ADDED_COLUMNS = {'revision': "INTEGER NOT NULL DEFAULT 0", 'updated_at': "TEXT"}
+# Explicit column list: ALTER TABLE appends columns, so positional inserts would misalign on migrated files
+SQLITE_TASK_TABLE_DEFINITION = (
+    "id TEXT PRIMARY KEY, title TEXT NOT NULL DEFAULT '', description TEXT, due_date TEXT, "
+    "type TEXT, owner_id TEXT, is_completed INTEGER NOT NULL DEFAULT 0, account TEXT, "
+    "campaign TEXT, priority TEXT, revision INTEGER NOT NULL DEFAULT 0, updated_at TEXT, extra TEXT"
+)
+SQLITE_ARCHIVE_TABLE = 'archived_tasks'
+SQLITE_ARCHIVE_INDEXED_COLUMNS = ['owner_id', 'due_date']
+SQLITE_INSERT_TASK = f"INSERT OR REPLACE INTO tasks ({', '.join(SQLITE_TASK_COLUMNS + ['extra'])}) VALUES ({', '.join('?' * (len(SQLITE_TASK_COLUMNS) + 1))})"
+
+def json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class SQLiteBackend(StorageBackend):
+    """Local single-file engine for offline use, development and load tests."""
+    name = 'sqlite'
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        # Streamlit serves sessions from several threads; one connection guarded by a lock is enough here.
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS tasks ({SQLITE_TASK_TABLE_DEFINITION})")
+            existing_columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(tasks)")}
+            for column, definition in SQLITE_ADDED_COLUMNS.items():
+                if column not in existing_columns:
+                    self.conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {definition}")
+            for column in SQLITE_INDEXED_COLUMNS:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_{column} ON tasks({column})")
+            for name, columns in SQLITE_COMPOSITE_INDEXES.items():
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_{name} ON tasks({', '.join(columns)})")
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {SQLITE_ARCHIVE_TABLE} ({SQLITE_TASK_TABLE_DEFINITION})")
+            for column in SQLITE_ARCHIVE_INDEXED_COLUMNS:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{SQLITE_ARCHIVE_TABLE}_{column} ON {SQLITE_ARCHIVE_TABLE}({column})")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS documents (name TEXT PRIMARY KEY, body TEXT NOT NULL)")
+            # Append-only; `day` is the segment, so range reads and pruning only touch the days involved
+            self.conn.execute("CREATE TABLE IF NOT EXISTS audit_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, day TEXT NOT NULL, ts TEXT NOT NULL, body TEXT NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_day_ts ON audit_log(day, ts)")
+            # Every write appends here so other processes' caches can pull just the rows that changed.
+            self.conn.execute("CREATE TABLE IF NOT EXISTS changes (version INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, key TEXT NOT NULL)")
+
+    @staticmethod
+    def task_to_row(task):
+        return (
+            task.id, task.title, task.description,
+            task.due_date.isoformat() if isinstance(task.due_date, date) else None,
+            task.type, task.owner_id, int(bool(task.is_completed)),
+            task.account, task.campaign, task.priority, task.revision,
+            task.updated_at.isoformat() if isinstance(task.updated_at, datetime) else None,
+            json.dumps(task.extra, default=json_default) if task.extra else None,
+        )
+
+    @staticmethod
+    def row_to_task(row):
+        return Task(
+            row['id'], row['title'], row['description'],
+            date.fromisoformat(row['due_date']) if row['due_date'] else None,
+            row['type'], row['owner_id'], bool(row['is_completed']),
+            row['account'], row['campaign'], row['priority'], row['revision'],
+            datetime.fromisoformat(row['updated_at']) if row['updated_at'] else None,
+            json.loads(row['extra']) if row['extra'] else None,
+        )
+
+    def record_changes(self, kind, keys):
+        """Appends to the change log; must run inside the write's transaction."""
+        self.conn.executemany("INSERT INTO changes (kind, key) VALUES (?, ?)", ((kind, key) for key in keys))
+        self.conn.execute("DELETE FROM changes WHERE version <= (SELECT MAX(version) FROM changes) - ?", (SQLITE_CHANGE_LOG_RETENTION,))
+
+    def change_version(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(MAX(version), 0) FROM changes").fetchone()[0]
+
+    def changes_since(self, version):
+        with self.lock:
+            oldest = self.conn.execute("SELECT MIN(version) FROM changes").fetchone()[0]
+            if oldest is not None and version < oldest - 1:
+                return None
+            rows = self.conn.execute("SELECT version, kind, key FROM changes WHERE version > ? ORDER BY version", (version,)).fetchall()
+        latest = rows[-1]['version'] if rows else version
+        return latest, {r['key'] for r in rows if r['kind'] == 'task'}, {r['key'] for r in rows if r['kind'] == 'document'}
+
+    def load_tasks(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM tasks").fetchall()
+        return [self.row_to_task(r) for r in rows] or None
+
+    def query_tasks(self, query, table='tasks'):
+        clauses, params = [], []
+        if query.owner_id is not None:
+            clauses.append("owner_id = ?")
+            params.append(query.owner_id)
+        for column, values in (('account', query.accounts), ('campaign', query.campaigns), ('is_completed', query.completed)):
+            if values is None:
+                continue
+            values = [int(bool(v)) for v in values] if column == 'is_completed' else list(values)
+            if not values:
+                return []
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        if query.due_from is not None:
+            clauses.append("due_date >= ?")
+            params.append(query.due_from.isoformat())
+        if query.due_until is not None:
+            clauses.append("due_date <= ?")
+            params.append(query.due_until.isoformat())
+        order_column = query.order_by if query.order_by in TASK_QUERY_ORDER_FIELDS else None
+        if query.start_after:
+            cursor_value, cursor_id = query.start_after
+            if isinstance(cursor_value, date): cursor_value = cursor_value.isoformat()
+            # NULL sorts first ascending and last descending, as in apply_task_query
+            if not order_column:
+                clauses.append("id < ?" if query.descending else "id > ?")
+                params.append(cursor_id)
+            elif query.descending and cursor_value is None:
+                clauses.append(f"({order_column} IS NULL AND id < ?)")
+                params.append(cursor_id)
+            elif query.descending:
+                clauses.append(f"({order_column} < ? OR {order_column} IS NULL OR ({order_column} = ? AND id < ?))")
+                params.extend([cursor_value, cursor_value, cursor_id])
+            elif cursor_value is None:
+                clauses.append(f"(({order_column} IS NULL AND id > ?) OR {order_column} IS NOT NULL)")
+                params.append(cursor_id)
+            else:
+                clauses.append(f"({order_column} > ? OR ({order_column} = ? AND id > ?))")
+                params.extend([cursor_value, cursor_value, cursor_id])
+        sql = f"SELECT * FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if order_column or query.start_after or query.limit:
+            direction = " DESC" if query.descending else ""
+            sql += f" ORDER BY {order_column + direction + ', ' if order_column else ''}id{direction}"
+        if query.limit:
+            sql += " LIMIT ?"
+            params.append(query.limit)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self.row_to_task(r) for r in rows]
+
+    def iter_tasks(self, page_size=SQLITE_SCAN_PAGE_SIZE):
+        """Keyset-paged scan; the lock is held per page, not for the whole export."""
+        last_id = ''
+        while True:
+            with self.lock:
+                rows = self.conn.execute("SELECT * FROM tasks WHERE id > ? ORDER BY id LIMIT ?", (last_id, page_size)).fetchall()
+            yield from (self.row_to_task(r) for r in rows)
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]['id']
+
+    def load_tasks_by_ids(self, task_ids):
+        task_ids = list(task_ids)
+        if not task_ids:
+            return {}
+        with self.lock:
+            rows = self.conn.execute(f"SELECT * FROM tasks WHERE id IN ({', '.join('?' * len(task_ids))})", task_ids).fetchall()
+        return {r['id']: self.row_to_task(r) for r in rows}
+
+    def save_tasks(self, tasks):
+        rows = [self.task_to_row(t) for t in tasks]
+        with self.lock, self.conn:
+            self.conn.executemany(SQLITE_INSERT_TASK, rows)
+            self.record_changes('task', (row[0] for row in rows))
+
+    def save_task(self, task):
+        self.save_tasks([task])
+
+    def delete_task(self, task_id):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            self.record_changes('task', [task_id])
+
+    def apply_task_writes(self, operations, applied=None):
+        """Reads, resolves and writes the whole batch in one IMMEDIATE transaction, so other processes can't interleave."""
+        deleted_ids = [(task_id,) for op, task_id, _, _ in operations if op == 'delete']
+        rows, conflicts = [], []
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            stored = self.load_tasks_by_ids(task_id for op, task_id, _, _ in operations if op != 'delete')
+            for op, task_id, task, base in operations:
+                if op == 'delete':
+                    continue
+                resolved, conflict = resolve_task_write(task, base, stored.get(task_id))
+                if resolved is not None:
+                    rows.append(self.task_to_row(resolved))
+                    if applied is not None:
+                        applied.append((task_id, stored.get(task_id), resolved))
+                if conflict:
+                    conflicts.append(conflict)
+            self.conn.executemany(SQLITE_INSERT_TASK, rows)
+            self.conn.executemany("DELETE FROM tasks WHERE id = ?", deleted_ids)
+            self.record_changes('task', [row[0] for row in rows] + [task_id for (task_id,) in deleted_ids])
+        if applied is not None:
+            applied += [(task_id, None, None) for (task_id,) in deleted_ids]
+        return conflicts
+
+    def append_audit_records(self, records):
+        rows = [(r['ts'][:10], r['ts'], json.dumps(r, separators=(',', ':'), default=json_default)) for r in records]
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO audit_log (day, ts, body) VALUES (?, ?, ?)", rows)
+
+    def read_audit_records(self, after=None, until=None, page_size=SQLITE_SCAN_PAGE_SIZE):
+        """Keyset-paged by (ts, seq); the day bounds let the (day, ts) index skip whole segments."""
+        clauses, params = [], []
+        if after:
+            clauses.append("day >= ?")
+            params.append(after[:10])
+        if until:
+            clauses += ["day <= ?", "ts <= ?"]
+            params += [until[:10], until]
+        last_ts, last_seq = after or '', -1
+        while True:
+            where = " AND ".join(clauses + ["(ts > ? OR (ts = ? AND seq > ?))"])
+            with self.lock:
+                rows = self.conn.execute(f"SELECT seq, ts, body FROM audit_log WHERE {where} ORDER BY ts, seq LIMIT ?",
+                                         params + [last_ts, last_ts if last_seq >= 0 else None, last_seq, page_size]).fetchall()
+            yield from (json.loads(r['body']) for r in rows)
+            if len(rows) < page_size:
+                return
+            last_ts, last_seq = rows[-1]['ts'], rows[-1]['seq']
+
+    def read_audit_feed(self, after=0, limit=AUDIT_FEED_PAGE_SIZE):
+        # seq is assigned inside the write transaction, and SQLite has one writer at a time
+        with self.lock:
+            rows = self.conn.execute("SELECT seq, body FROM audit_log WHERE seq > ? ORDER BY seq LIMIT ?", (after, limit)).fetchall()
+        return [(r['seq'], json.loads(r['body'])) for r in rows]
+
+    def last_audit_sequence(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM audit_log").fetchone()[0]
+
+    def move_tasks(self, task_ids, source, target, keep=None):
+        """Moves the rows `keep` accepts, as read inside the transaction, between the active and archive tables;
+        logged as task changes so other processes' caches drop or pick them up. Returns the ids moved."""
+        task_ids = list(task_ids)
+        columns = ', '.join(SQLITE_TASK_COLUMNS + ['extra'])
+        moved = []
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            for start in range(0, len(task_ids), SQLITE_SCAN_PAGE_SIZE):
+                requested = task_ids[start:start + SQLITE_SCAN_PAGE_SIZE]
+                rows = self.conn.execute(f"SELECT {columns} FROM {source} WHERE id IN ({', '.join('?' * len(requested))})", requested).fetchall()
+                chunk = [row['id'] for row in rows if keep is None or keep(self.row_to_task(row))]
+                if not chunk:
+                    continue
+                placeholders = ', '.join('?' * len(chunk))
+                self.conn.execute(f"INSERT OR REPLACE INTO {target} ({columns}) SELECT {columns} FROM {source} WHERE id IN ({placeholders})", chunk)
+                self.conn.execute(f"DELETE FROM {source} WHERE id IN ({placeholders})", chunk)
+                moved += chunk
+            self.record_changes('task', moved)
+        return moved
+
+    def archive_tasks(self, task_ids, archivable=None):
+        return self.move_tasks(task_ids, 'tasks', SQLITE_ARCHIVE_TABLE, archivable)
+
+    def restore_tasks(self, task_ids):
+        return self.move_tasks(task_ids, SQLITE_ARCHIVE_TABLE, 'tasks')
+
+    def query_archived_tasks(self, query):
+        return self.query_tasks(query, SQLITE_ARCHIVE_TABLE)
+
+    def load_document(self, name):
+        with self.lock:
+            row = self.conn.execute("SELECT body FROM documents WHERE name = ?", (name,)).fetchone()
+        return json.loads(row['body']) if row else None
+
+    def save_document(self, name, body):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO documents VALUES (?, ?)", (name, json.dumps(body, default=json_default)))
+            self.record_changes('document', [name])
+
+    def load_users(self): return self.load_document('users')
+    def save_users(self, users_dict): self.save_document('users', users_dict)
+    def load_categories(self): return self.load_document('categories')
+    def save_categories(self, categories_dict): self.save_document('categories', categories_dict)
+
+STORAGE_READ_METHODS = ('load_tasks', 'query_tasks', 'query_archived_tasks', 'load_tasks_by_ids', 'load_users', 'load_categories')
+STORAGE_WRITE_METHODS = ('save_tasks', 'save_task', 'delete_task', 'apply_task_writes', 'archive_tasks', 'restore_tasks',
+                         'append_audit_records', 'save_users', 'save_categories')
+STORAGE_SINGLE_DOC_METHODS = ('load_users', 'load_categories', 'save_users', 'save_categories', 'save_task', 'delete_task')
+
+class InstrumentedStorage:
+    """Wraps a StorageBackend: times every read and write as span `db.<method>` and counts
+    the calls, documents and (estimated) bytes moved. Everything else passes straight through."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+
+    def __getattr__(self, attr):
+        value = getattr(self.backend, attr)
+        if attr in STORAGE_READ_METHODS:
+            return self.instrument(attr, value, 'read')
+        if attr in STORAGE_WRITE_METHODS:
+            return self.instrument(attr, value, 'write')
+        return value
+
+    @staticmethod
+    def instrument(method_name, method, kind):
+        @functools.wraps(method)
+        def wrapper(*args):
+            metrics = get_metrics()
+            with metrics.span(f'db.{method_name}'):
+                result = method(*args)
+            payload = result if kind == 'read' else args[0]
+            if payload is None:
+                docs = 0
+            elif method_name in STORAGE_SINGLE_DOC_METHODS:
+                docs = 1
+            else:
+                docs = len(payload)
+            metrics.record_io(kind, docs, payload_size(payload) if docs else 0)
+            return result
+        return wrapper
+
+def create_storage_backend():
+    backend_name = get_storage_setting('storage_backend', DEFAULT_STORAGE_BACKEND)
+    if backend_name == 'sqlite':
+        return SQLiteBackend(get_storage_setting('sqlite_path', DEFAULT_SQLITE_PATH))
+    if backend_name == 'firestore':
+        return FirestoreBackend(get_firestore_client())
+    raise ValueError(f"Unknown storage backend '{backend_name}' (expected 'firestore' or 'sqlite').")
+
+@st.cache_resource
+def get_storage():
+    """Returns the configured storage backend, shared by every session in this process."""
+    return InstrumentedStorage(create_storage_backend())
+
+# --- WRITE-BEHIND QUEUE ---
+
+WRITE_BEHIND_WINDOW_SECONDS = 0.5
+WRITE_BEHIND_MAX_BACKOFF_SECONDS = 30
+WRITE_BEHIND_SHUTDOWN_TIMEOUT_SECONDS = 10
+
+class WriteBehindQueue:
+    """Coalesces per-task writes for a short window and flushes them in batches from a background thread.
+
+    A later mutation of the same task replaces the pending one, so ticking ten
+    tasks in a row costs one batched write rather than ten blocking round trips.
+    Failed flushes are retried with exponential backoff; writes are never dropped.
+    Each pending write remembers the version its edit started from and who made
+    it, so conflicts the storage layer reports can be handed back to that user
+    and the writes that landed can be attributed in the audit log.
+    """
+
+    def __init__(self, storage, window_seconds=WRITE_BEHIND_WINDOW_SECONDS, audit_log=None):
+        self.storage = storage
+        self.audit_log = audit_log
+        self.window_seconds = window_seconds
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.in_flight = set()  # Ids of the batch being written; back in `pending` too while it waits to retry
+        self.last_error = None
+        self.conflicts = {}  # author -> [TaskConflict]
+        self.flush_requested = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="taskflow-write-behind", daemon=True)
+        self.thread.start()
+
+    def enqueue(self, task_id, operation, task=None, base=None, author=None):
+        with self.condition:
+            previous = self.pending.get(task_id)
+            if previous is not None and previous[0] == 'set':
+                base = previous[2]  # Coalesced edits still diff against the version the first one started from
+            self.pending[task_id] = (operation, task, base, author)
+            self.condition.notify_all()
+
+    def enqueue_save(self, task, base=None, author=None):
+        self.enqueue(task.id, 'set', task, base, author)
+
+    def enqueue_delete(self, task_id, author=None):
+        self.enqueue(task_id, 'delete', author=author)
+
+    def take_conflicts(self, author):
+        with self.condition:
+            return self.conflicts.pop(author, [])
+
+    def pending_task_ids(self):
+        """Ids of tasks with a write queued or being written."""
+        with self.condition:
+            return self.pending.keys() | self.in_flight
+
+    def pending_count(self):
+        return len(self.pending_task_ids())
+
+    def take_batch(self):
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+        self.flush_requested.wait(self.window_seconds)  # Let more clicks land in the same batch
+        with self.condition:
+            batch, self.pending = self.pending, {}
+            self.in_flight = set(batch)
+        return batch
+
+    def run(self):
+        backoff = self.window_seconds
+        while True:
+            batch = self.take_batch()
+            try:
+                applied = []
+                conflicts = self.storage.apply_task_writes([(op, task_id, task, base) for task_id, (op, task, base, _) in batch.items()], applied)
+                if self.audit_log:
+                    self.audit_log.record(audit_records_for_writes(applied, {task_id: entry[3] for task_id, entry in batch.items()}))
+                with self.condition:
+                    for conflict in conflicts:
+                        self.conflicts.setdefault(batch[conflict.task_id][3], []).append(conflict)
+                self.last_error = None
+                backoff = self.window_seconds
+            except Exception as e:
+                self.last_error = str(e)
+                with self.condition:
+                    for task_id, operation in batch.items():
+                        self.pending.setdefault(task_id, operation)  # Anything queued meanwhile is newer
+                time.sleep(backoff)
+                backoff = min(backoff * 2, WRITE_BEHIND_MAX_BACKOFF_SECONDS)
+            finally:
+                with self.condition:
+                    self.in_flight = set()
+                    self.condition.notify_all()
+
+    def flush(self, timeout=WRITE_BEHIND_SHUTDOWN_TIMEOUT_SECONDS):
+        """Skips the coalescing window and waits until everything queued so far is written."""
+        self.flush_requested.set()
+        try:
+            with self.condition:
+                return self.condition.wait_for(lambda: not self.pending and not self.in_flight, timeout)
+        finally:
+            self.flush_requested.clear()
+
+@st.cache_resource
+def get_write_queue():
+    """Process-wide write-behind queue, flushed on interpreter shutdown."""
+    queue = WriteBehindQueue(get_storage(), audit_log=get_audit_log())
+    atexit.register(queue.flush)
+    return queue
+
+def sync_status_indicator():
+    queue = get_write_queue()
+    pending_count = queue.pending_count()
+    if queue.last_error:
+        st.warning(f"⚠️ {pending_count} change(s) waiting to sync, retrying: {queue.last_error}")
+    elif pending_count:
+        st.caption(f"⏳ {pending_count} change(s) pending sync")
+    else:
+        st.caption("✅ All changes saved")
+
+# --- AUDIT LOG ---
+
+# Fixed width, so timestamps sort as strings and their first 10 characters are the day segment
+AUDIT_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+AUDIT_FLUSH_RECORDS = 500
+AUDIT_FLUSH_INTERVAL_SECONDS = 2
+AUDIT_SYSTEM_ACTOR = 'system'
+
+def audit_timestamp(moment=None):
+    return (moment or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime(AUDIT_TIMESTAMP_FORMAT)
+
+def audit_value(value):
+    """Dates become ISO strings so a record is plain JSON in every engine."""
+    if isinstance(value, dict):
+        return {k: audit_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [audit_value(v) for v in value]
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+def audit_record(op, task_id, actor, before=None, after=None, moment=None):
+    """One delta: {'ts', 'op', 'task_id', 'actor'} plus, for 'put', the fields that changed.
+
+    'changes' maps field (or 'extra.<key>') to its new value and 'unset' lists
+    extra keys that were removed. A put with no `before` diffs against an
+    empty task and is marked 'full': replay needs nothing else to rebuild it.
+    """
+    record = {'ts': audit_timestamp(moment), 'op': op, 'task_id': task_id, 'actor': actor}
+    if op == 'put':
+        if before is None:
+            record['full'] = True
+        before = before or Task(task_id)
+        changes = task_changes(before, after)
+        changes.update({f: getattr(after, f) for f in ('revision', 'updated_at') if getattr(after, f) != getattr(before, f)})
+        record['changes'] = {f: audit_value(v) for f, v in changes.items() if v is not MISSING}
+        unset = [f for f, v in changes.items() if v is MISSING]
+        if unset:
+            record['unset'] = unset
+    return record
+
+def audit_records_for_writes(applied, actors, moment=None):
+    """Records for the (task_id, before, after) writes apply_task_writes reported; `actors` is one name or {task_id: name}."""
+    moment = moment or datetime.now(timezone.utc)
+    actor_of = actors.get if isinstance(actors, dict) else (lambda _task_id: actors)
+    return [audit_record('delete' if after is None else 'put', task_id, actor_of(task_id), before, after, moment)
+            for task_id, before, after in applied]
+
+def new_audit_state():
+    """Empty replay state: active and archived {id: fields}, and the ids known only from partial deltas."""
+    return {'tasks': {}, 'archived': {}, 'partial': set()}
+
+def replay_audit_records(records, state=None):
+    """Folds records into a replay state (see new_audit_state) and returns it.
+
+    Pass the returned state back in with the next records to follow the log
+    incrementally; audit_state_tasks turns either side back into Tasks. A put
+    for a task the state doesn't hold, that isn't 'full', only has the fields
+    it changed: such tasks are listed in state['partial'] until a full put.
+    """
+    state = state or new_audit_state()
+    active, archived, partial = state['tasks'], state['archived'], state['partial']
+    for record in records:
+        op, task_id = record['op'], record['task_id']
+        if op == 'put':
+            if record.get('full'):
+                fields = dict(record['changes'])
+                partial.discard(task_id)
+            else:
+                if task_id not in active:
+                    partial.add(task_id)
+                fields = {**active.get(task_id, {}), **record['changes']}
+            for key in record.get('unset', ()):
+                fields.pop(key, None)
+            active[task_id] = fields
+        elif op == 'delete':
+            active.pop(task_id, None)
+            archived.pop(task_id, None)
+            partial.discard(task_id)
+        elif op == 'archive' and task_id in active:
+            archived[task_id] = active.pop(task_id)
+        elif op == 'restore' and task_id in archived:
+            active[task_id] = archived.pop(task_id)
+    return state
+
+def audit_state_tasks(fields_by_id, skip=()):
+    """Tasks for one side of a replay state, leaving out the ids in `skip` (e.g. state['partial']).
+    Fields are stored as 'extra.<key>' and folded back here."""
+    tasks = []
+    for task_id, fields in fields_by_id.items():
+        if task_id in skip:
+            continue
+        data = {f[len('extra.'):] if f.startswith('extra.') else f: v for f, v in fields.items()}
+        task = Task.from_dict({**data, 'id': task_id})
+        if isinstance(task.due_date, str):
+            task.due_date = date.fromisoformat(task.due_date)
+        if isinstance(task.updated_at, str):
+            task.updated_at = datetime.fromisoformat(task.updated_at)
+        tasks.append(task)
+    return tasks
+
+def audit_feed_changes(records, state):
+    """Folds records into a replay `state` and returns (upserted Tasks, removed ids), the shape
+    apply_task_changes takes, so the log can drive incremental cache and index updates.
+
+    Tasks whose full state isn't known (see replay_audit_records) are never
+    upserted, since a Task rebuilt from a delta alone would be wrong; start
+    from a baseline state to cover tasks created before the feed.
+    """
+    records = list(records)
+    replay_audit_records(records, state)
+    touched = {r['task_id'] for r in records}
+    active = state['tasks']
+    return (audit_state_tasks({i: active[i] for i in touched if i in active}, state['partial']),
+            [i for i in touched if i not in active])
+
+class AuditLog:
+    """Buffers audit records and appends them to storage in batches from a background thread.
+
+    Records are kept in order and retried after a failed append, so the log
+    is never missing a write that storage accepted.
+    """
+
+    def __init__(self, storage, flush_records=AUDIT_FLUSH_RECORDS, interval=AUDIT_FLUSH_INTERVAL_SECONDS):
+        self.storage = storage
+        self.flush_records = flush_records
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.buffer = []
+        self.appending = 0
+        self.last_error = None
+        self.thread = threading.Thread(target=self.run, name="taskflow-audit", daemon=True)
+        self.thread.start()
+
+    def record(self, records):
+        if not records:
+            return
+        with self.condition:
+            self.buffer += records
+            if len(self.buffer) >= self.flush_records:
+                self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: len(self.buffer) >= self.flush_records, self.interval)
+                if not self.buffer:
+                    continue
+                batch, self.buffer = self.buffer, []
+                self.appending = len(batch)
+            try:
+                self.storage.append_audit_records(batch)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                with self.condition:
+                    self.buffer[:0] = batch  # Ahead of anything recorded meanwhile, to keep the order
+                time.sleep(self.interval)
+            finally:
+                with self.condition:
+                    self.appending = 0
+                    self.condition.notify_all()
+
+    def flush(self, timeout=WRITE_BEHIND_SHUTDOWN_TIMEOUT_SECONDS):
+        """Waits until everything recorded so far is appended."""
+        with self.condition:
+            self.flush_records, flush_records = 1, self.flush_records
+            self.condition.notify_all()
+            try:
+                return self.condition.wait_for(lambda: not self.buffer and not self.appending, timeout)
+            finally:
+                self.flush_records = flush_records
+
+@st.cache_resource
+def get_audit_log():
+    """Process-wide audit log, flushed on interpreter shutdown after the write queue."""
+    audit_log = AuditLog(get_storage())
+    atexit.register(audit_log.flush)
+    return audit_log
+
+# --- DATA STORAGE (PERSISTENT) ---
+
+def load_tasks_from_db(storage=None):
     try:
-        doc = db.document(TASK_DOC_REF).get()
-        tasks_from_db = []
-        max_id = 0
-        if doc.exists:
-            data = doc.to_dict()
-            tasks_from_db = data.get('tasks', [])
+        tasks_from_db = (storage or get_storage()).load_tasks()
         if tasks_from_db:
-            for task in tasks_from_db:
-                if task.get('due_date') and hasattr(task['due_date'], 'date'):
-                    task['due_date'] = task['due_date'].date()
-                if task.get('id', '').startswith('task_'):
-                    try:
-                        max_id = max(max_id, int(task['id'].split('_')[1]))
-                    except (ValueError, IndexError):
-                        pass
-            st.session_state.next_task_id = max_id + 1
             return tasks_from_db, False
         else:
-            st.session_state.next_task_id = len(INITIAL_MOCK_TASKS) + 1
-            return INITIAL_MOCK_TASKS, True
+            return [Task.from_dict(t) for t in INITIAL_MOCK_TASKS], True
     except Exception as e:
-        st.error(f"Failed to load tasks from Firestore: {e}")
-        st.session_state.next_task_id = 1
+        st.error(f"Failed to load tasks: {e}")
         return [], False
 
-def save_tasks_to_db(tasks):
-    initialize_firebase()
-    db = st.session_state.db
-    data_to_save = []
-    for task in tasks:
-        task_copy = task.copy()
-        due_date_value = task_copy.get('due_date')
-        if isinstance(due_date_value, datetime):
-            task_copy['due_date'] = due_date_value
-        elif isinstance(due_date_value, date):
-            task_copy['due_date'] = datetime.combine(due_date_value, datetime.min.time())
-        else:
-            task_copy['due_date'] = None
-        data_to_save.append(task_copy)
+def save_tasks_to_db(tasks, storage=None):
+    """Writes every task in one batch; used for bootstrap, not per-click saves."""
     try:
-        db.document(TASK_DOC_REF).set({'tasks': data_to_save})
+        (storage or get_storage()).save_tasks(tasks)
     except Exception as e:
-        st.error(f"Failed to save tasks to Firestore: {e}")
+        st.error(f"Failed to save tasks: {e}")
 
-def load_users_from_db():
-    initialize_firebase()
-    db = st.session_state.db
-    is_mock_user_data = False
-    try:
-        doc = db.document(USER_DOC_REF).get()
-        if doc.exists and doc.to_dict():
-            st.session_state.users = doc.to_dict().get('users', SIMPLIFIED_USER_CREDENTIALS)
-        else:
-            st.session_state.users = SIMPLIFIED_USER_CREDENTIALS
-            is_mock_user_data = True
-    except Exception as e:
-        st.error(f"Failed to load users from Firestore: {e}")
-        st.session_state.users = SIMPLIFIED_USER_CREDENTIALS
-    return is_mock_user_data
+def save_task_to_db(task, base=None):
+    """Queues the task for the write-behind flusher; returns without waiting on storage.
+    `base` is the version the edit started from, used to merge with concurrent edits."""
+    get_write_queue().enqueue_save(task, base, author=st.session_state.get('username'))
+
+def delete_task_from_db(task_id):
+    get_write_queue().enqueue_delete(task_id, author=st.session_state.get('username'))
 
 def save_users_to_db(users_dict, context=""):
-    initialize_firebase()
-    db = st.session_state.db
     try:
-        db.document(USER_DOC_REF).set({'users': users_dict})
+        get_storage().save_users(users_dict)
         if context:
             st.toast(f"User data saved: {context}.")
     except Exception as e:
-        st.error(f"Failed to save users to Firestore ({context}): {e}")
+        st.error(f"Failed to save users ({context}): {e}")
 
-def load_categories_from_db():
-    initialize_firebase()
-    db = st.session_state.db
+def load_categories_from_db(storage=None):
     try:
-        doc = db.document(CATEGORY_DOC_REF).get()
-        if doc.exists and doc.to_dict():
-            return doc.to_dict(), False
+        categories = (storage or get_storage()).load_categories()
+        if categories:
+            return categories, False
         else:
             return {'accounts': MOCK_ACCOUNTS, 'campaigns': MOCK_CAMPAIGNS}, True
     except Exception as e:
-        st.error(f"Failed to load categories from Firestore: {e}")
+        st.error(f"Failed to load categories: {e}")
         return {'accounts': MOCK_ACCOUNTS, 'campaigns': MOCK_CAMPAIGNS}, False
 
-def save_categories_to_db(categories_dict, context=""):
-    initialize_firebase()
-    db = st.session_state.db
+def save_categories_to_db(categories_dict, context="", storage=None):
     try:
-        db.document(CATEGORY_DOC_REF).set(categories_dict)
+        (storage or get_storage()).save_categories(categories_dict)
         if context:
             st.toast(f"Category data saved: {context}.")
     except Exception as e:
         st.error(f"Failed to save categories ({context}): {e}")
 
-# --- DATA SETUP ---
-
-def initialize_data():
-    if 'categories' not in st.session_state:
-        categories_dict, is_mock_category_data = load_categories_from_db()
-        st.session_state.categories = categories_dict
-        if is_mock_category_data:
-            save_categories_to_db(st.session_state.categories, "initial bootstrap")
+# --- TASK STORE ---
+
+WORD_PATTERN = re.compile(r'\w+')
+
+def search_terms(text):
+    """Lower-cased words of `text`, the unit both indexing and search queries work in."""
+    return set(WORD_PATTERN.findall((text or '').casefold()))
+
+class TextIndex:
+    """Inverted index over task titles and descriptions: term -> ids of the tasks containing it.
+
+    Prefix lookups bisect a sorted list of the terms. The list is built on the
+    first search and from then on kept sorted as terms come and go, so bulk
+    loads don't pay for it and single edits only shift one entry.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.sorted_terms = None
+
+    @staticmethod
+    def task_terms(task):
+        return search_terms(task.title) | search_terms(task.description)
+
+    def add(self, task_id, terms):
+        for term in terms:
+            ids = self.postings.get(term)
+            if ids is None:
+                ids = self.postings[term] = set()
+                if self.sorted_terms is not None:
+                    insort(self.sorted_terms, term)
+            ids.add(task_id)
+
+    def discard(self, task_id, terms):
+        for term in terms:
+            ids = self.postings.get(term)
+            if ids is not None:
+                ids.discard(task_id)
+                if not ids:
+                    del self.postings[term]
+                    if self.sorted_terms is not None:
+                        del self.sorted_terms[bisect_left(self.sorted_terms, term)]
+
+    def prefix_ids(self, prefix):
+        """Ids of tasks with a term starting with `prefix`."""
+        if self.sorted_terms is None:
+            self.sorted_terms = sorted(self.postings)
+        terms = self.sorted_terms
+        matches = []
+        for i in range(bisect_left(terms, prefix), len(terms)):
+            if not terms[i].startswith(prefix):
+                break
+            matches.append(self.postings[terms[i]])
+        if len(matches) == 1:
+            return matches[0]
+        return set().union(*matches)
+
+    def search(self, text):
+        """Ids of tasks matching every word of `text`, each as a prefix ("rep q3" finds "Q3 report"); None for a blank query."""
+        words = search_terms(text)
+        if not words:
+            return None
+        # Longest words first: they tend to have the fewest matches, so the intersection shrinks fast
+        matching_ids = None
+        for word in sorted(words, key=len, reverse=True):
+            ids = self.prefix_ids(word)
+            matching_ids = set(ids) if matching_ids is None else matching_ids & ids
+            if not matching_ids:
+                break
+        return matching_ids
+
+class TaskStore:
+    """Owns the task dicts: a hash index by id plus secondary indexes kept up to date on every mutation.
+
+    `select()` answers the dashboard filters with set intersections instead of
+    scanning every task, and `text` answers title/description searches.
+    Results come back in insertion order so sorting ties stay stable across
+    reruns.
+    """
+    INDEXED_FIELDS = ('owner_id', 'account', 'campaign', 'is_completed', 'priority', 'type')
+    FACET_FIELDS = ('account', 'campaign', 'priority', 'owner_id', 'type')
+
+    def __init__(self, tasks=()):
+        self.by_id = {}
+        self.positions = {}
+        self.next_position = 0
+        self.indexes = {field: {} for field in self.INDEXED_FIELDS}
+        self.text = TextIndex()
+        for task in tasks:
+            self.upsert(task)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, task_id):
+        return task_id in self.by_id
+
+    def get(self, task_id):
+        return self.by_id.get(task_id)
+
+    def all(self):
+        return list(self.by_id.values())
+
+    def upsert(self, task):
+        task_id = task.id
+        previous = self.by_id.get(task_id)
+        if previous is not None:
+            self.unindex(previous)
+            if previous.title != task.title or previous.description != task.description:
+                self.text.discard(task_id, TextIndex.task_terms(previous))
+                self.text.add(task_id, TextIndex.task_terms(task))
+        else:
+            self.positions[task_id] = self.next_position
+            self.next_position += 1
+            self.text.add(task_id, TextIndex.task_terms(task))
+        self.by_id[task_id] = task
+        for field, index in self.indexes.items():
+            index.setdefault(getattr(task, field), set()).add(task_id)
+
+    def remove(self, task_id):
+        previous = self.by_id.pop(task_id, None)
+        if previous is not None:
+            self.unindex(previous)
+            self.text.discard(task_id, TextIndex.task_terms(previous))
+            del self.positions[task_id]
+        return previous
+
+    def unindex(self, task):
+        for field, index in self.indexes.items():
+            value = getattr(task, field)
+            ids = index.get(value)
+            if ids is not None:
+                ids.discard(task.id)
+                if not ids:
+                    del index[value]
+
+    def ids_where(self, field, values):
+        """Ids of tasks whose `field` is one of `values`."""
+        index = self.indexes[field]
+        matches = [index[v] for v in values if v in index]
+        if len(matches) == 1:
+            return matches[0]
+        return set().union(*matches)
+
+    def matching_ids(self, text=None, **allowed_values):
+        """Ids of tasks matching the search `text` (None: any) whose indexed fields fall in `allowed_values`,
+        or None when nothing constrains them."""
+        constraints = [self.ids_where(field, values) for field, values in allowed_values.items() if values is not None]
+        text_ids = self.text.search(text) if text else None
+        if text_ids is not None:
+            constraints.append(text_ids)
+        if not constraints:
+            return None
+        constraints.sort(key=len)
+        return set(constraints[0]).intersection(*constraints[1:])
+
+    def select(self, text=None, **allowed_values):
+        """Tasks whose indexed fields all fall in the given collections, e.g.
+        select(owner_id=['bob'], account=['Nike', 'Puma']), and that match the search `text`.
+        Omitted or None means any value."""
+        matching_ids = self.matching_ids(text, **allowed_values)
+        if matching_ids is None:
+            return self.all()
+        return [self.by_id[task_id] for task_id in sorted(matching_ids, key=self.positions.__getitem__)]
+
+    def facet_counts(self, text=None, **allowed_values):
+        """{field: {value: count}} over FACET_FIELDS for the tasks select() would return."""
+        matching_ids = self.matching_ids(text, **allowed_values)
+        counts = {}
+        for field in self.FACET_FIELDS:
+            index = self.indexes[field]
+            if matching_ids is None:
+                counts[field] = {value: len(ids) for value, ids in index.items()}
+            else:
+                counts[field] = {value: len(matching_ids & ids) for value, ids in index.items()}
+        return counts
+
+    def query(self, query, text=None):
+        """Answers a TaskQuery: the indexes narrow the candidates, apply_task_query does the rest."""
+        candidates = self.select(
+            text, owner_id=None if query.owner_id is None else [query.owner_id],
+            account=query.accounts, campaign=query.campaigns, is_completed=query.completed,
+        )
+        return apply_task_query(candidates, query)
+
+# --- SHARED DATA CACHE ---
+
+DERIVED_CACHE_SIZE = 128
+# Categories, the empty-store probe and the first owner's tasks are read side by side
+BOOTSTRAP_WORKERS = 3
+
+def script_thread_pool(max_workers, name):
+    """A ThreadPoolExecutor whose threads share the current script run's context, so st.error/st.toast
+    raised by the storage helpers inside them still reach the page."""
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name,
+                              initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx))
+
+class SharedDataCache:
+    """The single in-memory copy of tasks, users and categories shared by every session.
+
+    Sessions never copy it: they read from here on each rerun. Tasks are loaded
+    lazily, one owner at a time (or all at once for team-wide views), with the
+    filtering done by the storage query; only loaded owners are kept fresh.
+    Firestore pushes changes in through snapshot listeners; backends that
+    cannot push (SQLite) are polled for deltas via their change counter in
+    `refresh()`. `version` increases whenever the task set changes, so derived
+    views can be memoized against it.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.lock = threading.RLock()
+        self.version = 0
+        self.tasks = TaskStore()
+        self.loaded_owners = set()
+        self.all_tasks_loaded = False
+        self.users = {}
+        self.users_by_email = {}
+        self.categories = {}
+        self.backend_version = None
+        self.is_loaded = False
+        self.is_push_synced = False
+        self.derived = OrderedDict()
+        self.notices = []  # (kind, message) for the UI; see take_notices
+        self.last_login_refresh = None  # monotonic time of the last refresh_for_login
+
+    def load_users(self):
+        """Reads the user store only - all the login screen needs.
+
+        This runs inside get_shared_cache, and Streamlit replays a cached
+        resource's element calls on every hit, so it must not touch the UI.
+        What the user should hear about is queued for take_notices instead.
+        """
+        backend_version = self.storage.change_version()
+        stored_users, is_load_failed = None, False
+        try:
+            stored_users = self.storage.load_users()
+        except Exception as e:
+            is_load_failed = True
+            self.add_notice('error', f"Failed to load users: {e}")
+        users, has_new_hashes = hash_user_pins(stored_users or SIMPLIFIED_USER_CREDENTIALS)
+        if is_load_failed:
+            pass  # Never write the fallback users over a store we couldn't read
+        elif not stored_users:
+            self.save_users(users, "initial user bootstrap")
+        elif has_new_hashes:
+            self.save_users(users, "PINs hashed")
+        self.replace_users(users)
+        with self.lock:
+            self.backend_version = backend_version
+
+    def save_users(self, users, context):
+        try:
+            self.storage.save_users(users)
+            self.add_notice('toast', f"User data saved: {context}.")
+        except Exception as e:
+            self.add_notice('error', f"Failed to save users ({context}): {e}")
+
+    def add_notice(self, kind, message):
+        with self.lock:
+            self.notices.append((kind, message))
+
+    def take_notices(self):
+        """Notices queued by UI-free loading code; the first session to ask shows them."""
+        with self.lock:
+            notices, self.notices = self.notices, []
+        return notices
+
+    @timed('bootstrap.load')
+    def load(self, owners=(), workers=BOOTSTRAP_WORKERS):
+        """Reads categories and bootstraps empty stores with the mock data; tasks load on demand.
+
+        The reads are independent, so they run concurrently, together with the
+        task queries for `owners` (None: everyone) when the caller already
+        knows whose tasks the first page shows. First paint then waits for the
+        slowest round trip rather than the sum of them.
+        """
+        with script_thread_pool(workers, "taskflow-bootstrap") as executor:
+            categories_future = executor.submit(load_categories_from_db, self.storage)
+            probe_future = executor.submit(self.storage.query_tasks, TaskQuery(limit=1))
+            owner_futures = {owner_id: executor.submit(self.storage.query_tasks, TaskQuery(owner_id=owner_id)) for owner_id in owners}
+            categories, is_mock_category_data = categories_future.result()
+            is_task_store_empty = not probe_future.result()
+            owner_tasks = {owner_id: future.result() for owner_id, future in owner_futures.items()}
+
+            bootstrap_saves = []
+            if is_mock_category_data:
+                bootstrap_saves.append(executor.submit(save_categories_to_db, categories, "initial bootstrap", self.storage))
+            if is_task_store_empty:
+                # Only an empty task store pays for the full read (legacy migration or mock bootstrap)
+                tasks, is_mock_data = load_tasks_from_db(self.storage)
+                if is_mock_data:
+                    bootstrap_saves.append(executor.submit(save_tasks_to_db, tasks, self.storage))
+                    st.toast("Initialized with mock tasks.")
+            wait(bootstrap_saves)
+
+        with self.lock:
+            self.categories = categories
+            self.tasks = TaskStore()
+            self.loaded_owners = set()
+            self.all_tasks_loaded = False
+            self.is_loaded = True
+            self.version += 1
+        if not is_task_store_empty:
+            # After a bootstrap the owners' queries ran against the empty store; they reload on first use
+            for owner_id, tasks in owner_tasks.items():
+                self.adopt_tasks(owner_id, tasks)
+
+    def ensure_loaded(self, owners=()):
+        """Loads categories (plus the tasks of `owners`) on first use; afterwards just makes sure those owners are loaded."""
+        with self.lock:
+            if not self.is_loaded:
+                self.load(owners)
+                return
+        for owner_id in owners:
+            self.ensure_tasks_loaded(owner_id)
+
+    def has_tasks_for(self, owner_id):
+        with self.lock:
+            return self.is_loaded and (self.all_tasks_loaded or owner_id in self.loaded_owners)
+
+    def ensure_tasks_loaded(self, owner_id=None):
+        """Loads one owner's tasks (None: everyone's) on first use and starts watching them."""
+        with self.lock:
+            if self.all_tasks_loaded or owner_id in self.loaded_owners:
+                return
+        self.adopt_tasks(owner_id, self.storage.query_tasks(TaskQuery(owner_id=owner_id)))
+
+    def adopt_tasks(self, owner_id, tasks):
+        """Installs a freshly queried task set for one owner (None: everyone) and starts watching it."""
+        with self.lock:
+            if owner_id is None:
+                self.tasks = TaskStore(tasks)
+                self.all_tasks_loaded = True
+            else:
+                for task in tasks:
+                    self.tasks.upsert(task)
+                self.loaded_owners.add(owner_id)
+            self.version += 1
+        if self.is_push_synced:
+            self.storage.watch_tasks(self, owner_id)
+
+    def is_tracked(self, task):
+        return self.all_tasks_loaded or task.owner_id in self.loaded_owners
+
+    def refresh(self):
+        """Pulls deltas written by other processes when the backend is polled rather than pushed."""
+        if self.is_push_synced or self.backend_version is None:
+            return
+        changes = self.storage.changes_since(self.backend_version)
+        if changes is None:
+            self.load_users()
+            self.load()
+            return
+        latest_version, task_ids, document_names = changes
+        if latest_version == self.backend_version:
+            return
+        changed_tasks = self.storage.load_tasks_by_ids(task_ids)
+        self.apply_task_changes(changed_tasks.values(), [i for i in task_ids if i not in changed_tasks])
+        if 'users' in document_names:
+            self.replace_users(self.storage.load_users() or self.users)
+        if 'categories' in document_names:
+            self.replace_categories(self.storage.load_categories() or self.categories)
+        self.backend_version = latest_version
+
+    def refresh_for_login(self, min_interval=LOGIN_REFRESH_INTERVAL_SECONDS):
+        """refresh() for a login whose email isn't known yet, at most once per `min_interval`, so a run
+        of bad emails costs at most one storage read per interval rather than one each."""
+        now = time.monotonic()
+        with self.lock:
+            if self.last_login_refresh is not None and now - self.last_login_refresh < min_interval:
+                return
+            self.last_login_refresh = now
+        self.refresh()
+
+    def apply_task_changes(self, upserts, removed_ids=(), removed_from_owner=None):
+        """Applies changes from storage. Tasks of owners that were never loaded are ignored, and a
+        removal scoped to `removed_from_owner` is skipped if the task has since moved to another owner."""
+        with self.lock:
+            for task in upserts:
+                if self.is_tracked(task):
+                    self.tasks.upsert(task)
+                else:
+                    self.tasks.remove(task.id)
+            for task_id in removed_ids:
+                current = self.tasks.get(task_id)
+                if removed_from_owner is None or (current is not None and current.owner_id == removed_from_owner):
+                    self.tasks.remove(task_id)
+            self.version += 1
+
+    def replace_users(self, users):
+        users_by_email = {user_data['email'].strip().lower(): username for username, user_data in users.items()}
+        with self.lock:
+            self.users = users
+            self.users_by_email = users_by_email
+
+    def find_username(self, email):
+        """O(1) login lookup by (case-insensitive) email."""
+        return self.users_by_email.get(email.strip().lower())
+
+    def replace_categories(self, categories):
+        with self.lock:
+            self.categories = categories
+
+    def all_tasks(self):
+        with self.lock:
+            return self.tasks.all()
+
+    def select_tasks(self, **allowed_values):
+        with self.lock:
+            return self.tasks.select(**allowed_values)
+
+    def query_tasks(self, query, text=None):
+        self.ensure_tasks_loaded(query.owner_id)
+        with self.lock:
+            return self.tasks.query(query, text)
+
+    def facet_counts(self, text=None, owner_id=None):
+        self.ensure_tasks_loaded(owner_id)
+        with self.lock:
+            return self.tasks.facet_counts(text, owner_id=None if owner_id is None else [owner_id])
+
+    def get_task(self, task_id):
+        return self.tasks.get(task_id)
+
+    def upsert_task(self, task):
+        """Stores a task. Callers pass a new Task (see Task.replace) rather than mutating the shared one."""
+        with self.lock:
+            if self.is_tracked(task):
+                self.tasks.upsert(task)
+            else:
+                self.tasks.remove(task.id)
+            self.version += 1
+
+    def remove_task(self, task_id):
+        with self.lock:
+            self.tasks.remove(task_id)
+            self.version += 1
+
+    def get_derived(self, key, compute, max_entries=DERIVED_CACHE_SIZE):
+        """Memoizes compute() under (key, version) in a small LRU, so derived views survive reruns
+        and are recomputed only after the task set changes."""
+        cache_key = (key, self.version)
+        with self.lock:
+            if cache_key in self.derived:
+                self.derived.move_to_end(cache_key)
+                return self.derived[cache_key]
+        value = compute()
+        with self.lock:
+            self.derived[cache_key] = value
+            while len(self.derived) > max_entries:
+                self.derived.popitem(last=False)
+        return value
+
+    @staticmethod
+    def allocate_task_id():
+        # Random rather than sequential: a partially loaded cache can't know the highest id in use
+        return f"task_{uuid.uuid4().hex[:12]}"
+
+@st.cache_resource
+def get_shared_cache():
+    """Process-wide data cache; starts with just the users, then is kept fresh by the storage backend."""
+    cache = SharedDataCache(get_storage())
+    cache.load_users()
+    cache.is_push_synced = cache.storage.subscribe(cache)
+    return cache
+
+# --- ARCHIVE TIER ---
+
+# Completed tasks idle this long, and one-time tasks this far past due, leave the active set.
+# Settings: archive_after_days / archive_stale_days (0 turns that rule off).
+DEFAULT_ARCHIVE_AFTER_DAYS = 30
+DEFAULT_ARCHIVE_STALE_DAYS = 365
+ARCHIVE_CHECK_INTERVAL_SECONDS = 6 * 60 * 60
+ARCHIVED_DISPLAY_LIMIT = 200
+
+def archive_policy():
+    """(archive_after_days, archive_stale_days) from the storage settings."""
+    return (int(get_storage_setting('archive_after_days', DEFAULT_ARCHIVE_AFTER_DAYS)),
+            int(get_storage_setting('archive_stale_days', DEFAULT_ARCHIVE_STALE_DAYS)))
+
+def is_archivable(task, today, after_days, stale_days):
+    """Completed tasks (finished series included) not due or edited in `after_days`, and open one-time tasks more than `stale_days` past due."""
+    due_date = task.due_date if isinstance(task.due_date, date) else None
+    if task.is_completed:
+        last_active = max(filter(None, [due_date, task.updated_at.date() if isinstance(task.updated_at, datetime) else None]), default=None)
+        return after_days > 0 and (last_active is None or last_active < today - timedelta(days=after_days))
+    return stale_days > 0 and task.type == 'one-time' and due_date is not None and due_date < today - timedelta(days=stale_days)
+
+def find_archive_candidates(storage, today, after_days, stale_days):
+    """Active tasks the policy would archive. The storage query narrows by status and due date; is_archivable decides."""
+    candidates = []
+    if after_days > 0:
+        candidates += storage.query_tasks(TaskQuery(completed=[True], due_until=today - timedelta(days=after_days)))
+    if stale_days > 0:
+        candidates += storage.query_tasks(TaskQuery(completed=[False], due_until=today - timedelta(days=stale_days)))
+    return [t for t in candidates if is_archivable(t, today, after_days, stale_days)]
+
+def archive_rule(today, after_days, stale_days):
+    """is_archivable as a Task predicate, for the storage layer to re-check inside the move."""
+    return lambda task: is_archivable(task, today, after_days, stale_days)
+
+@timed('archive.run')
+def archive_tasks(storage, cache, task_ids, actor=AUDIT_SYSTEM_ACTOR, audit_log=None, archivable=None, write_queue=None):
+    """Moves tasks to the archive tier and drops them from the shared cache; returns how many moved.
+
+    Candidates are read before the move, so `archivable` is checked again on
+    each task as stored. Tasks with a write still in `write_queue` are left for
+    the next run, since the write would put them back in the active set.
+    """
+    task_ids = list(task_ids)
+    if write_queue is not None:
+        pending = write_queue.pending_task_ids()
+        task_ids = [task_id for task_id in task_ids if task_id not in pending]
+    moved = storage.archive_tasks(task_ids, archivable) if task_ids else []
+    cache.apply_task_changes([], moved)
+    if audit_log:
+        audit_log.record([audit_record('archive', task_id, actor) for task_id in moved])
+    return len(moved)
+
+def restore_tasks(storage, cache, tasks, actor=AUDIT_SYSTEM_ACTOR, audit_log=None):
+    """Moves archived tasks back into the active set and the shared cache; returns how many moved."""
+    moved = set(storage.restore_tasks([t.id for t in tasks]))
+    restored = [t for t in tasks if t.id in moved]
+    cache.apply_task_changes(restored)
+    if audit_log:
+        audit_log.record([audit_record('restore', t.id, actor) for t in restored])
+    return len(restored)
+
+class ArchiveScheduler:
+    """Applies the archive policy at most every ARCHIVE_CHECK_INTERVAL_SECONDS, on a background thread so no rerun waits for it."""
+
+    def __init__(self, interval=ARCHIVE_CHECK_INTERVAL_SECONDS):
+        self.interval = interval
+        self.last_run = None  # monotonic time of the last start
+        self.last_result = None  # (finished at, tasks archived) or (finished at, error)
+        self.lock = threading.Lock()
+
+    def maybe_run(self, storage, cache):
+        now = time.monotonic()
+        with self.lock:
+            if self.last_run is not None and now - self.last_run < self.interval:
+                return
+            self.last_run = now
+        threading.Thread(target=self.run, args=(storage, cache), daemon=True, name="taskflow-archive").start()
+
+    def run(self, storage, cache):
+        try:
+            today, policy = datetime.now().date(), archive_policy()
+            candidates = find_archive_candidates(storage, today, *policy)
+            result = archive_tasks(storage, cache, [t.id for t in candidates], audit_log=get_audit_log(),
+                                   archivable=archive_rule(today, *policy), write_queue=get_write_queue())
+        except Exception as e:  # Retried at the next interval; the active set just stays larger meanwhile
+            result = e
+        with self.lock:
+            self.last_result = (datetime.now(), result)
+
+@st.cache_resource
+def get_archive_scheduler():
+    return ArchiveScheduler()
 
-    if 'users' not in st.session_state or not st.session_state.users:
-        if load_users_from_db():
-            save_users_to_db(st.session_state.users, "initial user bootstrap")
+# --- DATA SETUP ---
 
-    if 'tasks' not in st.session_state:
-        tasks, is_mock_data = load_tasks_from_db()
-        st.session_state.tasks = tasks
-        if is_mock_data:
-            save_tasks_to_db(st.session_state.tasks)
-            st.toast("Initialized with mock tasks.")
+def initialize_data(owner_id=None):
+    """Loads what the first page needs: categories and `owner_id`'s tasks (None: everyone's), read concurrently."""
+    cache = get_shared_cache()
+    cache.ensure_loaded(owners=(owner_id,))
+    cache.refresh()
+    get_archive_scheduler().maybe_run(get_storage(), cache)
+    st.session_state.categories = cache.categories
+    st.session_state.users = cache.users
 
     if 'editing_task_id' not in st.session_state:
         st.session_state.editing_task_id = None
     if 'edit_form_key' not in st.session_state:
         st.session_state.edit_form_key = 0
 
+def show_storage_notices():
+    """Shows what the shared cache's UI-free loading code queued (bootstrap saves, load errors)."""
+    for kind, message in get_shared_cache().take_notices():
+        if kind == 'error':
+            st.error(message)
+        else:
+            st.toast(message)
+
 # --- RECURRENCE LOGIC ---
 
 def day_difference(date1, date2):
@@ -227,12 +2263,12 @@ def day_difference(date1, date2):
     return abs((date2 - date1).days)
 
 def is_task_due(task, target_date):
-    start_date = task.get('due_date')
+    start_date = task.due_date
     if not start_date or not isinstance(start_date, date) or target_date < start_date:
         return False
     if target_date == start_date:
         return True
-    task_type = task.get('type')
+    task_type = task.type
     if task_type == 'one-time': return False
     if task_type == 'daily': return True
     if task_type == 'weekly': return target_date.weekday() == start_date.weekday()
@@ -240,23 +2276,248 @@ def is_task_due(task, target_date):
     if task_type == 'monthly': return target_date.day == start_date.day
     return False
 
-def get_next_occurrence(task, reference_date, days_limit=365):
-    next_date = reference_date
-    end_date = reference_date + timedelta(days=days_limit)
-    while next_date < end_date:
-        if is_task_due(task, next_date):
-            return next_date
-        next_date += timedelta(days=1)
+def next_monthly_date(start_date, from_date):
+    """First date on or after from_date whose day-of-month matches start_date.
+
+    Months that lack the start day (e.g. the 31st in April) are skipped, which
+    is what is_task_due does; at most a few months are ever stepped over.
+    """
+    year, month, day = from_date.year, from_date.month, start_date.day
+    if from_date.day > day:
+        month += 1
+    while True:
+        if month > 12:
+            year, month = year + 1, 1
+        if day <= calendar.monthrange(year, month)[1]:
+            return date(year, month, day)
+        month += 1
+
+def first_occurrence_on_or_after(task, from_date):
+    """Closed-form equivalent of scanning forward with is_task_due; None if the task never recurs."""
+    start_date = task.due_date
+    if not start_date or not isinstance(start_date, date):
+        return None
+    if isinstance(start_date, datetime): start_date = start_date.date()
+    if from_date <= start_date:
+        return start_date
+    task_type = task.type
+    if task_type == 'daily': return from_date
+    if task_type == 'weekly': return from_date + timedelta(days=(start_date.weekday() - from_date.weekday()) % 7)
+    if task_type == 'bi-weekly': return from_date + timedelta(days=(start_date - from_date).days % 14)
+    if task_type == 'monthly': return next_monthly_date(start_date, from_date)
     return None
 
+def get_next_occurrence(task, reference_date, days_limit=365):
+    next_date = first_occurrence_on_or_after(task, reference_date)
+    if next_date is None or next_date >= reference_date + timedelta(days=days_limit):
+        return None
+    return next_date
+
+RECURRENCE_STEPS = {'daily': timedelta(days=1), 'weekly': timedelta(days=7), 'bi-weekly': timedelta(days=14)}
+
+def iter_occurrences(task, window_start, window_end):
+    """Yields every date in [window_start, window_end) on which is_task_due(task, date) holds."""
+    occurrence = first_occurrence_on_or_after(task, window_start)
+    task_type = task.type
+    while occurrence is not None and occurrence < window_end:
+        yield occurrence
+        if task_type in RECURRENCE_STEPS:
+            occurrence += RECURRENCE_STEPS[task_type]
+        elif task_type == 'monthly':
+            occurrence = next_monthly_date(occurrence, occurrence + timedelta(days=1))
+        else:
+            break
+
+@timed('calendar.occurrence_index')
+def build_occurrence_index(tasks, window_start, window_end):
+    """Expands all tasks over a date window in one pass: {date: [tasks due that day]}, in task order."""
+    index = {}
+    for task in tasks:
+        for occurrence in iter_occurrences(task, window_start, window_end):
+            index.setdefault(occurrence, []).append(task)
+    return index
+
+# --- OCCURRENCE COMPLETIONS ---
+
+# Recurring tasks record which occurrences were done in extra['completions']:
+# {'YYYY-MM': bitmap}, bit d-1 set when the occurrence on day d was completed.
+# One small int per month, pruned to the last COMPLETION_HISTORY_MONTHS, so a
+# daily task costs the same few hundred bytes after years as after a month.
+# For recurring tasks `is_completed` means the whole series is finished.
+COMPLETIONS_KEY = 'completions'
+COMPLETION_HISTORY_MONTHS = 24
+
+def completion_month(day):
+    return f"{day.year:04d}-{day.month:02d}"
+
+def is_occurrence_completed(task, day):
+    """O(1): was the occurrence of `task` on `day` marked done?"""
+    if task.is_completed or task.type == 'one-time':
+        return bool(task.is_completed)
+    completions = (task.extra or {}).get(COMPLETIONS_KEY) or {}
+    return bool(completions.get(completion_month(day), 0) >> (day.day - 1) & 1)
+
+def with_occurrence_completed(task, day, done=True):
+    """Copy of a recurring task with the occurrence on `day` marked done (or not done)."""
+    completions = dict((task.extra or {}).get(COMPLETIONS_KEY) or {})
+    month = completion_month(day)
+    bitmap = completions.get(month, 0)
+    bitmap = bitmap | (1 << (day.day - 1)) if done else bitmap & ~(1 << (day.day - 1))
+    completions[month] = bitmap
+    oldest_kept = completion_month(date(day.year - COMPLETION_HISTORY_MONTHS // 12, day.month, 1))
+    completions = {m: bits for m, bits in completions.items() if bits and m >= oldest_kept}
+    extra = dict(task.extra or {})
+    if completions:
+        extra[COMPLETIONS_KEY] = completions
+    else:
+        extra.pop(COMPLETIONS_KEY, None)
+    return task.replace(extra=extra)
+
+def last_completed_occurrence(task):
+    completions = (task.extra or {}).get(COMPLETIONS_KEY) or {}
+    months = [m for m, bits in completions.items() if bits]
+    if not months:
+        return None
+    month = max(months)
+    return date(int(month[:4]), int(month[5:]), completions[month].bit_length())
+
+def next_open_occurrence(task, reference_date, days_limit=365):
+    """Like get_next_occurrence, but skips occurrences of an active recurring task that are already done."""
+    next_date = get_next_occurrence(task, reference_date, days_limit)
+    if task.type == 'one-time' or task.is_completed:
+        return next_date
+    limit = reference_date + timedelta(days=days_limit)
+    while next_date is not None and is_occurrence_completed(task, next_date):
+        next_date = get_next_occurrence(task, next_date + timedelta(days=1), (limit - next_date).days - 1)
+    return next_date
+
+def merge_completions(base, mine, theirs):
+    """Three-way merge of completion bitmaps: apply the bits this edit set or cleared on top of theirs."""
+    base, mine, theirs = ({} if v in (MISSING, None) else v for v in (base, mine, theirs))
+    merged = {}
+    for month in base.keys() | mine.keys() | theirs.keys():
+        b, m = base.get(month, 0), mine.get(month, 0)
+        bits = (theirs.get(month, 0) | (m & ~b)) & ~(b & ~m)
+        if bits:
+            merged[month] = bits
+    return merged or MISSING
+
+FIELD_MERGERS[f'extra.{COMPLETIONS_KEY}'] = merge_completions
+
+# --- ANALYTICS ---
+
+# numpy/pandas are imported inside these functions: only the admin analytics view needs them.
+RECURRENCE_PERIOD_DAYS = {'daily': 1, 'weekly': 7, 'bi-weekly': 14}
+ANALYTICS_DIMENSIONS = ['owner_id', 'account', 'campaign', 'priority']
+OVERDUE_LOOKBACK_DAYS = 7
+
+def build_task_frame(tasks):
+    """One row per task with a start date: the columns the analytics need, as numpy-backed columns.
+    Returns (frame, {row: task} for tasks that carry per-occurrence completions)."""
+    import numpy as np
+    import pandas as pd
+    rows = [t for t in tasks if isinstance(t.due_date, date)]
+    frame = pd.DataFrame({
+        'start': np.fromiter((t.due_date.toordinal() for t in rows), dtype=np.int64, count=len(rows)),
+        'type': pd.Categorical([t.type for t in rows], categories=TASK_TYPES),
+        'is_completed': np.fromiter((bool(t.is_completed) for t in rows), dtype=bool, count=len(rows)),
+        'owner_id': pd.Categorical([t.owner_id for t in rows]),
+        'account': pd.Categorical([t.account for t in rows]),
+        'campaign': pd.Categorical([t.campaign for t in rows]),
+        'priority': pd.Categorical([t.priority for t in rows], categories=PRIORITY_LEVELS, ordered=True),
+    })
+    with_completions = {i: t for i, t in enumerate(rows) if (t.extra or {}).get(COMPLETIONS_KEY)}
+    return frame, with_completions
+
+def expand_occurrences(frame, with_completions, window_start, window_end, include_one_time=True):
+    """Every open occurrence in [window_start, window_end) as a frame of (dimensions..., day).
+
+    Vectorized per recurrence type instead of calling is_task_due per task per
+    day: daily/weekly/bi-weekly are arithmetic progressions, monthly is one
+    candidate date per calendar month. Finished series and occurrences marked
+    done are left out.
+    """
+    import numpy as np
+    import pandas as pd
+    w0, w1 = window_start.toordinal(), window_end.toordinal()
+    start = frame['start'].to_numpy()
+    type_codes = frame['type'].cat.codes.to_numpy()
+    active = ~frame['is_completed'].to_numpy() & (start < w1)
+    row_parts, day_parts = [], []
+
+    if include_one_time:
+        rows = np.nonzero(active & (type_codes == TASK_TYPES.index('one-time')) & (start >= w0))[0]
+        row_parts.append(rows)
+        day_parts.append(start[rows])
+
+    for task_type, period in RECURRENCE_PERIOD_DAYS.items():
+        rows = np.nonzero(active & (type_codes == TASK_TYPES.index(task_type)))[0]
+        first = np.where(start[rows] >= w0, start[rows], w0 + (start[rows] - w0) % period)
+        counts = np.maximum(0, -(-(w1 - first) // period))
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        row_parts.append(np.repeat(rows, counts))
+        day_parts.append(np.repeat(first, counts) + offsets * period)
+
+    rows = np.nonzero(active & (type_codes == TASK_TYPES.index('monthly')))[0]
+    if len(rows):
+        start_dates = (start[rows] - date(1970, 1, 1).toordinal()).astype('datetime64[D]')
+        day_of_month = (start_dates - start_dates.astype('datetime64[M]')).astype(np.int64) + 1
+        month = date.fromordinal(w0).replace(day=1)
+        while month.toordinal() < w1:
+            month_length = calendar.monthrange(month.year, month.month)[1]
+            candidates = month.toordinal() + day_of_month - 1
+            due = (day_of_month <= month_length) & (candidates >= start[rows]) & (candidates >= w0) & (candidates < w1)
+            row_parts.append(rows[due])
+            day_parts.append(candidates[due])
+            month = (month + timedelta(days=32)).replace(day=1)
+
+    occurrence_rows = np.concatenate(row_parts) if row_parts else np.array([], dtype=np.int64)
+    occurrence_days = np.concatenate(day_parts) if day_parts else np.array([], dtype=np.int64)
+    if with_completions:
+        # Only the few tasks with completion bitmaps need a per-occurrence check
+        check = np.nonzero(np.isin(occurrence_rows, list(with_completions)))[0]
+        done = [i for i in check if is_occurrence_completed(with_completions[occurrence_rows[i]], date.fromordinal(int(occurrence_days[i])))]
+        keep = np.ones(len(occurrence_rows), dtype=bool)
+        keep[done] = False
+        occurrence_rows, occurrence_days = occurrence_rows[keep], occurrence_days[keep]
+
+    occurrences = frame.iloc[occurrence_rows][ANALYTICS_DIMENSIONS].reset_index(drop=True)
+    occurrences['day'] = pd.to_datetime(occurrence_days - date(1970, 1, 1).toordinal(), unit='D')
+    return occurrences
+
+@timed('analytics.build_report')
+def build_workload_report(tasks, today, horizon_days):
+    """(upcoming occurrences over the horizon, overdue occurrences) for the analytics view.
+
+    Overdue means one-time tasks still open after their date, plus recurring
+    occurrences in the last OVERDUE_LOOKBACK_DAYS that were not marked done.
+    """
+    import pandas as pd
+    frame, with_completions = build_task_frame(tasks)
+    upcoming = expand_occurrences(frame, with_completions, today, today + timedelta(days=horizon_days))
+    missed = expand_occurrences(frame, with_completions, today - timedelta(days=OVERDUE_LOOKBACK_DAYS), today, include_one_time=False)
+    late_one_time = frame[(frame['type'] == 'one-time') & ~frame['is_completed'] & (frame['start'] < today.toordinal())]
+    late = late_one_time[ANALYTICS_DIMENSIONS].reset_index(drop=True)
+    late['day'] = pd.to_datetime(late_one_time['start'].to_numpy() - date(1970, 1, 1).toordinal(), unit='D')
+    return upcoming, pd.concat([missed, late], ignore_index=True)
+
+def workload_pivot(occurrences, dimension, granularity):
+    """Occurrence counts with one row per `dimension` value and one column per day or week."""
+    period = occurrences['day'] if granularity == 'day' else occurrences['day'].dt.to_period('W').dt.start_time
+    return occurrences.groupby([occurrences[dimension], period], observed=True).size().unstack(fill_value=0)
+
 # --- UI COMPONENTS ---
 
+PAGE_SIZE_OPTIONS = [10, 20, 50, 100]
+DEFAULT_PAGE_SIZE = 20
+
+@timed('render.task_card')
 def task_card(task, next_due_date, current_view, on_complete=None, index=None):
     """Displays a single task card with actions, color-coded by priority."""
-    task_priority = task.get('priority', 'Medium')
+    task_priority = task.priority
     priority_color = PRIORITY_COLORS.get(task_priority, PRIORITY_COLORS['Medium'])
     
-    title_style = "text-decoration: line-through; color: #6b7280;" if task['is_completed'] else "color: #1f2937;"
+    title_style = "text-decoration: line-through; color: #6b7280;" if task.is_completed else "color: #1f2937;"
     card_style = f"border-left: 5px solid {priority_color}; border-radius: 5px; padding: 10px; margin-bottom: 10px; background-color: #fafafa;"
     
     with st.container():
@@ -264,60 +2525,164 @@ def task_card(task, next_due_date, current_view, on_complete=None, index=None):
         
         current_username = st.session_state.username
         is_admin = st.session_state.users[current_username]['role'] == 'admin'
-        is_owner = task['owner_id'] == current_username
+        is_owner = task.owner_id == current_username
         can_edit_or_delete = is_admin or is_owner
-        unique_key_suffix = f"{task['id']}_{current_view}_{index or ''}"
+        unique_key_suffix = f"{task.id}_{current_view}_{index or ''}"
 
         col1, col2, col3, col4 = st.columns([0.5, 0.2, 0.15, 0.15])
         
         with col1:
-            st.markdown(f'<div style="{title_style} font-weight: bold;">{task["title"]}</div>', unsafe_allow_html=True)
-            context_text = f"**{task.get('account', 'N/A')}** / **{task.get('campaign', 'N/A')}** | Priority: **{task_priority}**"
-            st.caption(f"{context_text} | Owned by: **{get_user_name(task['owner_id'])}**")
+            st.markdown(f'<div style="{title_style} font-weight: bold;">{task.title}</div>', unsafe_allow_html=True)
+            context_text = f"**{task.account or 'N/A'}** / **{task.campaign or 'N/A'}** | Priority: **{task_priority}**"
+            st.caption(f"{context_text} | Owned by: **{get_user_name(task.owner_id)}**")
             
         with col2:
             if next_due_date:
                 st.markdown(f'<div style="text-align: right;">{next_due_date.strftime("%b %d, %Y")}</div>', unsafe_allow_html=True)
-                st.markdown(f'<div style="font-size: 0.8em; text-align: right; color: #6b7280;">{task["type"]}</div>', unsafe_allow_html=True)
+                st.markdown(f'<div style="font-size: 0.8em; text-align: right; color: #6b7280;">{task.type}</div>', unsafe_allow_html=True)
 
         with col3:
             if can_edit_or_delete:
                 if st.button("Edit", key=f"edit_{unique_key_suffix}"):
-                    st.session_state.editing_task_id = task['id']
+                    st.session_state.editing_task_id = task.id
                     st.session_state.edit_form_key += 1
                     st.rerun()
 
         with col4:
             if current_view != 'All My Tasks' and is_owner:
-                if not task['is_completed']:
-                    st.button("Done", key=f"complete_{unique_key_suffix}", on_click=on_complete, args=(task['id'],), type="primary")
+                if not task.is_completed:
+                    st.button("Done", key=f"complete_{unique_key_suffix}", on_click=on_complete, args=(task.id, next_due_date), type="primary")
+                    if task.type != 'one-time':
+                        # Without an occurrence the toggle completes the task itself
+                        st.button("Finish series", key=f"finish_{unique_key_suffix}", on_click=on_complete, args=(task.id,),
+                                  help="Mark the whole series done; no further occurrences will be due")
                 else:
-                    st.button("Un-do", key=f"uncomplete_{unique_key_suffix}", on_click=on_complete, args=(task['id'],))
+                    st.button("Un-do", key=f"uncomplete_{unique_key_suffix}", on_click=on_complete, args=(task.id,))
+                last_done = last_completed_occurrence(task) if task.type != 'one-time' else None
+                if last_done and last_done >= datetime.now().date():
+                    st.button("Un-do", key=f"undo_occurrence_{unique_key_suffix}", on_click=on_complete, args=(task.id, last_done),
+                              help=f"Mark the {last_done.strftime('%b %d')} occurrence as not done")
             elif can_edit_or_delete:
                 if st.button("Delete", key=f"delete_{unique_key_suffix}"):
-                    delete_task(task['id'])
+                    delete_task(task.id)
         
         st.markdown('</div>', unsafe_allow_html=True)
 
+def turn_page(page_state_key, step):
+    st.session_state[page_state_key] = st.session_state.get(page_state_key, 0) + step
+
+def paginate(items, section_key, page_size):
+    """Renders pager controls for a section and returns (items on the current page, offset of the first one)."""
+    page_count = max(1, -(-len(items) // page_size))
+    page_state_key = f"page_{section_key}"
+    # Turned in the buttons' callbacks, so the page is already current when the buttons are drawn
+    page = max(0, min(st.session_state.get(page_state_key, 0), page_count - 1))
+    st.session_state[page_state_key] = page
+    if page_count > 1:
+        prev_col, label_col, next_col = st.columns([1, 2, 1])
+        prev_col.button("← Prev", key=f"prev_{section_key}", disabled=page == 0, on_click=turn_page, args=(page_state_key, -1))
+        next_col.button("Next →", key=f"next_{section_key}", disabled=page >= page_count - 1, on_click=turn_page, args=(page_state_key, 1))
+        label_col.caption(f"Page {page + 1} of {page_count} · {len(items)} tasks")
+    offset = page * page_size
+    return items[offset:offset + page_size], offset
+
+def dashboard_skeleton():
+    """Placeholder outline of the dashboard shown while its data is still loading."""
+    st.subheader("Actionable Summary")
+    for heading in ["🎯 Today", "🗓️ Upcoming (Next 7 Days)", "📝 All My Tasks"]:
+        st.markdown(f"### {heading}")
+        st.caption("Loading tasks...")
+        st.progress(0.0)
+
+def task_table(tasks_with_dates):
+    """Compact All My Tasks view: one st.dataframe with row selection instead of a card per task."""
+    current_username = st.session_state.username
+    is_admin = st.session_state.users[current_username]['role'] == 'admin'
+    rows = [{
+        'Title': t.title, 'Next Due': next_due_date, 'Type': t.type, 'Priority': t.priority,
+        'Account': t.account or 'N/A', 'Campaign': t.campaign or 'N/A',
+        'Owner': get_user_name(t.owner_id), 'Done': t.is_completed,
+    } for t, next_due_date in tasks_with_dates]
+    event = st.dataframe(rows, use_container_width=True, hide_index=True, on_select="rerun", selection_mode="multi-row", key="all_tasks_table")
+    selected = [tasks_with_dates[i][0] for i in event.selection.rows]
+    editable = [t for t in selected if is_admin or t.owner_id == current_username]
+    owned = [t for t in selected if t.owner_id == current_username]
+
+    edit_col, done_col, _ = st.columns([0.15, 0.2, 0.65])
+    if edit_col.button("Edit", key="table_edit", disabled=len(editable) != 1):
+        st.session_state.editing_task_id = editable[0].id
+        st.session_state.edit_form_key += 1
+        st.rerun()
+    if done_col.button(f"Toggle Done ({len(owned)})", key="table_toggle", disabled=not owned, type="primary"):
+        next_dates = {t.id: next_due_date for t, next_due_date in tasks_with_dates}
+        for task in owned:
+            toggle_task_completion(task.id, next_dates[task.id])
+        st.rerun()
+
 def delete_task(task_id):
-    st.session_state.tasks = [t for t in st.session_state.tasks if t['id'] != task_id]
-    save_tasks_to_db(st.session_state.tasks)
+    get_shared_cache().remove_task(task_id)
+    delete_task_from_db(task_id)
     st.toast("Task deleted!")
     st.rerun()
 
 def find_task_by_id(task_id):
-    return next((t for t in st.session_state.tasks if t['id'] == task_id), None)
+    return get_shared_cache().get_task(task_id)
 
-def update_task(task_id, new_data):
-    for i, task in enumerate(st.session_state.tasks):
-        if task['id'] == task_id:
-            st.session_state.tasks[i].update(new_data)
-            st.toast(f"Task '{new_data['title']}' updated!")
-            break
-    save_tasks_to_db(st.session_state.tasks)
+def update_task(task_id, new_data, base):
+    """Applies the fields the user actually changed relative to `base` (the version the form showed)
+    onto the current task, so edits made by others meanwhile are kept."""
+    task = find_task_by_id(task_id)
+    if task:
+        changes = {field: value for field, value in new_data.items() if getattr(base, field) != value}
+        updated_task = task.replace(**changes)
+        get_shared_cache().upsert_task(updated_task)
+        save_task_to_db(updated_task, base=base)
+        st.toast(f"Task '{new_data['title']}' updated!")
     st.session_state.editing_task_id = None
     st.rerun()
 
+def toggle_task_completion(task_id, occurrence=None):
+    """Toggles one occurrence of an active recurring task when `occurrence` is given, else the task itself."""
+    task = find_task_by_id(task_id)
+    if task:
+        if occurrence is not None and task.type != 'one-time' and not task.is_completed:
+            updated_task = with_occurrence_completed(task, occurrence, not is_occurrence_completed(task, occurrence))
+        else:
+            updated_task = task.replace(is_completed=not task.is_completed)
+        get_shared_cache().upsert_task(updated_task)
+        save_task_to_db(updated_task, base=task)
+
+def keep_my_values(conflict):
+    """Re-saves the user's values for the conflicting fields on top of what was stored."""
+    mine = {field: value for field, value in task_changes(conflict.saved or conflict.mine, conflict.mine).items() if field in conflict.fields}
+    base = conflict.saved
+    updated_task = with_task_changes(base, mine) if base else conflict.mine
+    get_shared_cache().upsert_task(updated_task)
+    save_task_to_db(updated_task, base=base)
+
+def write_conflicts_panel():
+    """Shows the current user's edits that collided with someone else's, until dismissed."""
+    if 'write_conflicts' not in st.session_state:
+        st.session_state.write_conflicts = []
+    st.session_state.write_conflicts += get_write_queue().take_conflicts(st.session_state.username)
+    for i, conflict in enumerate(st.session_state.write_conflicts):
+        if conflict.saved is None:
+            st.warning(f"**{conflict.mine.title}** was deleted by someone else before your edit was saved.")
+            action = "Restore with my changes"
+        else:
+            fields = ", ".join(f.replace('extra.', '') for f in conflict.fields)
+            st.warning(f"Someone else also changed **{fields}** of **{conflict.saved.title}**. "
+                       "Their values were kept; the rest of your edit was saved.")
+            action = "Use my values"
+        cols = st.columns([1, 1, 4])
+        if cols[0].button(action, key=f"conflict_keep_{i}"):
+            keep_my_values(conflict)
+            del st.session_state.write_conflicts[i]
+            st.rerun()
+        if cols[1].button("Dismiss", key=f"conflict_dismiss_{i}"):
+            del st.session_state.write_conflicts[i]
+            st.rerun()
+
 def edit_task_modal():
     task_id = st.session_state.editing_task_id
     if not task_id: return
@@ -327,28 +2692,37 @@ def edit_task_modal():
         return
 
     is_admin = st.session_state.users[st.session_state.username]['role'] == 'admin'
-    
+
+    # The form shows, and update_task diffs against, the version the user opened
+    form_key, base = st.session_state.get('editing_task_base') or (None, None)
+    if form_key != st.session_state.edit_form_key or base.id != task_id:
+        base = task
+        st.session_state.editing_task_base = (st.session_state.edit_form_key, base)
+    task = base
+
     with st.form(f"edit_task_form_{st.session_state.edit_form_key}"):
-        st.subheader(f"Editing Task: {task['title']}")
-        new_title = st.text_input("Title", value=task['title'])
-        new_description = st.text_area("Description", value=task.get('description', ''))
+        st.subheader(f"Editing Task: {task.title}")
+        new_title = st.text_input("Title", value=task.title)
+        new_description = st.text_area("Description", value=task.description or '')
         
         cols = st.columns(3)
-        current_due_date = task['due_date'] if isinstance(task['due_date'], (datetime, date)) else datetime.now().date()
+        current_due_date = task.due_date if isinstance(task.due_date, (datetime, date)) else datetime.now().date()
         new_due_date = cols[0].date_input("Due/Start Date", value=current_due_date)
-        new_task_type = cols[1].selectbox("Recurrence", TASK_TYPES, index=TASK_TYPES.index(task.get('type', 'one-time')))
+        new_task_type = cols[1].selectbox("Recurrence", TASK_TYPES, index=TASK_TYPES.index(task.type) if task.type in TASK_TYPES else 0)
         
-        current_priority = task.get('priority', 'Medium')
+        current_priority = task.priority
         priority_index = PRIORITY_LEVELS.index(current_priority) if current_priority in PRIORITY_LEVELS else 1
         new_priority = cols[2].selectbox("Priority", PRIORITY_LEVELS, index=priority_index)
         
         cols_context = st.columns(2)
         account_options = st.session_state.categories.get('accounts', [])
-        new_account = cols_context[0].selectbox("Account", account_options, index=(account_options.index(task['account']) if task.get('account') in account_options else 0))
+        new_account = cols_context[0].selectbox("Account", account_options, index=(account_options.index(task.account) if task.account in account_options else 0))
         campaign_options = st.session_state.categories.get('campaigns', [])
-        new_campaign = cols_context[1].selectbox("Campaign", campaign_options, index=(campaign_options.index(task['campaign']) if task.get('campaign') in campaign_options else 0))
+        new_campaign = cols_context[1].selectbox("Campaign", campaign_options, index=(campaign_options.index(task.campaign) if task.campaign in campaign_options else 0))
+        new_is_completed = st.checkbox("Completed" if task.type == 'one-time' else "Series finished", value=task.is_completed,
+                                       help=None if task.type == 'one-time' else "No further occurrences will be due")
 
-        assignee_id = task['owner_id']
+        assignee_id = task.owner_id
         if is_admin:
             all_user_names = [d['name'] for d in st.session_state.users.values()]
             current_assignee_name = get_user_name(assignee_id)
@@ -364,8 +2738,8 @@ def edit_task_modal():
             update_task(task_id, {
                 'title': new_title, 'description': new_description, 'due_date': new_due_date,
                 'type': new_task_type, 'owner_id': assignee_id, 'account': new_account,
-                'campaign': new_campaign, 'priority': new_priority
-            })
+                'campaign': new_campaign, 'priority': new_priority, 'is_completed': new_is_completed
+            }, base)
 
 def add_task_form():
     is_admin = st.session_state.users[st.session_state.username]['role'] == 'admin'
@@ -393,19 +2767,270 @@ def add_task_form():
                 
                 if st.form_submit_button("Save Task", type="primary"):
                     if title:
-                        new_id = f"task_{st.session_state.next_task_id}"
-                        st.session_state.next_task_id += 1
-                        st.session_state.tasks.append({
-                            'id': new_id, 'title': title, 'description': description,
-                            'due_date': due_date, 'type': task_type, 'owner_id': assignee_id,
-                            'is_completed': False, 'account': new_account, 'campaign': new_campaign,
-                            'priority': priority
-                        })
-                        save_tasks_to_db(st.session_state.tasks)
+                        new_id = get_shared_cache().allocate_task_id()
+                        new_task = Task(
+                            id=new_id, title=title, description=description,
+                            due_date=due_date, type=task_type, owner_id=assignee_id,
+                            is_completed=False, account=new_account, campaign=new_campaign,
+                            priority=priority
+                        )
+                        get_shared_cache().upsert_task(new_task)
+                        save_task_to_db(new_task)
                         st.success(f"Task '{title}' added!")
                     else:
                         st.error("Title cannot be empty.")
 
+# --- BULK IMPORT / EXPORT ---
+
+BULK_FORMATS = ('csv', 'jsonl')
+BULK_ENTITIES = ('tasks', 'users', 'categories')
+BULK_COLUMNS = {
+    'tasks': ['id', 'title', 'description', 'due_date', 'type', 'owner_id', 'is_completed', 'account', 'campaign', 'priority'],
+    'users': ['username', 'email', 'name', 'role', 'pin'],
+    'categories': ['kind', 'name'],
+}
+USER_ROLES = ('admin', 'user')
+CATEGORY_KINDS = {'account': 'accounts', 'campaign': 'campaigns'}
+# Tasks are written one Firestore batch at a time, a few batches in flight at once
+IMPORT_CHUNK_SIZE = FIRESTORE_BATCH_LIMIT
+IMPORT_MAX_IN_FLIGHT = 4
+IMPORT_MAX_REPORTED_ERRORS = 100
+MAX_TASK_DOCUMENT_BYTES = 1_000_000  # Firestore's limit is 1 MiB per document
+
+ImportResult = namedtuple('ImportResult', ['imported', 'error_count', 'errors'])
+
+def iter_export_records(entity, storage):
+    """Yields one plain dict per exported row. Tasks are streamed from storage; PIN hashes are never exported."""
+    if entity == 'tasks':
+        for task in storage.iter_tasks():
+            yield task.to_dict()
+    elif entity == 'users':
+        for username, user_data in (storage.load_users() or {}).items():
+            yield {'username': username, **{k: v for k, v in user_data.items() if k not in ('pin', 'pin_hash')}}
+    elif entity == 'categories':
+        categories = storage.load_categories() or {}
+        for kind, key in CATEGORY_KINDS.items():
+            for name in categories.get(key, []):
+                yield {'kind': kind, 'name': name}
+
+def iter_export_lines(records, fmt, columns):
+    """Serializes records one line at a time. JSONL keeps every field (including `extra`); CSV keeps `columns`."""
+    if fmt == 'jsonl':
+        for record in records:
+            yield json.dumps(record, default=json_default) + "\n"
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        writer.writerow({k: v for k, v in record.items() if v is not None})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
+
+def write_export(entity, fmt, storage, fp):
+    """Streams an export into the binary file `fp`; returns the number of rows written."""
+    rows = 0
+
+    def counted(records):
+        nonlocal rows
+        for record in records:
+            rows += 1
+            yield record
+
+    columns = [c for c in BULK_COLUMNS[entity] if c != 'pin']
+    for line in iter_export_lines(counted(iter_export_records(entity, storage)), fmt, columns):
+        fp.write(line.encode('utf-8'))
+    return rows
+
+def iter_import_records(fp, fmt):
+    """Yields (line number, dict) from a binary CSV/JSONL stream, reading a line at a time.
+    A line that isn't valid JSON yields (line number, ValueError) instead."""
+    text = io.TextIOWrapper(fp, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            yield from enumerate(csv.DictReader(text), start=2)
+            return
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f"invalid JSON: {e}")
+                continue
+            yield line_number, record if isinstance(record, dict) else ValueError("expected a JSON object")
+    finally:
+        text.detach()  # Leave the caller's file open
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value or '').strip().lower()
+    if text in ('true', '1', 'yes', 'y'):
+        return True
+    if text in ('false', '0', 'no', 'n', ''):
+        return False
+    raise ValueError(f"not a yes/no value: {value!r}")
+
+def parse_task_record(record, categories, users):
+    """Validates one imported row into a Task; raises ValueError naming the first problem."""
+    record = {k: (v.strip() if isinstance(v, str) else v) for k, v in record.items() if k is not None}
+    title = record.get('title')
+    if not title:
+        raise ValueError("title is required")
+    task_type = record.get('type') or 'one-time'
+    if task_type not in TASK_TYPES:
+        raise ValueError(f"type must be one of {', '.join(TASK_TYPES)}")
+    priority = record.get('priority') or 'Medium'
+    if priority not in PRIORITY_LEVELS:
+        raise ValueError(f"priority must be one of {', '.join(PRIORITY_LEVELS)}")
+    try:
+        due_date = date.fromisoformat(str(record.get('due_date') or '')[:10])
+    except ValueError:
+        raise ValueError("due_date must be a YYYY-MM-DD date")
+    owner_id = record.get('owner_id')
+    if owner_id not in users:
+        raise ValueError(f"unknown owner_id {owner_id!r}")
+    for field, key in (('account', 'accounts'), ('campaign', 'campaigns')):
+        if record.get(field) and record[field] not in categories.get(key, []):
+            raise ValueError(f"unknown {field} {record[field]!r}")
+    extra = {k: v for k, v in record.items() if k not in Task.__slots__}
+    task = Task(
+        record.get('id') or SharedDataCache.allocate_task_id(), title, record.get('description') or '', due_date,
+        task_type, owner_id, parse_bool(record.get('is_completed')),
+        record.get('account') or None, record.get('campaign') or None, priority, extra=extra or None,
+    )
+    if payload_size(task) > MAX_TASK_DOCUMENT_BYTES:
+        raise ValueError("task is larger than a storage document allows")
+    return task
+
+def import_tasks(fp, fmt, storage, categories, users, progress=None, actor=None, audit_log=None):
+    """Validates and writes tasks from a CSV/JSONL stream in chunks of IMPORT_CHUNK_SIZE.
+
+    Only the current chunks are held in memory. Rows without an id get a fresh
+    one, so they can't exist yet and are written with plain batched writes.
+    Rows naming an id go through apply_task_writes (base None), so existing
+    ids are overwritten with their revision bumped. `progress(rows_read,
+    fraction_of_file)` is called per chunk. Written tasks are recorded in
+    `audit_log` as `actor`'s.
+    """
+    size = fp.seek(0, io.SEEK_END)
+    fp.seek(0)
+    imported, error_count, errors = 0, 0, []
+    chunk, in_flight = [], set()
+
+    def write_chunk(tasks):
+        # Stamped as apply_task_writes stamps a new task, without its transaction reading every document first
+        now = datetime.now(timezone.utc)
+        created = [task.replace(revision=1, updated_at=now) for task, allocated_id in tasks if allocated_id]
+        if created:
+            storage.save_tasks(created)
+        applied = [(task.id, None, task) for task in created]
+        given = [('set', task.id, task, None) for task, allocated_id in tasks if not allocated_id]
+        if given:
+            storage.apply_task_writes(given, applied)
+        if audit_log:
+            audit_log.record(audit_records_for_writes(applied, actor))
+
+    def submit(executor, tasks):
+        nonlocal in_flight
+        if len(in_flight) >= IMPORT_MAX_IN_FLIGHT:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+        in_flight.add(executor.submit(write_chunk, tasks))
+
+    with ThreadPoolExecutor(max_workers=IMPORT_MAX_IN_FLIGHT, thread_name_prefix="taskflow-import") as executor:
+        rows_read = 0
+        for line_number, record in iter_import_records(fp, fmt):
+            rows_read += 1
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                chunk.append((parse_task_record(record, categories, users), not record.get('id')))
+            except ValueError as e:
+                error_count += 1
+                if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                    errors.append((line_number, str(e)))
+                continue
+            if len(chunk) == IMPORT_CHUNK_SIZE:
+                submit(executor, chunk)
+                imported += len(chunk)
+                chunk = []
+                if progress:
+                    progress(rows_read, fp.tell() / size if size else 1.0)
+        if chunk:
+            submit(executor, chunk)
+            imported += len(chunk)
+        for future in in_flight:
+            future.result()
+    if progress:
+        progress(rows_read, 1.0)
+    return ImportResult(imported, error_count, errors)
+
+def import_users(fp, fmt, users):
+    """Merges imported users into a copy of `users`; returns (users, ImportResult). New users need a PIN."""
+    users = {username: dict(user_data) for username, user_data in users.items()}
+    emails = {d['email'].strip().lower(): u for u, d in users.items()}
+    imported, error_count, errors = 0, 0, []
+    for line_number, record in iter_import_records(fp, fmt):
+        try:
+            if isinstance(record, Exception):
+                raise record
+            record = {k: str(v).strip() for k, v in record.items() if k is not None and v not in (None, '')}
+            username = record.get('username')
+            if not username:
+                raise ValueError("username is required")
+            user_data = users.get(username, {'role': 'user'})
+            email = record.get('email', user_data.get('email', ''))
+            if '@' not in email:
+                raise ValueError("a valid email is required")
+            if emails.get(email.lower(), username) != username:
+                raise ValueError(f"email {email} already belongs to {emails[email.lower()]}")
+            role = record.get('role', user_data['role'])
+            if role not in USER_ROLES:
+                raise ValueError(f"role must be one of {', '.join(USER_ROLES)}")
+            if 'pin' not in record and 'pin_hash' not in user_data and 'pin' not in user_data:
+                raise ValueError("pin is required for new users")
+            user_data = {**user_data, 'email': email, 'role': role, 'name': record.get('name', user_data.get('name', username))}
+            if 'id' in record:
+                user_data['id'] = record['id']
+            if 'pin' in record:
+                user_data.pop('pin', None)
+                user_data['pin_hash'] = hash_pin(record['pin'])
+            users[username] = user_data
+            emails[email.lower()] = username
+            imported += 1
+        except ValueError as e:
+            error_count += 1
+            if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                errors.append((line_number, str(e)))
+    return users, ImportResult(imported, error_count, errors)
+
+def import_categories(fp, fmt, categories):
+    """Adds imported account/campaign names to a copy of `categories`; returns (categories, ImportResult)."""
+    categories = {**categories, **{key: list(categories.get(key, [])) for key in CATEGORY_KINDS.values()}}
+    imported, error_count, errors = 0, 0, []
+    for line_number, record in iter_import_records(fp, fmt):
+        try:
+            if isinstance(record, Exception):
+                raise record
+            kind, name = str(record.get('kind') or '').strip().lower(), str(record.get('name') or '').strip()
+            if kind not in CATEGORY_KINDS:
+                raise ValueError("kind must be 'account' or 'campaign'")
+            if not name:
+                raise ValueError("name is required")
+            if name not in categories[CATEGORY_KINDS[kind]]:
+                categories[CATEGORY_KINDS[kind]].append(name)
+                imported += 1
+        except ValueError as e:
+            error_count += 1
+            if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                errors.append((line_number, str(e)))
+    return categories, ImportResult(imported, error_count, errors)
+
 # --- ADMIN PAGES ---
 def category_management_form():
     if st.session_state.users[st.session_state.username]['role'] == 'admin':
@@ -415,166 +3040,537 @@ def category_management_form():
             current_campaigns = ", ".join(st.session_state.categories.get('campaigns', []))
             new_campaigns = st.text_area("Campaigns (comma-separated)", current_campaigns)
             if st.button("Save Categories"):
-                st.session_state.categories['accounts'] = [a.strip() for a in new_accounts.split(',') if a.strip()]
-                st.session_state.categories['campaigns'] = [c.strip() for c in new_campaigns.split(',') if c.strip()]
+                st.session_state.categories = {
+                    **st.session_state.categories,
+                    'accounts': [a.strip() for a in new_accounts.split(',') if a.strip()],
+                    'campaigns': [c.strip() for c in new_campaigns.split(',') if c.strip()],
+                }
+                get_shared_cache().replace_categories(st.session_state.categories)
                 save_categories_to_db(st.session_state.categories, "admin update")
                 st.success("Categories saved!")
                 st.rerun()
 
 def admin_user_control_page():
     st.title("👤 User Management")
-    st.dataframe([{'Username': u, **d} for u, d in st.session_state.users.items()], use_container_width=True)
+    rows = [{'Username': u, **{k: v for k, v in d.items() if k not in ('pin', 'pin_hash')}} for u, d in st.session_state.users.items()]
+    st.dataframe(rows, use_container_width=True)
     # You can add your detailed Add/Edit/Delete user forms here if needed
 
-# --- VIEWS ---
+def show_import_result(result, noun):
+    if result.imported:
+        st.success(f"Imported {result.imported} {noun}.")
+    if result.error_count:
+        st.warning(f"Skipped {result.error_count} invalid row(s).")
+        with st.expander("Rejected rows"):
+            st.dataframe([{'Line': line, 'Problem': problem} for line, problem in result.errors], hide_index=True)
+            if result.error_count > len(result.errors):
+                st.caption(f"Showing the first {len(result.errors)}.")
+
+def admin_import_export_page():
+    st.title("⇅ Import / Export")
+    st.caption("Tasks, users and categories as CSV or JSON Lines. Import categories and users before the tasks that refer to them.")
+    storage = get_storage()
+    cache = get_shared_cache()
+
+    st.markdown("#### Export")
+    export_cols = st.columns(3)
+    export_entity = export_cols[0].selectbox("Data", BULK_ENTITIES, key="export_entity")
+    export_format = export_cols[1].radio("Format", BULK_FORMATS, horizontal=True, key="export_format")
+
+    def build_export():
+        # Only runs when the button is clicked. Rows are streamed to disk, so the bytes Streamlit serves are the one in-memory copy
+        with tempfile.TemporaryFile() as export_file:
+            write_export(export_entity, export_format, storage, export_file)
+            export_file.seek(0)
+            return export_file.read()
+
+    export_cols[2].download_button(f"Download {export_entity}", build_export, file_name=f"taskflow_{export_entity}.{export_format}",
+                                   mime="text/csv" if export_format == 'csv' else "application/x-ndjson", on_click='ignore')
+
+    st.markdown("#### Import")
+    import_cols = st.columns([1, 2])
+    import_entity = import_cols[0].selectbox("Data", BULK_ENTITIES, key="import_entity")
+    uploaded = import_cols[1].file_uploader("CSV or JSONL file", type=list(BULK_FORMATS), key="import_file")
+    st.caption(f"Columns: {', '.join(BULK_COLUMNS[import_entity])}")
+    if uploaded is not None and st.button("Import", type="primary"):
+        fmt = 'csv' if uploaded.name.lower().endswith('.csv') else 'jsonl'
+        if import_entity == 'tasks':
+            progress_bar = st.progress(0.0, text="Importing tasks...")
+            result = import_tasks(uploaded, fmt, storage, cache.categories, cache.users,
+                                  progress=lambda rows, fraction: progress_bar.progress(min(fraction, 1.0), text=f"{rows} rows read"),
+                                  actor=st.session_state.username, audit_log=get_audit_log())
+            show_import_result(result, "tasks")
+        elif import_entity == 'users':
+            users, result = import_users(uploaded, fmt, cache.users)
+            if result.imported:
+                save_users_to_db(users, "import")
+                cache.replace_users(users)
+                st.session_state.users = users
+            show_import_result(result, "users")
+        else:
+            categories, result = import_categories(uploaded, fmt, cache.categories)
+            if result.imported:
+                save_categories_to_db(categories, "import")
+                cache.replace_categories(categories)
+                st.session_state.categories = categories
+            show_import_result(result, "categories")
+
+def admin_performance_page():
+    st.title("📈 Performance")
+    metrics = get_metrics()
+    data = metrics.snapshot()
+    counters = data['counters']
+    st.caption(f"Process-wide since {datetime.fromtimestamp(metrics.started_at):%Y-%m-%d %H:%M:%S}. Byte counts are estimates.")
+
+    cols = st.columns(4)
+    cols[0].metric("DB reads (docs)", counters.get('db_read_docs', 0), help=f"{counters.get('db_read_calls', 0)} calls")
+    cols[1].metric("DB read KiB", counters.get('db_read_bytes', 0) // 1024)
+    cols[2].metric("DB writes (docs)", counters.get('db_write_docs', 0), help=f"{counters.get('db_write_calls', 0)} calls")
+    cols[3].metric("DB write KiB", counters.get('db_write_bytes', 0) // 1024)
+
+    st.markdown("#### Spans")
+    span_rows = [
+        {'Span': name, 'Calls': count, 'Total ms': round(total * 1000, 1), 'Mean ms': round(total * 1000 / count, 3), 'Max ms': round(longest * 1000, 3)}
+        for name, (count, total, longest) in data['timings'].items()
+    ]
+    st.dataframe(sorted(span_rows, key=lambda r: r['Total ms'], reverse=True), use_container_width=True, hide_index=True)
+
+    st.markdown("#### Recent reruns")
+    recent = data['recent_reruns']
+    rerun_rows = [
+        {'Time': r['timestamp'], 'User': r['user'], 'Total ms': r['duration_ms'],
+         'Slowest span': max(r['spans'], key=r['spans'].get) if r['spans'] else '',
+         'DB reads': r['counters'].get('db_read_docs', 0), 'DB writes': r['counters'].get('db_write_docs', 0)}
+        for r in reversed(recent)
+    ]
+    st.dataframe(rerun_rows, use_container_width=True, hide_index=True)
 
-def dashboard_view():
-    st.subheader("Actionable Summary")
+    export_cols = st.columns(3)
+    export_cols[0].download_button("Prometheus text", metrics.to_prometheus(), file_name="taskflow_metrics.prom", mime="text/plain")
+    export_cols[1].download_button("Reruns as JSON lines", "".join(json.dumps(r) + "\n" for r in recent), file_name="taskflow_reruns.jsonl", mime="application/x-ndjson")
+    export_cols[2].button("Reset counters", on_click=metrics.reset)
+
+def query_workload(today, horizon_days):
+    """(upcoming, overdue) occurrence frames across all owners, memoized per (task version, day, horizon)."""
+    cache = get_shared_cache()
+    cache.ensure_tasks_loaded(None)
+    return cache.get_derived(('workload', today, horizon_days), lambda: build_workload_report(cache.query_tasks(TaskQuery()), today, horizon_days))
+
+def admin_analytics_page():
+    st.title("📊 Workload Analytics")
     today = datetime.now().date()
-    current_username = st.session_state.username
-    is_admin = st.session_state.users[current_username]['role'] == 'admin'
+    option_cols = st.columns(3)
+    horizon_days = option_cols[0].selectbox("Horizon (days)", [7, 14, 30, 90], index=1)
+    dimension = option_cols[1].selectbox("Group by", ANALYTICS_DIMENSIONS, format_func=lambda d: d.replace('_id', '').title())
+    granularity = option_cols[2].radio("Per", ['day', 'week'], horizontal=True)
 
-    with st.expander("🔍 Filter & Sort Tasks"):
-        filter_cols = st.columns(3)
-        selected_accounts = filter_cols[0].multiselect("Accounts", st.session_state.categories.get('accounts', []), default=st.session_state.categories.get('accounts', []))
-        selected_campaigns = filter_cols[1].multiselect("Campaigns", st.session_state.categories.get('campaigns', []), default=st.session_state.categories.get('campaigns', []))
-        selected_statuses_str = filter_cols[2].multiselect("Status", ['Incomplete', 'Completed'], default=['Incomplete', 'Completed'])
-        selected_statuses = [s == 'Completed' for s in selected_statuses_str]
-        
-        sort_by = st.selectbox("Sort By", ['Due Date', 'Title', 'Priority'])
+    try:
+        upcoming, overdue = query_workload(today, horizon_days)
+    except ImportError:
+        st.error("Analytics needs numpy and pandas: pip install -r requirements.txt")
+        return
+    cache = get_shared_cache()
+    pivot = cache.get_derived(('workload_pivot', today, horizon_days, dimension, granularity), lambda: workload_pivot(upcoming, dimension, granularity))
+    label = get_user_name if dimension == 'owner_id' else str
+
+    cols = st.columns(3)
+    cols[0].metric(f"Occurrences, next {horizon_days} days", len(upcoming))
+    cols[1].metric("High priority", int((upcoming['priority'] == 'High').sum()))
+    cols[2].metric("Overdue", len(overdue), help=f"Open one-time tasks past due, plus recurring occurrences from the last {OVERDUE_LOOKBACK_DAYS} days not marked done")
+
+    st.markdown(f"#### Load per {granularity}")
+    if pivot.empty:
+        st.info("Nothing scheduled in this horizon.")
+    else:
+        pivot = pivot.rename(index=label, columns=lambda c: c.strftime('%Y-%m-%d'))
+        st.bar_chart(pivot.T)
+        st.dataframe(pivot.assign(Total=pivot.sum(axis=1)).sort_values('Total', ascending=False), use_container_width=True)
 
-    base_tasks_to_filter = st.session_state.tasks
-    
-    filtered_tasks = [
-        t for t in base_tasks_to_filter if
-        t.get('account') in selected_accounts and
-        t.get('campaign') in selected_campaigns and
-        t.get('is_completed') in selected_statuses
-    ]
-    
-    user_filtered_tasks = filtered_tasks if is_admin else [t for t in filtered_tasks if t['owner_id'] == current_username]
+    st.markdown("#### Overdue")
+    if overdue.empty:
+        st.success("Nothing overdue.")
+    else:
+        report = overdue.groupby(dimension, observed=True)['day'].agg(['size', 'min']).rename(columns={'size': 'Overdue', 'min': 'Oldest'})
+        report = report.rename(index=label).sort_values('Overdue', ascending=False)
+        st.dataframe(report, use_container_width=True)
+
+def admin_archive_page():
+    st.title("🗄️ Archive")
+    after_days, stale_days = archive_policy()
+    st.caption(
+        f"Completed tasks not due or edited for {after_days} days, and open one-time tasks more than {stale_days} days past due, "
+        "move out of the active set automatically (settings archive_after_days / archive_stale_days, 0 turns a rule off). "
+        "Archived tasks stay searchable from the dashboard and can be restored."
+    )
+    last_result = get_archive_scheduler().last_result
+    if last_result:
+        finished_at, result = last_result
+        if isinstance(result, Exception):
+            st.warning(f"Last automatic run at {finished_at:%Y-%m-%d %H:%M} failed: {result}")
+        else:
+            st.caption(f"Last automatic run at {finished_at:%Y-%m-%d %H:%M} archived {result} task(s).")
+
+    cols = st.columns(2)
+    after_days = cols[0].number_input("Completed and idle for (days)", min_value=0, value=after_days)
+    stale_days = cols[1].number_input("One-time and past due for (days)", min_value=0, value=stale_days)
+    storage = get_storage()
+    if st.button("Find tasks to archive"):
+        st.session_state.archive_candidates = find_archive_candidates(storage, datetime.now().date(), after_days, stale_days)
+    candidates = st.session_state.get('archive_candidates')
+    if candidates is None:
+        return
+    st.metric("Tasks to archive", len(candidates))
+    if candidates:
+        with st.expander("Preview"):
+            st.dataframe([{'Title': t.title, 'Due': t.due_date, 'Type': t.type, 'Owner': get_user_name(t.owner_id), 'Done': t.is_completed}
+                          for t in candidates[:ARCHIVED_DISPLAY_LIMIT]], use_container_width=True, hide_index=True)
+        if st.button(f"Archive {len(candidates)} task(s) now", type="primary"):
+            moved = archive_tasks(storage, get_shared_cache(), [t.id for t in candidates],
+                                  actor=st.session_state.username, audit_log=get_audit_log(),
+                                  archivable=archive_rule(datetime.now().date(), after_days, stale_days), write_queue=get_write_queue())
+            del st.session_state.archive_candidates
+            st.success(f"Archived {moved} task(s).")
+
+AUDIT_DISPLAY_LIMIT = 500
+AUDIT_DEFAULT_DAYS = 7
+
+def admin_audit_page():
+    st.title("📜 Audit Log")
+    st.caption("Every task write, archive and restore, newest last. Rebuild task state at any point with `python audit_replay.py --until <timestamp>`.")
+    today = datetime.now(timezone.utc).date()
+    cols = st.columns(3)
+    date_range = cols[0].date_input("Days (UTC)", value=(today - timedelta(days=AUDIT_DEFAULT_DAYS), today))
+    task_filter = cols[1].text_input("Task id").strip()
+    actor_filter = cols[2].selectbox("By", ['Anyone', AUDIT_SYSTEM_ACTOR] + sorted(get_shared_cache().users))
+    if len(date_range) != 2:
+        return
+    start, end = date_range
+    get_audit_log().flush()
+    rows = []
+    for record in get_storage().read_audit_records(f"{start - timedelta(days=1)}T23:59:59.999999Z", f"{end}T23:59:59.999999Z"):
+        if (task_filter and record['task_id'] != task_filter) or (actor_filter != 'Anyone' and record['actor'] != actor_filter):
+            continue
+        changes = {**record.get('changes', {}), **dict.fromkeys(record.get('unset', ()), '(removed)')}
+        rows.append({'When': record['ts'], 'By': record['actor'], 'Action': record['op'], 'Task': record['task_id'],
+                     'Changes': ', '.join(f"{f}={v}" for f, v in changes.items() if f not in ('revision', 'updated_at'))})
+    st.metric("Records", len(rows))
+    if len(rows) > AUDIT_DISPLAY_LIMIT:
+        st.caption(f"Showing the latest {AUDIT_DISPLAY_LIMIT}.")
+    st.dataframe(rows[-AUDIT_DISPLAY_LIMIT:], use_container_width=True, hide_index=True)
 
-    tasks_with_next_date = [{'next_due_date': get_next_occurrence(t, today), **t} for t in user_filtered_tasks]
-    tasks_with_next_date = [t for t in tasks_with_next_date if t.get('next_due_date')]
+# --- VIEWS ---
+
+@timed('dashboard.build_sections')
+def build_dashboard_sections(tasks, today, sort_by):
+    """Sorts tasks by `sort_by` and splits them into (today, next 7 days, all) tuples of (task, next_due_date).
+
+    Pure: the result depends only on the arguments, which is what lets
+    query_dashboard memoize it.
+    """
+    # (task, next_due_date) pairs: the next date is a derived view, not a copy of the task
+    tasks_with_next_date = []
+    for task in tasks:
+        next_due_date = next_open_occurrence(task, today)
+        if next_due_date:
+            tasks_with_next_date.append((task, next_due_date))
 
     reverse_sort = False
     if sort_by == 'Due Date':
-        sort_key = lambda x: x['next_due_date']
+        sort_key = lambda x: x[1]
     elif sort_by == 'Priority':
-        sort_key = lambda x: PRIORITY_LEVELS.index(x.get('priority', 'Medium'))
+        sort_key = lambda x: PRIORITY_LEVELS.index(x[0].priority)
         reverse_sort = True
     else:
-        sort_key = lambda x: x['title']
+        sort_key = lambda x: x[0].title
         
     sorted_tasks = sorted(tasks_with_next_date, key=sort_key, reverse=reverse_sort)
 
-    tasks_today = [t for t in sorted_tasks if t['next_due_date'] == today]
-    tasks_upcoming = [t for t in sorted_tasks if today < t['next_due_date'] <= today + timedelta(days=7)]
+    # Next occurrences are never before today, so one pass splits out both sections.
+    tasks_today, tasks_upcoming = [], []
+    week_end = today + timedelta(days=7)
+    for pair in sorted_tasks:
+        if pair[1] == today:
+            tasks_today.append(pair)
+        elif pair[1] <= week_end:
+            tasks_upcoming.append(pair)
+    return tuple(tasks_today), tuple(tasks_upcoming), tuple(sorted_tasks)
 
-    def toggle_task_completion(task_id):
-        for task in st.session_state.tasks:
-            if task['id'] == task_id:
-                task['is_completed'] = not task['is_completed']
-                break
-        save_tasks_to_db(st.session_state.tasks)
-        st.rerun()
+def query_dashboard(owner_id, accounts, campaigns, statuses, sort_by, today, search=''):
+    """Filtered, searched, sorted and partitioned dashboard data, memoized per (task version, user, filters, search, sort, day).
+
+    Reruns that don't change any of those inputs - opening the edit form,
+    paging, switching views - reuse the previous result.
+    """
+    cache = get_shared_cache()
+    key = ('dashboard', owner_id, frozenset(accounts), frozenset(campaigns), frozenset(statuses), search, sort_by, today)
+
+    query = TaskQuery(owner_id=owner_id, accounts=accounts, campaigns=campaigns, completed=statuses)
+    cache.ensure_tasks_loaded(owner_id)
+
+    def compute():
+        return build_dashboard_sections(cache.query_tasks(query, search), today, sort_by)
+
+    return cache.get_derived(key, compute)
+
+def query_facets(owner_id, search):
+    """Facet counts for the tasks matching `search` in the user's scope, memoized like query_dashboard."""
+    cache = get_shared_cache()
+    return cache.get_derived(('facets', owner_id, search), lambda: cache.facet_counts(search, owner_id))
+
+def facet_summary(counts, label=str):
+    return " · ".join(f"{label(value)} ({n})" for value, n in sorted(counts.items(), key=lambda item: -item[1]) if n)
+
+@timed('render.dashboard')
+def dashboard_view():
+    st.subheader("Actionable Summary")
+    today = datetime.now().date()
+    current_username = st.session_state.username
+    is_admin = st.session_state.users[current_username]['role'] == 'admin'
+    owner_id = None if is_admin else current_username
+
+    search = st.text_input("🔎 Search tasks", placeholder="Words or beginnings of words in the title or description", key="task_search").strip()
+    facets = query_facets(owner_id, search)
+    if search:
+        st.caption(" | ".join(filter(None, [
+            facet_summary(facets['priority']), facet_summary(facets['type']),
+            facet_summary(facets['owner_id'], get_user_name) if is_admin else '',
+        ])))
+
+    with st.expander("🔍 Filter & Sort Tasks"):
+        filter_cols = st.columns(3)
+        # Counts stay out of the option labels: they change with every search and edit, and new labels would reset the selection
+        selected_accounts = filter_cols[0].multiselect("Accounts", st.session_state.categories.get('accounts', []), default=st.session_state.categories.get('accounts', []),
+                                                       key="filter_accounts")
+        selected_campaigns = filter_cols[1].multiselect("Campaigns", st.session_state.categories.get('campaigns', []), default=st.session_state.categories.get('campaigns', []),
+                                                        key="filter_campaigns")
+        selected_statuses_str = filter_cols[2].multiselect("Status", ['Incomplete', 'Completed'], default=['Incomplete', 'Completed'])
+        filter_cols[0].caption(facet_summary(facets['account']))
+        filter_cols[1].caption(facet_summary(facets['campaign']))
+        selected_statuses = [s == 'Completed' for s in selected_statuses_str]
+        
+        option_cols = st.columns(3)
+        sort_by = option_cols[0].selectbox("Sort By", ['Due Date', 'Title', 'Priority'])
+        page_size = option_cols[1].selectbox("Tasks per page", PAGE_SIZE_OPTIONS, index=PAGE_SIZE_OPTIONS.index(DEFAULT_PAGE_SIZE))
+        display_mode = option_cols[2].radio("All My Tasks as", ['Cards', 'Table'], horizontal=True)
+
+    tasks_today, tasks_upcoming, sorted_tasks = query_dashboard(
+        owner_id, selected_accounts, selected_campaigns, selected_statuses, sort_by, today, search
+    )
 
-    st.markdown("### 🎯 Today")
+    st.markdown(f"### 🎯 Today ({len(tasks_today)})")
     if tasks_today:
-        for i, task in enumerate(tasks_today):
-            task_card(task, task['next_due_date'], "Today", toggle_task_completion, index=i)
+        page, offset = paginate(tasks_today, "today", page_size)
+        for i, (task, next_due_date) in enumerate(page, start=offset):
+            task_card(task, next_due_date, "Today", toggle_task_completion, index=i)
     else:
         st.info("No tasks due today!")
 
     st.markdown("---")
-    st.markdown("### 🗓️ Upcoming (Next 7 Days)")
+    st.markdown(f"### 🗓️ Upcoming (Next 7 Days) ({len(tasks_upcoming)})")
     if tasks_upcoming:
-        for i, task in enumerate(tasks_upcoming):
-            task_card(task, task['next_due_date'], "Upcoming", toggle_task_completion, index=i)
+        page, offset = paginate(tasks_upcoming, "upcoming", page_size)
+        for i, (task, next_due_date) in enumerate(page, start=offset):
+            task_card(task, next_due_date, "Upcoming", toggle_task_completion, index=i)
     else:
         st.info("No upcoming tasks this week.")
 
-    # --- NEW: "All My Tasks" Section ---
     st.markdown("---")
-    st.markdown("### 📝 All My Tasks")
-    if sorted_tasks:
-        for i, task in enumerate(sorted_tasks):
-            # The "All My Tasks" view is non-actionable for completion, so the card will show delete/edit
-            task_card(task, task['next_due_date'], "All My Tasks", on_complete=toggle_task_completion, index=i)
-    else:
+    st.markdown(f"### 📝 All My Tasks ({len(sorted_tasks)})")
+    if not sorted_tasks:
         st.warning("No tasks match the current filters.")
+    elif display_mode == 'Table':
+        task_table(sorted_tasks)
+    else:
+        page, offset = paginate(sorted_tasks, "all", page_size)
+        for i, (task, next_due_date) in enumerate(page, start=offset):
+            # The "All My Tasks" view is non-actionable for completion, so the card will show delete/edit
+            task_card(task, next_due_date, "All My Tasks", on_complete=toggle_task_completion, index=i)
 
-
-def calendar_view():
-    st.subheader("Monthly Calendar")
+    st.markdown("---")
+    if st.toggle("🗄️ Show archived tasks", key="show_archived"):
+        archived_tasks_section(owner_id, selected_accounts, selected_campaigns, search)
+
+def query_archived(owner_id, accounts, campaigns, search):
+    """Archived tasks for the dashboard filters, read from the archive tier on demand and memoized per task version.
+    Without a search storage returns only the ARCHIVED_DISPLAY_LIMIT most recent by due date."""
+    cache = get_shared_cache()
+    query = TaskQuery(owner_id=owner_id, accounts=accounts, campaigns=campaigns)
+    key = ('archived', owner_id, frozenset(accounts), frozenset(campaigns))
+    if not search:
+        recent = query._replace(order_by='due_date', descending=True, limit=ARCHIVED_DISPLAY_LIMIT)
+        return cache.get_derived(key, lambda: get_storage().query_archived_tasks(recent))
+    # Searching needs the text index over every archived match; it's built once per version, not per keystroke
+    store = cache.get_derived(key + ('search',), lambda: TaskStore(get_storage().query_archived_tasks(query)))
+    return store.select(search)
+
+def archived_tasks_section(owner_id, accounts, campaigns, search):
     current_username = st.session_state.username
     is_admin = st.session_state.users[current_username]['role'] == 'admin'
+    archived = query_archived(owner_id, accounts, campaigns, search)
+    if not archived:
+        st.info("No archived tasks match the current filters.")
+        return
+    if not search and len(archived) == ARCHIVED_DISPLAY_LIMIT:
+        st.caption(f"Showing the {ARCHIVED_DISPLAY_LIMIT} most recent; search to find older ones.")
+    rows = [{
+        'Title': t.title, 'Due': t.due_date, 'Type': t.type, 'Priority': t.priority,
+        'Account': t.account or 'N/A', 'Campaign': t.campaign or 'N/A',
+        'Owner': get_user_name(t.owner_id), 'Done': t.is_completed,
+    } for t in archived]
+    event = st.dataframe(rows, use_container_width=True, hide_index=True, on_select="rerun", selection_mode="multi-row", key="archived_table")
+    restorable = [archived[i] for i in event.selection.rows if is_admin or archived[i].owner_id == current_username]
+    if st.button(f"Restore ({len(restorable)})", key="restore_archived", disabled=not restorable):
+        restored = restore_tasks(get_storage(), get_shared_cache(), restorable,
+                                 actor=current_username, audit_log=get_audit_log())
+        st.toast(f"Restored {restored} task(s).")
+        st.rerun()
 
-    view_filter = 'My Tasks'
-    if is_admin:
-        view_filter = st.radio("Calendar View", ('All Team Tasks', 'My Tasks'), horizontal=True, key='cal_view_filter')
-    
-    tasks_to_check = st.session_state.tasks if view_filter == 'All Team Tasks' else [t for t in st.session_state.tasks if t['owner_id'] == current_username]
 
+def get_calendar_occurrences(first_day, last_day, owner_id=None):
+    """Date -> due tasks for a calendar grid, cached per (grid window, owner filter, task version)."""
+    cache = get_shared_cache()
+    cache.ensure_tasks_loaded(owner_id)
+
+    def compute():
+        # Tasks starting after the grid can't occur on it
+        tasks = cache.query_tasks(TaskQuery(owner_id=owner_id, due_until=last_day))
+        return build_occurrence_index(tasks, first_day, last_day + timedelta(days=1))
+
+    return cache.get_derived(('calendar', first_day, last_day, owner_id), compute)
+
+# The grid is one HTML block styled by classes: every value that varies is escaped into a template.
+CALENDAR_TASKS_PER_DAY = 2
+CALENDAR_DAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+CALENDAR_CSS = "<style>" + "".join([
+    ".tf-cal{display:grid;grid-template-columns:repeat(7,minmax(0,1fr));gap:6px;}",
+    ".tf-cal-head{text-align:center;font-weight:bold;}",
+    ".tf-day{padding:10px;height:120px;border-radius:5px;background:white;overflow:hidden;}",
+    ".tf-day.tf-other{background:#f8fafc;}.tf-day.tf-other .tf-num{color:#9ca3af;}",
+    ".tf-day.tf-today{background:#e0f2fe;}.tf-day.tf-selected{outline:2px solid #3b82f6;}",
+    ".tf-num{font-weight:bold;color:black;}",
+    ".tf-task{font-size:0.8em;color:white;background:#6b7280;border-radius:3px;padding:2px 4px;margin-top:5px;"
+    "white-space:nowrap;overflow:hidden;text-overflow:ellipsis;}",
+    ".tf-task.tf-done{opacity:0.55;text-decoration:line-through;}",
+    ".tf-more{font-size:0.7em;text-align:center;margin-top:5px;}",
+] + [f".tf-task.tf-{level.lower()}{{background:{color};}}" for level, color in PRIORITY_COLORS.items()]) + "</style>"
+CALENDAR_DAY_TEMPLATE = '<div class="tf-day{classes}"><div class="tf-num">{day}</div>{tasks}</div>'
+CALENDAR_TASK_TEMPLATE = '<div class="tf-task{classes}" title="{tooltip}">{mark}{title}</div>'
+CALENDAR_MORE_TEMPLATE = '<div class="tf-more">+ {count} more</div>'
+
+def render_calendar_html(month_days, month, today, occurrences, owner_initials, selected_day=None):
+    """The whole month grid as one HTML string, from the occurrence index. Pure, so it can be memoized."""
+    cells = [f'<div class="tf-cal-head">{name}</div>' for name in CALENDAR_DAY_NAMES]
+    for week in month_days:
+        for day_date in week:
+            tasks_due = occurrences.get(day_date, [])
+            task_html = []
+            for task in tasks_due[:CALENDAR_TASKS_PER_DAY]:
+                done = is_occurrence_completed(task, day_date)
+                classes = (f" tf-{task.priority.lower()}" if task.priority in PRIORITY_COLORS else "") + (" tf-done" if done else "")
+                task_html.append(CALENDAR_TASK_TEMPLATE.format(
+                    classes=classes, mark='✓ ' if done else '', title=html.escape(task.title or ''),
+                    tooltip=html.escape(f"{task.title} ({owner_initials.get(task.owner_id, 'U')})"),
+                ))
+            if len(tasks_due) > CALENDAR_TASKS_PER_DAY:
+                task_html.append(CALENDAR_MORE_TEMPLATE.format(count=len(tasks_due) - CALENDAR_TASKS_PER_DAY))
+            classes = "".join([
+                " tf-other" if day_date.month != month else "",
+                " tf-today" if day_date == today else "",
+                " tf-selected" if day_date == selected_day else "",
+            ])
+            cells.append(CALENDAR_DAY_TEMPLATE.format(classes=classes, day=day_date.day, tasks="".join(task_html)))
+    return f'{CALENDAR_CSS}<div class="tf-cal">{"".join(cells)}</div>'
+
+def get_calendar_html(month_days, month, owner_id, today, selected_day):
+    """The rendered grid, memoized per (month, owner filter, selected day, task version) so an unchanged
+    month is neither rebuilt nor, since the markup is identical, redrawn by the browser."""
+    cache = get_shared_cache()
+    owner_initials = {username: user_data['name'][0] for username, user_data in cache.users.items()}
+    key = ('calendar_html', month_days[0][0], month, owner_id, today, selected_day, tuple(sorted(owner_initials.items())))
+
+    def compute():
+        occurrences = get_calendar_occurrences(month_days[0][0], month_days[-1][-1], owner_id)
+        return render_calendar_html(month_days, month, today, occurrences, owner_initials, selected_day)
+
+    return cache.get_derived(key, compute)
+
+def shift_calendar_month(months):
+    first = st.session_state.calendar_date.replace(day=1)
+    if months < 0:
+        st.session_state.calendar_date = (first - timedelta(days=1)).replace(day=1)
+    else:
+        st.session_state.calendar_date = (first + timedelta(days=32)).replace(day=1)
+
+@st.fragment
+@timed('render.calendar_month')
+def calendar_month(owner_id):
+    """Month navigation, grid and day details. A fragment: switching months or ticking off a task reruns only this."""
+    today = datetime.now().date()
     if 'calendar_date' not in st.session_state:
-        st.session_state.calendar_date = datetime.now().date()
+        st.session_state.calendar_date = today
+    shown = st.session_state.calendar_date
 
     col1, col2, col3 = st.columns([1, 2, 1])
-    with col1:
-        if st.button("← Previous Month"):
-            st.session_state.calendar_date = (st.session_state.calendar_date.replace(day=1) - timedelta(days=1)).replace(day=1)
-            st.rerun()
-    with col2:
-        st.markdown(f"<h3 style='text-align: center;'>{st.session_state.calendar_date.strftime('%B %Y')}</h3>", unsafe_allow_html=True)
-    with col3:
-        if st.button("Next Month →"):
-            st.session_state.calendar_date = (st.session_state.calendar_date.replace(day=28) + timedelta(days=4)).replace(day=1)
-            st.rerun()
-            
+    col1.button("← Previous Month", on_click=shift_calendar_month, args=(-1,))
+    col2.markdown(f"<h3 style='text-align: center;'>{shown.strftime('%B %Y')}</h3>", unsafe_allow_html=True)
+    col3.button("Next Month →", on_click=shift_calendar_month, args=(1,))
     st.markdown("---")
 
-    cal = calendar.Calendar(firstweekday=calendar.MONDAY)
-    month_days = cal.monthdatescalendar(st.session_state.calendar_date.year, st.session_state.calendar_date.month)
-    days_names = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-    
-    cols = st.columns(7)
-    for i, day_name in enumerate(days_names):
-        cols[i].markdown(f"**<div style='text-align:center;'>{day_name}</div>**", unsafe_allow_html=True)
-
-    for week in month_days:
-        cols = st.columns(7)
-        for i, day_date in enumerate(week):
-            tasks_due = [t for t in tasks_to_check if is_task_due(t, day_date)]
-            
-            is_current_month = day_date.month == st.session_state.calendar_date.month
-            is_today = day_date == datetime.now().date()
-            
-            day_html = f"<div style='padding: 10px; height: 120px; border-radius: 5px; background-color: {'#e0f2fe' if is_today else ('#f8fafc' if not is_current_month else 'white')};'>"
-            day_html += f"<div style='font-weight: bold; color: {'#9ca3af' if not is_current_month else 'black'};'>{day_date.day}</div>"
-
-            for task in tasks_due[:2]: # Show max 2 tasks
-                owner_initials = get_user_name(task['owner_id'])[0]
-                task_color = PRIORITY_COLORS.get(task.get('priority', 'Medium'))
-                day_html += f"<div style='font-size: 0.8em; background-color: {task_color}; color: white; border-radius: 3px; padding: 2px 4px; margin-top: 5px; white-space: nowrap; overflow: hidden; text-overflow: ellipsis;' title='{task['title']} ({owner_initials})'>{task['title']}</div>"
-            
-            if len(tasks_due) > 2:
-                day_html += f"<div style='font-size: 0.7em; text-align: center; margin-top: 5px;'>+ {len(tasks_due) - 2} more</div>"
+    month_days = calendar.Calendar(firstweekday=calendar.MONDAY).monthdatescalendar(shown.year, shown.month)
+    selected_day = st.session_state.get('calendar_selected_day')
+    if selected_day is None or not month_days[0][0] <= selected_day <= month_days[-1][-1]:
+        selected_day = today if month_days[0][0] <= today <= month_days[-1][-1] else shown.replace(day=1)
+        st.session_state.calendar_selected_day = selected_day
+    st.markdown(get_calendar_html(month_days, shown.month, owner_id, today, selected_day), unsafe_allow_html=True)
+
+    st.date_input("Day", key='calendar_selected_day', min_value=month_days[0][0], max_value=month_days[-1][-1], format="YYYY-MM-DD")
+    tasks_due = get_calendar_occurrences(month_days[0][0], month_days[-1][-1], owner_id).get(selected_day, [])
+    if not tasks_due:
+        st.caption("Nothing due on this day.")
+    current_username = st.session_state.username
+    is_admin = st.session_state.users[current_username]['role'] == 'admin'
+    for task in tasks_due:
+        done_col, title_col, edit_col = st.columns([0.1, 0.75, 0.15])
+        done_col.checkbox("Done", value=is_occurrence_completed(task, selected_day), key=f"cal_done_{task.id}_{selected_day}",
+                          label_visibility="collapsed", disabled=task.owner_id != current_username,
+                          on_change=toggle_task_completion, args=(task.id, selected_day))
+        title_col.text(f"{task.title} · {task.priority} · {get_user_name(task.owner_id)}")
+        if (is_admin or task.owner_id == current_username) and edit_col.button("Edit", key=f"cal_edit_{task.id}_{selected_day}"):
+            st.session_state.editing_task_id = task.id
+            st.session_state.edit_form_key += 1
+            st.rerun()  # The edit form lives outside this fragment, so the whole app reruns
+
+@timed('render.calendar')
+def calendar_view():
+    st.subheader("Monthly Calendar")
+    current_username = st.session_state.username
+    is_admin = st.session_state.users[current_username]['role'] == 'admin'
 
-            day_html += "</div>"
-            cols[i].markdown(day_html, unsafe_allow_html=True)
+    view_filter = 'My Tasks'
+    if is_admin:
+        view_filter = st.radio("Calendar View", ('All Team Tasks', 'My Tasks'), horizontal=True, key='cal_view_filter')
+    calendar_month(None if view_filter == 'All Team Tasks' else current_username)
 
 # --- MAIN APP ---
 
 def main_app_content(name, username):
     st.title("TaskFlow Manager")
-    initialize_data()
     current_user = st.session_state.users[username]
+    owner_scope = None if current_user['role'] == 'admin' else username
+    # On first paint the page outline is sent before the bootstrap reads, then replaced once they land
+    skeleton = st.empty()
+    if not get_shared_cache().has_tasks_for(owner_scope):
+        with skeleton.container():
+            dashboard_skeleton()
+    initialize_data(owner_scope)
+    skeleton.empty()
+    write_conflicts_panel()
     
     with st.sidebar:
         st.header("Navigation")
         view_options = ['Dashboard', 'Calendar']
         if current_user['role'] == 'admin':
-            view_options.append('User Management')
+            view_options += ['User Management', 'Analytics', 'Archive', 'Audit Log', 'Import / Export', 'Performance']
         
         if 'view' not in st.session_state:
             st.session_state.view = 'Dashboard'
@@ -586,6 +3582,7 @@ def main_app_content(name, username):
         st.radio("Select View", view_options, key='view_selection', on_change=set_view, index=view_options.index(st.session_state.view))
         
         st.info(f"User: **{name}** ({current_user['role']})")
+        sync_status_indicator()
         st.button("Logout", on_click=logout)
 
     if st.session_state.view in ['Dashboard', 'Calendar']:
@@ -603,27 +3600,38 @@ def main_app_content(name, username):
         calendar_view()
     elif st.session_state.view == 'User Management' and current_user['role'] == 'admin':
         admin_user_control_page()
+    elif st.session_state.view == 'Analytics' and current_user['role'] == 'admin':
+        admin_analytics_page()
+    elif st.session_state.view == 'Archive' and current_user['role'] == 'admin':
+        admin_archive_page()
+    elif st.session_state.view == 'Audit Log' and current_user['role'] == 'admin':
+        admin_audit_page()
+    elif st.session_state.view == 'Import / Export' and current_user['role'] == 'admin':
+        admin_import_export_page()
+    elif st.session_state.view == 'Performance' and current_user['role'] == 'admin':
+        admin_performance_page()
 
 def main():
     st.set_page_config(layout="wide", page_title="TaskFlow Manager")
-    if 'login_status' not in st.session_state:
-        st.session_state.login_status = False
-        st.session_state.users = {} # Start with empty users before loading
-
-    if st.session_state.login_status and st.session_state.username in st.session_state.users:
-        main_app_content(st.session_state.name, st.session_state.username)
-    else:
-        st.title("Welcome to TaskFlow Manager")
-        with st.sidebar.form("login_form"):
-            st.subheader("Login")
-            email = st.text_input("Email")
-            pin = st.text_input("PIN", type="password")
-            if st.form_submit_button("Sign In", type="primary"):
-                if email and pin:
-                    load_users_from_db()
-                    authenticate_user(email, pin)
-                else:
-                    st.error("Please enter email and PIN.")
+    with get_metrics().rerun(st.session_state.get('username')):
+        if 'login_status' not in st.session_state:
+            st.session_state.login_status = False
+            st.session_state.users = {} # Start with empty users before loading
+        show_storage_notices()
+
+        if st.session_state.login_status and st.session_state.username in st.session_state.users:
+            main_app_content(st.session_state.name, st.session_state.username)
+        else:
+            st.title("Welcome to TaskFlow Manager")
+            with st.sidebar.form("login_form"):
+                st.subheader("Login")
+                email = st.text_input("Email")
+                pin = st.text_input("PIN", type="password")
+                if st.form_submit_button("Sign In", type="primary"):
+                    if email and pin:
+                        authenticate_user(email, pin)
+                    else:
+                        st.error("Please enter email and PIN.")
 
 if __name__ == "__main__":
     main()